@@ -1,10 +1,10 @@
 # LLM.py
 from google import genai
 from openai import OpenAI
-import json
 import re
 from typing import Dict, List, Optional, Tuple
 from llm_config import load_llm_config, get_provider_config
+import serializer
 
 class LLMCHAT:
     def __init__(
@@ -113,7 +113,24 @@ class LLMManager:
         self.config = load_llm_config()
         self.llm = LLMCHAT(model=self.config.get("selected_model", "kimi-k2-turbo-preview"))
         self.current_model = self.config.get("selected_model", "kimi-k2-turbo-preview")
-        
+
+    def derive(self, llm=None, model: Optional[str] = None, temperature: Optional[float] = None) -> "LLMManager":
+        """
+        派生一个共用配置的管理器，不重新读取配置、不写回配置文件。
+
+        未指定模型与温度时直接使用 llm（默认 self.llm），不新建客户端；否则按指定的模型与温度新建客户端。
+        """
+        manager = LLMManager.__new__(LLMManager)
+        manager.config = self.config
+        manager.current_model = model or self.current_model
+        if model is None and temperature is None:
+            manager.llm = llm if llm is not None else self.llm
+        else:
+            manager.llm = LLMCHAT(model=manager.current_model)
+            if temperature is not None:
+                manager.llm.temperature = temperature
+        return manager
+
     def change_model(self, model: str):
         """切换LLM模型"""
         self.current_model = model
@@ -176,7 +193,7 @@ class LLMManager:
             # 提取JSON部分
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
-                return json.loads(json_match.group())
+                return serializer.loads(json_match.group())
         except Exception as e:
             print(f"生成故事大纲失败: {e}")
         
@@ -236,7 +253,7 @@ class LLMManager:
             response = self.llm.chat(prompt)
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
-                return json.loads(json_match.group())
+                return serializer.loads(json_match.group())
         except Exception as e:
             print(f"生成智能体动作失败: {e}")
         
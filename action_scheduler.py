@@ -0,0 +1,143 @@
+# action_scheduler.py
+import heapq
+import itertools
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 模拟时间单位下的动作耗时
+MOVE_SPEED = 100.0          # 每单位时间移动的像素距离
+MIN_DURATION = 0.1          # 任何动作的最短耗时，避免零时长事件
+TALK_BASE_DURATION = 1.0
+TALK_DURATION_PER_CHAR = 0.05
+ACTION_DURATIONS = {
+    "rest": 3.0,
+    "investigate": 2.0,
+    "interact": 1.5
+}
+DEFAULT_DURATION = 1.0
+
+# 事件类型
+_COMPLETE = 0
+_WAKE = 1
+
+
+def travel_distance(start: Dict, waypoints: Sequence[Dict]) -> float:
+    """沿路点依次行走的总距离"""
+    total = 0.0
+    x, y = start["x"], start["y"]
+    for waypoint in waypoints:
+        total += math.hypot(waypoint["x"] - x, waypoint["y"] - y)
+        x, y = waypoint["x"], waypoint["y"]
+    return total
+
+
+def estimate_duration(action: Dict, position: Dict, route: Optional[List[Dict]] = None) -> float:
+    """
+    估算动作耗时。
+
+    move 按行进距离/速度计算（跨房间时传入路线路点），talk 按台词长度计算，其余按动作类型取固定值。
+    """
+    action_type = action.get("action_type", "move")
+    if action_type == "move":
+        destination = action.get("destination") or {}
+        waypoints = route or [{
+            "x": destination.get("x", position["x"]),
+            "y": destination.get("y", position["y"])
+        }]
+        duration = travel_distance(position, waypoints) / MOVE_SPEED
+    elif action_type == "talk":
+        duration = TALK_BASE_DURATION + len(action.get("dialogue") or "") * TALK_DURATION_PER_CHAR
+    else:
+        duration = ACTION_DURATIONS.get(action_type, DEFAULT_DURATION)
+    return max(MIN_DURATION, duration)
+
+
+class ActionScheduler:
+    """
+    基于优先队列的离散事件调度器。
+
+    每个动作占用其涉及的所有智能体（执行者与对话/互动对象），同一智能体上的动作按计划顺序串行，
+    互不冲突的动作在同一模拟时刻并行开始；时钟直接跳到下一个事件，空闲时间不逐格推进。
+    """
+
+    def __init__(self):
+        self.clock = 0.0
+        self.busy_until: Dict[int, float] = {}
+        self._events: List[Tuple[float, int, int, object]] = []
+        self._seq = itertools.count()
+
+    def reset(self):
+        self.clock = 0.0
+        self.busy_until.clear()
+        self._events.clear()
+
+    def _push(self, time: float, kind: int, payload=None):
+        heapq.heappush(self._events, (time, next(self._seq), kind, payload))
+
+    def run(
+            self,
+            actions: List[Tuple[int, Dict, Tuple[int, ...]]],
+            duration_fn: Callable[[Dict], float],
+            execute_fn: Callable[[int, Dict], Dict],
+            cooldown_fn: Callable[[int], float]
+    ) -> List[Dict]:
+        """
+        在模拟时间中执行一组动作直到全部完成。
+
+        actions: [(计划下标, 动作, 涉及的智能体ID元组)]，按计划顺序给出
+        duration_fn(action) -> 耗时，在动作开始时调用（此时位置已反映之前的动作）
+        execute_fn(计划下标, action) -> 执行结果，在动作完成时调用
+        cooldown_fn(agent_id) -> 执行者完成动作后需要的冷却时间
+        返回按完成时间排序的执行结果，每项附带 start_time/end_time。
+        """
+        # 每个智能体的待执行动作队列（存计划中的位置），动作需位于所有涉及者队首才能开始
+        queues: Dict[int, List[int]] = {}
+        for position, (_, _, participants) in enumerate(actions):
+            for agent_id in participants:
+                queues.setdefault(agent_id, []).append(position)
+
+        started = [False] * len(actions)
+        start_times = [0.0] * len(actions)
+        results: List[Dict] = []
+        remaining = len(actions)
+
+        self._start_ready(actions, queues, started, start_times, duration_fn)
+        while remaining and self._events:
+            time, _, kind, payload = heapq.heappop(self._events)
+            self.clock = max(self.clock, time)
+            if kind == _COMPLETE:
+                position = payload
+                plan_index, action, participants = actions[position]
+                result = execute_fn(plan_index, action)
+                result["start_time"] = round(start_times[position], 3)
+                result["end_time"] = round(self.clock, 3)
+                results.append(result)
+                remaining -= 1
+
+                actor = participants[0]
+                for agent_id in participants:
+                    queues[agent_id].pop(0)
+                    self.busy_until[agent_id] = self.clock
+                self.busy_until[actor] = self.clock + max(0.0, cooldown_fn(actor))
+            self._start_ready(actions, queues, started, start_times, duration_fn)
+
+        # 剩余的只可能是冗余的唤醒事件
+        self._events.clear()
+        return results
+
+    def _start_ready(self, actions, queues, started, start_times, duration_fn):
+        """启动当前时刻所有就绪的动作；因冷却尚未就绪的智能体登记唤醒事件"""
+        for position, (_, action, participants) in enumerate(actions):
+            if started[position]:
+                continue
+            if any(queues[agent_id][0] != position for agent_id in participants):
+                continue
+            ready_at = max(self.busy_until.get(agent_id, 0.0) for agent_id in participants)
+            if ready_at > self.clock:
+                self._push(ready_at, _WAKE)
+                continue
+            started[position] = True
+            start_times[position] = self.clock
+            for agent_id in participants:
+                self.busy_until[agent_id] = math.inf
+            self._push(self.clock + duration_fn(action), _COMPLETE, position)
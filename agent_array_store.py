@@ -0,0 +1,258 @@
+# agent_array_store.py
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from agent_state_manager import AgentState
+
+# 常用心情的固定编码，其余心情在首次出现时追加
+DEFAULT_MOODS = ["neutral", "happy", "frustrated"]
+
+# 与 AgentStateManager._is_position_in_room 保持一致的房间默认尺寸
+DEFAULT_ROOM_WIDTH = 100
+DEFAULT_ROOM_HEIGHT = 100
+
+
+def _to_py(value):
+    """把numpy标量转换为Python数值，整数值保持为int以兼容原有输出"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class AgentArrayStore:
+    """以结构数组(SoA)形式保存所有智能体的数值状态，支持向量化批量更新"""
+
+    def __init__(self, capacity: int = 16):
+        capacity = max(1, capacity)
+        self.size = 0
+        self.positions = np.zeros((capacity, 2), dtype=np.float64)
+        self.energy = np.zeros(capacity, dtype=np.float64)
+        self.health = np.zeros(capacity, dtype=np.float64)
+        self.mood_codes = np.zeros(capacity, dtype=np.int16)
+        self.room_indices = np.full(capacity, -1, dtype=np.int32)
+
+        self.moods: List[str] = list(DEFAULT_MOODS)
+        self._mood_lookup = {mood: i for i, mood in enumerate(self.moods)}
+
+        self.room_ids: List[str] = []
+        self._room_lookup: Dict[str, int] = {}
+        # 每行: x, y, width, height
+        self.room_bounds = np.zeros((0, 4), dtype=np.float64)
+
+    # --- 分配与编码 ---
+    def allocate(self) -> int:
+        """为新智能体分配一行，返回行号"""
+        if self.size >= len(self.energy):
+            self._grow(len(self.energy) * 2)
+        index = self.size
+        self.size += 1
+        return index
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self.energy)
+        self.positions = np.vstack([self.positions, np.zeros((extra, 2), dtype=np.float64)])
+        self.energy = np.concatenate([self.energy, np.zeros(extra, dtype=np.float64)])
+        self.health = np.concatenate([self.health, np.zeros(extra, dtype=np.float64)])
+        self.mood_codes = np.concatenate([self.mood_codes, np.zeros(extra, dtype=np.int16)])
+        self.room_indices = np.concatenate([self.room_indices, np.full(extra, -1, dtype=np.int32)])
+
+    def set_rooms(self, rooms: List[Dict]):
+        """登记场景中的房间及其边界，用于批量的房间包含测试"""
+        self.room_ids = [room.get("id") for room in rooms]
+        self._room_lookup = {room_id: i for i, room_id in enumerate(self.room_ids)}
+        self.room_bounds = np.array([
+            [
+                room.get("x", 0),
+                room.get("y", 0),
+                room.get("width", DEFAULT_ROOM_WIDTH),
+                room.get("height", DEFAULT_ROOM_HEIGHT)
+            ]
+            for room in rooms
+        ], dtype=np.float64).reshape(-1, 4)
+
+    def encode_mood(self, mood: str) -> int:
+        code = self._mood_lookup.get(mood)
+        if code is None:
+            code = len(self.moods)
+            self.moods.append(mood)
+            self._mood_lookup[mood] = code
+        return code
+
+    def decode_mood(self, code: int) -> str:
+        return self.moods[code]
+
+    def encode_room(self, room_id: Optional[str]) -> int:
+        if room_id is None:
+            return -1
+        index = self._room_lookup.get(room_id)
+        if index is None:
+            # 未登记的房间只记录ID，没有边界信息
+            index = len(self.room_ids)
+            self.room_ids.append(room_id)
+            self._room_lookup[room_id] = index
+            self.room_bounds = np.vstack([self.room_bounds, np.full((1, 4), np.nan)])
+        return index
+
+    def decode_room(self, index: int) -> Optional[str]:
+        return self.room_ids[index] if index >= 0 else None
+
+    # --- 批量操作 ---
+    def _select(self, indices: Optional[Iterable[int]]):
+        if indices is None:
+            return slice(0, self.size)
+        return np.fromiter(indices, dtype=np.intp)
+
+    def apply_energy_delta(self, delta: float, indices: Optional[Iterable[int]] = None,
+                           low: float = 0, high: float = 100):
+        """对一批智能体的能量加上delta并裁剪到[low, high]"""
+        rows = self._select(indices)
+        self.energy[rows] = np.clip(self.energy[rows] + delta, low, high)
+
+    def decay_energy(self, amount: float = 5, indices: Optional[Iterable[int]] = None):
+        """批量消耗能量（与移动/调查的能量消耗一致）"""
+        self.apply_energy_delta(-amount, indices)
+
+    def rest(self, amount: float = 10, indices: Optional[Iterable[int]] = None):
+        """批量休息恢复能量"""
+        self.apply_energy_delta(amount, indices)
+
+    def set_moods(self, mood: str, indices: Optional[Iterable[int]] = None):
+        self.mood_codes[self._select(indices)] = self.encode_mood(mood)
+
+    def containment_matrix(self) -> np.ndarray:
+        """返回 (智能体数, 房间数) 的布尔矩阵，表示每个位置是否落在各房间内"""
+        pos = self.positions[:self.size]
+        x, y = pos[:, 0:1], pos[:, 1:2]
+        rx, ry = self.room_bounds[:, 0], self.room_bounds[:, 1]
+        rw, rh = self.room_bounds[:, 2], self.room_bounds[:, 3]
+        return (rx <= x) & (x <= rx + rw) & (ry <= y) & (y <= ry + rh)
+
+    def in_current_room_mask(self) -> np.ndarray:
+        """每个智能体的位置是否仍在其当前房间内（无房间的视为False）"""
+        rooms = self.room_indices[:self.size]
+        mask = np.zeros(self.size, dtype=bool)
+        if not len(self.room_ids):
+            return mask
+        has_room = rooms >= 0
+        matrix = self.containment_matrix()
+        mask[has_room] = matrix[np.nonzero(has_room)[0], rooms[has_room]]
+        return mask
+
+    def outside_current_room_mask(self) -> np.ndarray:
+        """每个智能体是否已离开其当前房间；无房间或房间边界未知(NaN)的不算离开"""
+        rooms = self.room_indices[:self.size]
+        mask = np.zeros(self.size, dtype=bool)
+        if not len(self.room_ids):
+            return mask
+        known = ~np.isnan(self.room_bounds).any(axis=1)
+        rows = np.nonzero(rooms >= 0)[0]
+        rows = rows[known[rooms[rows]]]
+        mask[rows] = ~self.containment_matrix()[rows, rooms[rows]]
+        return mask
+
+    def locate_rooms(self) -> np.ndarray:
+        """根据坐标推断每个智能体所在的房间下标，不在任何房间内为-1"""
+        if not len(self.room_ids):
+            return np.full(self.size, -1, dtype=np.int32)
+        matrix = self.containment_matrix()
+        located = np.argmax(matrix, axis=1).astype(np.int32)
+        located[~matrix.any(axis=1)] = -1
+        return located
+
+    def distances_to(self, x: float, y: float) -> np.ndarray:
+        """所有智能体到某一点的欧氏距离"""
+        delta = self.positions[:self.size] - np.array([x, y], dtype=np.float64)
+        return np.hypot(delta[:, 0], delta[:, 1])
+
+    def pairwise_distances(self) -> np.ndarray:
+        """智能体两两之间的距离矩阵"""
+        pos = self.positions[:self.size]
+        delta = pos[:, None, :] - pos[None, :, :]
+        return np.hypot(delta[..., 0], delta[..., 1])
+
+    def indices_within(self, x: float, y: float, radius: float) -> List[int]:
+        """距离某点不超过radius的智能体行号"""
+        return np.nonzero(self.distances_to(x, y) <= radius)[0].tolist()
+
+
+class PositionView(MutableMapping):
+    """把store中的一行坐标伪装成原来的 {"x", "y"} 字典"""
+    _AXES = {"x": 0, "y": 1}
+
+    def __init__(self, store: AgentArrayStore, index: int):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        return _to_py(self._store.positions[self._index, self._AXES[key]])
+
+    def __setitem__(self, key, value):
+        self._store.positions[self._index, self._AXES[key]] = value
+
+    def __delitem__(self, key):
+        raise TypeError("位置字段不可删除")
+
+    def __iter__(self):
+        return iter(self._AXES)
+
+    def __len__(self):
+        return len(self._AXES)
+
+    def copy(self) -> Dict:
+        return {"x": self["x"], "y": self["y"]}
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class ArrayAgentState(AgentState):
+    """数值状态由AgentArrayStore承载的AgentState，对外接口与原类一致"""
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: AgentArrayStore, agent_id: int, name: str, personality: List[str], goal: str):
+        self._store = store
+        self._row = store.allocate()
+        super().__init__(agent_id, name, personality, goal)
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def position(self) -> PositionView:
+        return PositionView(self._store, self._row)
+
+    @position.setter
+    def position(self, value: Dict):
+        self._store.positions[self._row] = (value["x"], value["y"])
+
+    @property
+    def energy(self):
+        return _to_py(self._store.energy[self._row])
+
+    @energy.setter
+    def energy(self, value):
+        self._store.energy[self._row] = value
+
+    @property
+    def health(self):
+        return _to_py(self._store.health[self._row])
+
+    @health.setter
+    def health(self, value):
+        self._store.health[self._row] = value
+
+    @property
+    def mood(self) -> str:
+        return self._store.decode_mood(self._store.mood_codes[self._row])
+
+    @mood.setter
+    def mood(self, value: str):
+        self._store.mood_codes[self._row] = self._store.encode_mood(value)
+
+    @property
+    def current_room(self) -> Optional[str]:
+        return self._store.decode_room(self._store.room_indices[self._row])
+
+    @current_room.setter
+    def current_room(self, value: Optional[str]):
+        self._store.room_indices[self._row] = self._store.encode_room(value)
@@ -1,11 +1,73 @@
 # agent_state_manager.py
-import json
 import random
 import re
+import sys
 from typing import Dict, List, Tuple, Optional
 from LLM import LLMManager
+from navigation import RoomGraph, get_room_graph
+from action_scheduler import ActionScheduler, estimate_duration
+import serializer
+
+# 高频记忆使用模板+参数保存，避免每步都生成新的长字符串
+MOVE_MEMORY_TEMPLATE = sys.intern("move: 移动到 ({}, {})")
+INVESTIGATE_MEMORY_TEMPLATE = sys.intern("调查了{}")
+
+class MemoryRecord:
+    """紧凑的记忆条目：模板字符串被驻留复用，参数在读取时再格式化"""
+    __slots__ = ("template", "args", "timestamp", "importance")
+
+    def __init__(self, template: str, args: Tuple = (), timestamp: int = 0, importance: float = 1.0):
+        self.template = sys.intern(template)
+        self.args = args
+        self.timestamp = timestamp
+        self.importance = importance
+
+    @property
+    def content(self) -> str:
+        return self.template.format(*self.args) if self.args else self.template
+
+    def to_dict(self) -> Dict:
+        return {
+            "content": self.content,
+            "timestamp": self.timestamp,
+            "importance": self.importance
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MemoryRecord":
+        return cls(data.get("content", ""), (), data.get("timestamp", 0), data.get("importance", 1.0))
+
+    def to_state(self) -> List:
+        """保留模板与参数的紧凑形式，用于检查点"""
+        return [self.template, list(self.args), self.timestamp, self.importance]
+
+    @classmethod
+    def from_state(cls, state: List) -> "MemoryRecord":
+        template, args, timestamp, importance = state
+        return cls(template, tuple(args), timestamp, importance)
+
+    # 兼容旧的字典式访问 memory["content"]
+    def __getitem__(self, key: str):
+        if key not in ("content", "timestamp", "importance"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return repr(self.to_dict())
 
 class AgentState:
+    __slots__ = (
+        "id", "name", "personality", "goal", "current_room", "position", "health", "energy",
+        "mood", "inventory", "relationships", "memory", "current_action", "action_cooldown", "knowledge",
+        "route"
+    )
+
     def __init__(self, agent_id: int, name: str, personality: List[str], goal: str):
         self.id = agent_id
         self.name = name
@@ -22,6 +84,7 @@ class AgentState:
         self.current_action = None
         self.action_cooldown = 0
         self.knowledge = {}
+        self.route: List[Dict] = [] # 跨房间移动时尚未走完的路点
         
     def update_position(self, x: int, y: int):
         """更新位置"""
@@ -34,11 +97,11 @@ class AgentState:
         
     def add_memory(self, memory: str):
         """添加记忆"""
-        self.memory.append({
-            "content": memory,
-            "timestamp": len(self.memory),
-            "importance": 1.0
-        })
+        self.memory.append(MemoryRecord(memory, (), len(self.memory)))
+
+    def add_memory_template(self, template: str, *args):
+        """以模板+参数的形式添加记忆"""
+        self.memory.append(MemoryRecord(template, args, len(self.memory)))
         
     def update_relationship(self, other_agent_id: int, change: float):
         """更新与其他角色的关系"""
@@ -47,55 +110,332 @@ class AgentState:
         self.relationships[other_agent_id] += change
         self.relationships[other_agent_id] = max(-1.0, min(1.0, self.relationships[other_agent_id]))
 
+    def copy_state_from(self, other: "AgentState"):
+        """复制另一个智能体的可变状态；记忆条目不可变，与原智能体共享"""
+        self.current_room = other.current_room
+        self.update_position(other.position["x"], other.position["y"])
+        self.health = other.health
+        self.energy = other.energy
+        self.mood = other.mood
+        self.inventory = list(other.inventory)
+        self.relationships = dict(other.relationships)
+        self.memory = list(other.memory)
+        self.current_action = other.current_action
+        self.action_cooldown = other.action_cooldown
+        self.knowledge = dict(other.knowledge)
+        self.route = list(other.route)
+
+    def to_checkpoint(self) -> Dict:
+        """完整状态（全部记忆、关系与未走完的路线），用于检查点"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "personality": self.personality,
+            "goal": self.goal,
+            "current_room": self.current_room,
+            "position": {"x": self.position["x"], "y": self.position["y"]},
+            "health": self.health,
+            "energy": self.energy,
+            "mood": self.mood,
+            "inventory": list(self.inventory),
+            "relationships": {str(other_id): value for other_id, value in self.relationships.items()},
+            "memory": [record.to_state() for record in self.memory],
+            "current_action": self.current_action,
+            "action_cooldown": self.action_cooldown,
+            "knowledge": self.knowledge,
+            "route": [dict(waypoint) for waypoint in self.route]
+        }
+
+    def restore_checkpoint(self, data: Dict):
+        """从 to_checkpoint 的结果恢复状态"""
+        self.current_room = data.get("current_room")
+        self.update_position(data["position"]["x"], data["position"]["y"])
+        self.health = data.get("health", 100)
+        self.energy = data.get("energy", 100)
+        self.mood = data.get("mood", "neutral")
+        self.inventory = list(data.get("inventory", []))
+        # JSON 对象的键是字符串，关系表以智能体ID（整数）为键
+        self.relationships = {int(other_id): value for other_id, value in data.get("relationships", {}).items()}
+        self.memory = [MemoryRecord.from_state(state) for state in data.get("memory", [])]
+        self.current_action = data.get("current_action")
+        self.action_cooldown = data.get("action_cooldown", 0)
+        self.knowledge = data.get("knowledge", {})
+        self.route = [dict(waypoint) for waypoint in data.get("route", [])]
+
 class AgentStateManager:
-    def __init__(self):
-        self.llm_manager = LLMManager()
+    def __init__(self, use_array_store: bool = False, llm_manager: Optional[LLMManager] = None):
+        self.llm_manager = llm_manager or LLMManager()
         self.agents: Dict[int, AgentState] = {}
+        # 可选：用NumPy结构数组承载数值状态，适合大规模智能体的批量更新
+        self.use_array_store = use_array_store
+        self.array_store = None
         self.current_step = 0
         self.current_action_plan: List[Dict] = [] # 新增：存储当前步骤的动作计划
-        self.current_action_index = 0 # 新增：当前执行到动作计划的第几步
+        self.current_action_index = 0 # 新增：当前执行到动作计划的第几步（即已完成的动作数）
+        self.completed_action_indices = set() # 批量模式下动作可能乱序完成
+        self.room_graph: Optional[RoomGraph] = None
+        self.scheduler = ActionScheduler() # 离散事件调度器，用于按模拟时间并行执行计划
+        self.rng = random.Random() # 可由模拟器替换为带种子的随机源
         
     def initialize_agents(self, agent_configs: List[Dict], scene_structure: Dict):
-        self.agents.clear()
+        rooms = scene_structure.get("rooms", [])
+        self._reset_world(len(agent_configs), scene_structure)
         for i, config in enumerate(agent_configs):
-            agent = AgentState(
+            agent = self._create_agent(
                 agent_id=i,
                 name=config["name"],
                 personality=config["personality"],
                 goal=config["goal"]
             )
-            rooms = scene_structure["rooms"]
             if rooms:
-                initial_room = random.choice(rooms)
+                initial_room = self.rng.choice(rooms)
                 agent.current_room = initial_room["id"]
                 agent.position["x"] = initial_room["x"] + initial_room["width"] // 2
                 agent.position["y"] = initial_room["y"] + initial_room["height"] // 2
             self.agents[i] = agent
 
+    def _reset_world(self, agent_count: int, scene_structure: Dict):
+        self.agents.clear()
+        if self.use_array_store:
+            from agent_array_store import AgentArrayStore
+            self.array_store = AgentArrayStore(agent_count)
+            self.array_store.set_rooms(scene_structure.get("rooms", []))
+        else:
+            self.array_store = None
+        self.room_graph = get_room_graph(scene_structure)
+        self.scheduler.reset()
+
+    def to_checkpoint(self) -> Dict:
+        """智能体与计划执行进度的完整快照"""
+        return {
+            "agents": [agent.to_checkpoint() for agent in self.agents.values()],
+            "action_plan": self.current_action_plan,
+            "completed_action_indices": sorted(self.completed_action_indices),
+            "scheduler": {
+                "clock": self.scheduler.clock,
+                "busy_until": {str(agent_id): until for agent_id, until in self.scheduler.busy_until.items()}
+            }
+        }
+
+    def restore_checkpoint(self, data: Dict, scene_structure: Dict):
+        """从 to_checkpoint 的结果恢复，不重新随机分配房间"""
+        self._reset_world(len(data["agents"]), scene_structure)
+        for agent_data in data["agents"]:
+            agent = self._create_agent(
+                agent_id=agent_data["id"],
+                name=agent_data["name"],
+                personality=agent_data["personality"],
+                goal=agent_data["goal"]
+            )
+            agent.restore_checkpoint(agent_data)
+            self.agents[agent.id] = agent
+        self.current_action_plan = data.get("action_plan", [])
+        self.completed_action_indices = set(data.get("completed_action_indices", []))
+        self.current_action_index = len(self.completed_action_indices)
+        scheduler = data.get("scheduler", {})
+        self.scheduler.clock = scheduler.get("clock", 0.0)
+        self.scheduler.busy_until = {
+            int(agent_id): until for agent_id, until in scheduler.get("busy_until", {}).items()
+        }
+
+    def fork_from(self, other: "AgentStateManager", scene_structure: Dict):
+        """以另一个管理器的当前状态为起点（分叉），智能体状态各自独立，不可变的部分共享"""
+        self._reset_world(len(other.agents), scene_structure)
+        for source in other.agents.values():
+            agent = self._create_agent(source.id, source.name, source.personality, source.goal)
+            agent.copy_state_from(source)
+            self.agents[agent.id] = agent
+        # 计划中的动作只读，列表本身在 set_action_plan 时整体替换
+        self.current_action_plan = other.current_action_plan
+        self.completed_action_indices = set(other.completed_action_indices)
+        self.current_action_index = other.current_action_index
+        self.scheduler.clock = other.scheduler.clock
+        self.scheduler.busy_until = dict(other.scheduler.busy_until)
+
+    def _create_agent(self, agent_id: int, name: str, personality: List[str], goal: str) -> AgentState:
+        if self.array_store is not None:
+            from agent_array_store import ArrayAgentState
+            return ArrayAgentState(self.array_store, agent_id, name, personality, goal)
+        return AgentState(agent_id=agent_id, name=name, personality=personality, goal=goal)
+
+    # --- 批量操作：启用数组存储时向量化执行，否则逐个处理 ---
+    def apply_energy_change(self, agent_ids: List[int], delta: float):
+        """批量调整一组智能体的能量（如统一衰减或休息）"""
+        agents = [self.agents[i] for i in agent_ids if i in self.agents]
+        if self.array_store is not None:
+            self.array_store.apply_energy_delta(delta, [agent.row for agent in agents])
+            return
+        for agent in agents:
+            agent.energy = max(0, min(100, agent.energy + delta))
+
+    def find_agents_near(self, x: float, y: float, radius: float) -> List[int]:
+        """返回距离某点不超过radius的智能体ID"""
+        if self.array_store is not None:
+            rows = set(self.array_store.indices_within(x, y, radius))
+            return [agent.id for agent in self.agents.values() if agent.row in rows]
+        return [
+            agent.id for agent in self.agents.values()
+            if ((agent.position["x"] - x) ** 2 + (agent.position["y"] - y) ** 2) ** 0.5 <= radius
+        ]
+
+    def find_agents_outside_rooms(self, context: Dict) -> List[int]:
+        """返回坐标已不在当前房间范围内的智能体ID"""
+        if self.array_store is not None:
+            mask = self.array_store.outside_current_room_mask()
+            return [agent.id for agent in self.agents.values() if mask[agent.row]]
+        outside = []
+        for agent in self.agents.values():
+            room = self._get_room_data(agent.current_room, context)
+            if room and not self._is_position_in_room(agent.position["x"], agent.position["y"], room):
+                outside.append(agent.id)
+        return outside
+
     # --- 修改：不再由单个Agent决定行动，而是执行一个预定的计划 ---
     def update_agents_with_plan(self, context: Dict) -> Dict:
         """根据动作计划更新所有智能体"""
         if not self.current_action_plan or self.current_action_index >= len(self.current_action_plan):
             return {"status": "no_plan", "reason": "没有可执行的动作计划或计划已执行完毕"}
 
-        action_to_execute = self.current_action_plan[self.current_action_index]
+        action_index = self._pending_action_indices()[0]
+        action_to_execute = self.current_action_plan[action_index]
         agent_id = action_to_execute.get("agent_id")
         agent = self.agents.get(agent_id)
 
         if not agent:
             return {"status": "error", "reason": f"未找到ID为 {agent_id} 的智能体"}
 
+        # 正在跨房间行进的其他智能体各前进一个路点
+        route_updates = self.advance_routes(exclude={agent_id})
+
         # 执行动作
         result = self._execute_action(agent, action_to_execute, context)
         self._update_agent_state(agent, action_to_execute, result)
 
         # 移动到计划中的下一个动作
-        self.current_action_index += 1
+        self._mark_completed(action_index)
+
+        update = self._build_update(agent, action_to_execute, result)
+        update["route_updates"] = route_updates
+        return update
+
+    def update_agents_with_plan_batch(self, context: Dict) -> Dict:
+        """
+        批量模式：对剩余计划做依赖分析，一次执行所有就绪的动作并返回合并更新。
+
+        涉及不同智能体、且没有对话/目标耦合的动作互相独立；某个动作只有在计划中排在它之前的
+        未完成动作都不涉及相同智能体时才算就绪。
+        """
+        if self.is_plan_finished():
+            return {"status": "no_plan", "reason": "没有可执行的动作计划或计划已执行完毕"}
+
+        ready = self._ready_action_indices()
+        updates = []
+        errors = []
+        actors = set()
+        for index in ready:
+            action = self.current_action_plan[index]
+            agent = self.agents.get(action.get("agent_id"))
+            if not agent:
+                errors.append({"status": "error", "reason": f"未找到ID为 {action.get('agent_id')} 的智能体"})
+                self._mark_completed(index)
+                continue
+            result = self._execute_action(agent, action, context)
+            self._update_agent_state(agent, action, result)
+            self._mark_completed(index)
+            actors.add(agent.id)
+            updates.append(self._build_update(agent, action, result))
+
+        # 本批次没有行动的智能体沿路线前进一个路点
+        route_updates = self.advance_routes(exclude=actors)
+        plan_progress = f"{self.current_action_index}/{len(self.current_action_plan)}"
+        for update in updates:
+            update["plan_progress"] = plan_progress
 
+        return {
+            "status": "executed_batch",
+            "mode": "batch",
+            "updates": updates,
+            "errors": errors,
+            "route_updates": route_updates,
+            "plan_progress": plan_progress
+        }
+
+    def _pending_action_indices(self) -> List[int]:
+        return [i for i in range(len(self.current_action_plan)) if i not in self.completed_action_indices]
+
+    def _mark_completed(self, index: int):
+        self.completed_action_indices.add(index)
+        self.current_action_index = len(self.completed_action_indices)
+
+    def _ready_action_indices(self) -> List[int]:
+        """返回当前可以并行执行的动作下标（依赖分析）"""
+        ready = []
+        blocked = set()
+        for index in self._pending_action_indices():
+            participants = set(self._action_participants(self.current_action_plan[index]))
+            if not participants & blocked:
+                ready.append(index)
+            blocked |= participants
+        return ready
+
+    def run_plan_scheduled(self, context: Dict) -> Dict:
+        """
+        用离散事件调度器在模拟时间中执行计划剩余的全部动作。
+
+        动作按类型获得耗时（移动按距离、对话按台词长度、休息等为固定值），执行者完成后还需
+        action_cooldown 的冷却；不同智能体间互不冲突的动作并行进行，返回合并后的更新。
+        """
+        if self.is_plan_finished():
+            return {"status": "no_plan", "reason": "没有可执行的动作计划或计划已执行完毕"}
+
+        pending = []
+        skipped = []
+        for index in self._pending_action_indices():
+            action = self.current_action_plan[index]
+            if action.get("agent_id") not in self.agents:
+                skipped.append({"status": "error", "reason": f"未找到ID为 {action.get('agent_id')} 的智能体"})
+                continue
+            pending.append((index, action, self._action_participants(action)))
+
+        def duration_fn(action: Dict) -> float:
+            agent = self.agents[action["agent_id"]]
+            return estimate_duration(action, agent.position, self._preview_route(agent, action, context))
+
+        def execute_fn(index: int, action: Dict) -> Dict:
+            agent = self.agents[action["agent_id"]]
+            result = self._execute_action(agent, action, context)
+            # 调度模式下行进时间已计入耗时，路线在动作完成时一次走完
+            while agent.route:
+                self._advance_route(agent)
+            self._update_agent_state(agent, action, result)
+            return self._build_update(agent, action, result)
+
+        def cooldown_fn(agent_id: int) -> float:
+            return self.agents[agent_id].action_cooldown
+
+        start_time = self.scheduler.clock
+        updates = self.scheduler.run(pending, duration_fn, execute_fn, cooldown_fn)
+        self.completed_action_indices = set(range(len(self.current_action_plan)))
+        self.current_action_index = len(self.current_action_plan)
+        plan_progress = f"{self.current_action_index}/{len(self.current_action_plan)}"
+        for update in updates:
+            update["plan_progress"] = plan_progress
+
+        return {
+            "status": "executed_batch",
+            "mode": "scheduled",
+            "updates": updates,
+            "errors": skipped,
+            "sim_time": round(self.scheduler.clock, 3),
+            "sim_elapsed": round(self.scheduler.clock - start_time, 3),
+            "plan_progress": plan_progress
+        }
+
+    def _build_update(self, agent: AgentState, action: Dict, result: Dict) -> Dict:
         return {
             "status": "executed",
-            "agent_id": agent_id,
-            "action": action_to_execute,
+            "agent_id": agent.id,
+            "action": action,
             "result": result,
             "position": agent.position.copy(),
             "current_room": agent.current_room,
@@ -104,10 +444,33 @@ class AgentStateManager:
             "plan_progress": f"{self.current_action_index}/{len(self.current_action_plan)}"
         }
 
+    def _action_participants(self, action: Dict) -> Tuple[int, ...]:
+        """动作涉及的智能体：执行者在前，若目标是另一个智能体则一并占用"""
+        actor = action.get("agent_id")
+        target = action.get("target")
+        if target:
+            target_agent = self._find_agent_by_name(target)
+            if target_agent and target_agent.id != actor:
+                return (actor, target_agent.id)
+        return (actor,)
+
+    def _preview_route(self, agent: AgentState, action: Dict, context: Dict) -> Optional[List[Dict]]:
+        """跨房间移动时预先计算路线，用于估算行进时间"""
+        if action.get("action_type", "move") != "move":
+            return None
+        dest = action.get("destination") or {}
+        destination = {"x": dest.get("x", agent.position["x"]), "y": dest.get("y", agent.position["y"]),
+                       "room": dest.get("room")}
+        room = self._get_room_data(agent.current_room, context)
+        if room and self._is_position_in_room(destination["x"], destination["y"], room):
+            return None
+        return self.get_room_graph(context).plan_route(agent.current_room, destination)
+
     def set_action_plan(self, plan: List[Dict]):
         """设置新的动作计划"""
         self.current_action_plan = plan
         self.current_action_index = 0
+        self.completed_action_indices = set()
 
     def is_plan_finished(self) -> bool:
         """检查当前动作计划是否已执行完毕"""
@@ -151,7 +514,7 @@ class AgentStateManager:
             response = self.llm_manager.llm.chat(prompt)
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
-                return json.loads(json_match.group())
+                return serializer.loads(json_match.group())
         except Exception as e:
             print(f"LLM生成行动失败: {e}")
         
@@ -160,15 +523,15 @@ class AgentStateManager:
     def _generate_default_action(self, agent: AgentState) -> Dict:
         """生成默认行动"""
         actions = ["move", "investigate", "rest"]
-        action_type = random.choice(actions)
+        action_type = self.rng.choice(actions)
         
         return {
             "action_type": action_type,
             "target": None,
             "dialogue": f"{agent.name}: 继续探索...",
             "destination": {
-                "x": agent.position["x"] + random.randint(-50, 50),
-                "y": agent.position["y"] + random.randint(-50, 50)
+                "x": agent.position["x"] + self.rng.randint(-50, 50),
+                "y": agent.position["y"] + self.rng.randint(-50, 50)
             },
             "expected_outcome": "探索新区域",
             "reasoning": "随机探索",
@@ -188,11 +551,25 @@ class AgentStateManager:
             current_room_data = self._get_room_data(agent.current_room, context)
             if current_room_data:
                 if self._is_position_in_room(new_x, new_y, current_room_data):
+                    agent.route = []
                     agent.update_position(new_x, new_y)
                     result["details"] = f"移动到 ({new_x}, {new_y})"
                 else:
-                    result["success"] = False
-                    result["details"] = "无法移动到该位置"
+                    route = self.get_room_graph(context).plan_route(
+                        agent.current_room, {"x": new_x, "y": new_y, "room": dest.get("room")})
+                    if route:
+                        # 目标在其他房间：本次走第一个路点，其余在后续动作中逐步完成
+                        result["route"] = [waypoint["room"] for waypoint in route]
+                        agent.route = route
+                        self._advance_route(agent)
+                        target_room = result["route"][-1]
+                        result["details"] = (
+                            f"前往{target_room}" if agent.current_room == target_room
+                            else f"前往{target_room}，途经{agent.current_room}"
+                        )
+                    else:
+                        result["success"] = False
+                        result["details"] = "无法移动到该位置"
         
         elif action_type == "talk":
             target = action.get("target")
@@ -212,7 +589,7 @@ class AgentStateManager:
         
         elif action_type == "investigate":
             result["details"] = "调查周围环境"
-            agent.add_memory(f"调查了{agent.current_room}")
+            agent.add_memory_template(INVESTIGATE_MEMORY_TEMPLATE, agent.current_room)
         
         elif action_type == "rest":
             agent.energy = min(100, agent.energy + 10)
@@ -231,9 +608,45 @@ class AgentStateManager:
         
         agent.action_cooldown = 2
         
-        memory_content = f"{action.get('action_type', '行动')}: {result.get('details', '')}"
-        agent.add_memory(memory_content)
+        if (action.get("action_type") == "move" and result["success"] and result.get("details")
+                and "route" not in result):
+            # 房间内移动的记忆共用模板；跨房间移动保留完整描述（目的地与途经的房间）
+            agent.add_memory_template(MOVE_MEMORY_TEMPLATE, agent.position["x"], agent.position["y"])
+        else:
+            memory_content = f"{action.get('action_type', '行动')}: {result.get('details', '')}"
+            agent.add_memory(memory_content)
     
+    def get_room_graph(self, context: Dict) -> RoomGraph:
+        """当前场景的房间图（初始化时构建，未初始化时按上下文中的场景结构获取）"""
+        if self.room_graph is None:
+            self.room_graph = get_room_graph(context.get("scene_structure", {}))
+        return self.room_graph
+
+    def _advance_route(self, agent: AgentState) -> Optional[Dict]:
+        """沿路线前进一个路点，返回到达的路点"""
+        if not agent.route:
+            return None
+        waypoint = agent.route.pop(0)
+        agent.move_to_room(waypoint["room"])
+        agent.update_position(waypoint["x"], waypoint["y"])
+        return waypoint
+
+    def advance_routes(self, exclude: Optional[set] = None) -> List[Dict]:
+        """让所有仍在路上的智能体各前进一个路点，返回它们的新位置"""
+        updates = []
+        for agent in self.agents.values():
+            if not agent.route or (exclude and agent.id in exclude):
+                continue
+            waypoint = self._advance_route(agent)
+            updates.append({
+                "agent_id": agent.id,
+                "position": agent.position.copy(),
+                "current_room": agent.current_room,
+                "arrived": not agent.route,
+                "waypoint": waypoint
+            })
+        return updates
+
     def _get_room_data(self, room_id: str, context: Dict) -> Optional[Dict]:
         scene_structure = context.get("scene_structure", {})
         rooms = scene_structure.get("rooms", [])
@@ -262,13 +675,15 @@ class AgentStateManager:
             {
                 "id": agent.id,
                 "name": agent.name,
+                "personality": agent.personality,
+                "goal": agent.goal,
                 "position": agent.position.copy(),
                 "current_room": agent.current_room,
                 "mood": agent.mood,
                 "energy": agent.energy,
                 "inventory": agent.inventory.copy(),
                 "current_action": agent.current_action,
-                "memory": agent.memory[-5:], # 返回最近5条记忆
+                "memory": [record.to_dict() for record in agent.memory[-5:]], # 返回最近5条记忆
                 "relationships": agent.relationships
             }
             for agent in self.agents.values()
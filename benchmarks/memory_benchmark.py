@@ -0,0 +1,103 @@
+# benchmarks/memory_benchmark.py
+"""
+智能体状态内存基准：运行若干步动作计划，统计每个智能体、每条记忆占用的字节数。
+
+用法:
+    python benchmarks/memory_benchmark.py --agents 50 --steps 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_state_manager import AgentStateManager
+from story_outline_generator import StoryOutlineGenerator
+
+
+def _random_action(manager: AgentStateManager, scene_structure: dict) -> dict:
+    agent = random.choice(list(manager.agents.values()))
+    action_type = random.choice(["move", "move", "investigate", "rest", "talk"])
+    action = {"agent_id": agent.id, "action_type": action_type}
+    if action_type == "move":
+        room = next(r for r in scene_structure["rooms"] if r["id"] == agent.current_room)
+        action["destination"] = {
+            "x": random.randint(room["x"], room["x"] + room["width"]),
+            "y": random.randint(room["y"], room["y"] + room["height"])
+        }
+    elif action_type == "talk":
+        action["target"] = random.choice(list(manager.agents.values())).name
+        action["dialogue"] = "你好"
+    return action
+
+
+def _legacy_memory_bytes(manager: AgentStateManager) -> int:
+    """按旧的 dict 表示重建全部记忆，测量其占用作为对照"""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    legacy = [
+        [{"content": str(r.content), "timestamp": r.timestamp, "importance": r.importance} for r in agent.memory]
+        for agent in manager.agents.values()
+    ]
+    used = tracemalloc.get_traced_memory()[0] - before
+    del legacy
+    return used
+
+
+def run(agent_count: int, steps: int, seed: int = 0) -> dict:
+    random.seed(seed)
+    scene_structure = StoryOutlineGenerator()._generate_default_scene_structure()
+    configs = [
+        {"name": f"Agent{i}", "personality": ["curious"], "goal": "explore"}
+        for i in range(agent_count)
+    ]
+    context = {"scene_structure": scene_structure}
+    manager = AgentStateManager()
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    manager.initialize_agents(configs, scene_structure)
+    after_init = tracemalloc.get_traced_memory()[0]
+
+    for _ in range(steps):
+        manager.set_action_plan([_random_action(manager, scene_structure)])
+        manager.update_agents_with_plan(context)
+    after_run = tracemalloc.get_traced_memory()[0]
+
+    memory_count = sum(len(agent.memory) for agent in manager.agents.values())
+    legacy_bytes = _legacy_memory_bytes(manager)
+    tracemalloc.stop()
+
+    return {
+        "agents": agent_count,
+        "steps": steps,
+        "memories": memory_count,
+        "bytes_per_agent": round((after_init - start) / agent_count, 1),
+        "bytes_per_memory": round((after_run - after_init) / max(1, memory_count), 1),
+        "legacy_bytes_per_memory": round(legacy_bytes / max(1, memory_count), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能体状态内存基准")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="仅输出JSON结果")
+    args = parser.parse_args()
+
+    result = run(args.agents, args.steps, args.seed)
+    if args.json:
+        print(json.dumps(result))
+        return
+
+    print(f"智能体数: {result['agents']}, 步数: {result['steps']}, 记忆条数: {result['memories']}")
+    print(f"每个智能体: {result['bytes_per_agent']} 字节")
+    print(f"每条记忆: {result['bytes_per_memory']} 字节 (旧dict表示: {result['legacy_bytes_per_memory']} 字节)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/serializer_benchmark.py
+"""
+JSON后端基准：在离线的LLM替身下模拟若干步，得到真实结构的故事数据、状态响应与单步响应，
+比较 serializer 的各个可用后端（orjson / ujson / json）的序列化、解析耗时与输出大小。
+json_indent2 一行是改动前 data.json 的写法（标准库 indent=2），作为参照。
+
+用法:
+    python benchmarks/serializer_benchmark.py
+    python benchmarks/serializer_benchmark.py --agents 32 256 --steps 100 --json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.simulation_benchmark import build_scene, _time_ms  # noqa: E402
+
+DEFAULT_AGENTS = (32, 256)
+DEFAULT_ROOMS = 16
+DEFAULT_STEPS = 100
+DEFAULT_REPEAT = 20
+
+
+def build_payloads(agent_count: int, room_count: int, steps: int) -> Dict[str, object]:
+    """模拟 steps 步后的三种负载：story_data（data.json）、current_state、step_response（/api/simulate_step）"""
+    workdir = tempfile.mkdtemp(prefix="serializer_bench_")
+    os.chdir(workdir)
+    from simulator import Simulator
+    from benchmarks.stub_llm import install_stub_llm
+
+    scene_data = build_scene(agent_count, room_count)
+    simulator = Simulator()
+    install_stub_llm(simulator)
+    simulator.set_planner("llm")
+    simulator.initialize_simulation(scene_data, max_steps=10 ** 6, seed=0)
+    step_result = {}
+    for _ in range(steps):
+        step_result = simulator.simulate_step()
+
+    # 与真实请求一样先经过一次JSON往返，得到只含基本类型的数据
+    story_data = json.loads(json.dumps(dict(
+        scene_data, agents=simulator.agents, current_step=simulator.current_step,
+        agent_states=simulator.agent_manager.get_agent_states()
+    ), default=str))
+    current_state = json.loads(json.dumps(simulator.get_current_state(), default=str))
+    step_response = json.loads(json.dumps({
+        "status": "success", "data": step_result, "current_state": current_state,
+        "map_data": simulator.get_map_data()
+    }, default=str))
+
+    if simulator.event_log is not None:
+        simulator.event_log.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {"story_data": story_data, "current_state": current_state, "step_response": step_response}
+
+
+def bench_payload(payload, repeat: int) -> List[Dict]:
+    import serializer
+
+    rows = []
+    indented = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    rows.append({
+        "backend": "json_indent2",
+        "dumps_ms": round(_time_ms(lambda: json.dumps(payload, ensure_ascii=False, indent=2), repeat), 4),
+        "loads_ms": round(_time_ms(lambda: json.loads(indented), repeat), 4),
+        "bytes": len(indented)
+    })
+    for name in serializer.available_backends():
+        backend = serializer.load_backend(name)
+        encoded = backend.dumps(payload)
+        assert backend.loads(encoded) == payload, f"{name} 往返结果不一致"
+        rows.append({
+            "backend": name,
+            "dumps_ms": round(_time_ms(lambda: backend.dumps(payload), repeat), 4),
+            "loads_ms": round(_time_ms(lambda: backend.loads(encoded), repeat), 4),
+            "pretty_dumps_ms": round(_time_ms(lambda: backend.dumps(payload, pretty=True), repeat), 4),
+            "bytes": len(encoded)
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON后端基准（真实结构的故事负载）")
+    parser.add_argument("--agents", type=int, nargs="+", default=list(DEFAULT_AGENTS))
+    parser.add_argument("--rooms", type=int, default=DEFAULT_ROOMS)
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS, help="生成负载前模拟的步数")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--json", action="store_true", help="仅输出JSON结果")
+    args = parser.parse_args()
+
+    results = []
+    for agent_count in args.agents:
+        payloads = build_payloads(agent_count, args.rooms, args.steps)
+        for payload_name, payload in payloads.items():
+            for row in bench_payload(payload, args.repeat):
+                results.append(dict(row, agents=agent_count, payload=payload_name))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{'智能体':>6} {'负载':<14} {'后端':<13} {'dumps ms':>10} {'loads ms':>10} {'pretty ms':>10} {'字节':>10}")
+    for row in results:
+        pretty = f"{row['pretty_dumps_ms']:>10.3f}" if "pretty_dumps_ms" in row else f"{'-':>10}"
+        print(f"{row['agents']:>6} {row['payload']:<14} {row['backend']:<13} {row['dumps_ms']:>10.3f} "
+              f"{row['loads_ms']:>10.3f} {pretty} {row['bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# benchmarks/simulation_benchmark.py
+"""
+模拟热路径基准：在离线的LLM替身下，按智能体数 × 房间数扫描，测量
+simulate_step 吞吐与延迟分位数、导演提示词构建、状态序列化（get_agent_states /
+get_current_state / get_map_data）、save_story_data 耗时以及峰值RSS。
+
+每个组合在独立子进程中运行，峰值RSS互不影响。结果写成JSON，可与另一次提交的结果对比，
+任一指标比基线慢（或大）超过阈值时以非零状态退出。
+
+用法:
+    python benchmarks/simulation_benchmark.py --output results.json
+    python benchmarks/simulation_benchmark.py --agents 4 32 --rooms 4 --baseline results.json --threshold 0.25
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_AGENTS = (4, 32, 256, 1024)
+DEFAULT_ROOMS = (4, 16, 64)
+DEFAULT_STEPS = 200
+DEFAULT_REPEAT = 20
+DEFAULT_THRESHOLD = 0.2
+# 参与回归比较的指标：数值越大越差
+COMPARED_METRICS = (
+    "step_p50_ms", "step_p95_ms", "prompt_ms", "agent_states_ms", "current_state_ms",
+    "map_data_ms", "save_story_ms", "peak_rss_kb"
+)
+# 太小的数值受计时噪声影响，低于此值的指标不判定回归
+MIN_COMPARED_MS = 0.5
+TIMING_ROUNDS = 5
+
+
+def build_scene(agent_count: int, room_count: int) -> Dict:
+    """网格排列的房间（与右侧、下方相邻房间连通）和均匀分布的智能体"""
+    columns = max(1, math.ceil(math.sqrt(room_count)))
+    rooms = []
+    for index in range(room_count):
+        row, column = divmod(index, columns)
+        connections = []
+        if column + 1 < columns and index + 1 < room_count:
+            connections.append(f"room_{index + 1}")
+        if column > 0:
+            connections.append(f"room_{index - 1}")
+        if index + columns < room_count:
+            connections.append(f"room_{index + columns}")
+        if index - columns >= 0:
+            connections.append(f"room_{index - columns}")
+        rooms.append({
+            "id": f"room_{index}",
+            "name": f"房间{index}",
+            "description": "基准测试房间",
+            "x": column * 250,
+            "y": row * 200,
+            "width": 200,
+            "height": 150,
+            "connections": connections,
+            "key_items": []
+        })
+    relationships = [
+        {"from": room["id"], "to": other, "connection_type": "door"}
+        for room in rooms for other in room["connections"] if room["id"] < other
+    ]
+    agents = []
+    for index in range(agent_count):
+        room = rooms[index % room_count]
+        agents.append({
+            "id": index,
+            "name": f"Agent{index}",
+            "personality": ["curious", "friendly"] if index % 2 else ["brave"],
+            "goal": "explore the town",
+            "x": room["x"] + room["width"] // 2,
+            "y": room["y"] + room["height"] // 2,
+            "current_room": room["id"],
+            "color": "#00ffff"
+        })
+    key_events = [
+        {
+            "step": step,
+            "event_type": "encounter",
+            "description": f"第{step}步的关键事件",
+            "participants": [f"Agent{step % agent_count}"],
+            "location": rooms[step % room_count]["id"],
+            "impact": "推动剧情",
+            "next_step_trigger": "talk"
+        }
+        for step in range(1, 100, 5)
+    ]
+    return {
+        "story_name": "benchmark",
+        "scene": {"description": "基准测试小镇", "structure": {"rooms": rooms, "room_relationships": relationships}},
+        "outline": {"title": "基准", "key_events": key_events, "character_arcs": [], "plot_milestones": []},
+        "agents": agents
+    }
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _time_ms(func, repeat: int) -> float:
+    """每轮重复执行 func repeat 次，返回各轮中最快的单次平均毫秒数（减少调度噪声）"""
+    best = None
+    for _ in range(TIMING_ROUNDS):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - start) * 1000 / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _peak_rss_kb() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以KB为单位
+        return peak // 1024 if sys.platform == "darwin" else peak
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset // 1024
+    except Exception:
+        return None
+
+
+def run_case(agent_count: int, room_count: int, steps: int, repeat: int,
+             mode: str = "single", planner: str = "llm") -> Dict:
+    """在当前进程中运行一个组合"""
+    workdir = tempfile.mkdtemp(prefix="story_bench_")
+    os.chdir(workdir)  # main 在导入时会在当前目录创建故事目录
+    import main
+    from simulator import Simulator
+    from benchmarks.stub_llm import install_stub_llm
+
+    main.STORIES_DIR = os.path.join(workdir, "stories")
+    scene_data = build_scene(agent_count, room_count)
+    simulator = Simulator()
+    stub = install_stub_llm(simulator)
+    simulator.set_execution_mode(mode)
+    simulator.set_planner(planner)
+    simulator.initialize_simulation(scene_data, max_steps=10 ** 6, seed=0)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(steps):
+        step_start = time.perf_counter()
+        simulator.simulate_step()
+        latencies.append((time.perf_counter() - step_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    context = simulator._prepare_director_context()
+    prompt_ms = _time_ms(lambda: simulator.story_director._build_director_prompt(context), repeat)
+    agent_states_ms = _time_ms(lambda: json.dumps(simulator.agent_manager.get_agent_states(), ensure_ascii=False), repeat)
+    current_state_ms = _time_ms(lambda: json.dumps(simulator.get_current_state(), ensure_ascii=False, default=str), repeat)
+    map_data_ms = _time_ms(lambda: json.dumps(simulator.get_map_data(), ensure_ascii=False), repeat)
+    story_data = dict(scene_data, agents=simulator.agents, current_step=simulator.current_step)
+    save_story_ms = _time_ms(lambda: main.save_story_data("benchmark", story_data), max(1, repeat // 4))
+
+    if simulator.event_log is not None:
+        simulator.event_log.close()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "agents": agent_count,
+        "rooms": room_count,
+        "mode": mode,
+        "planner": planner,
+        "steps": steps,
+        "story_steps": simulator.current_step,
+        "llm_calls": stub.calls,
+        "steps_per_sec": round(steps / elapsed, 1) if elapsed else None,
+        "step_p50_ms": round(_percentile(latencies, 0.50), 4),
+        "step_p95_ms": round(_percentile(latencies, 0.95), 4),
+        "step_p99_ms": round(_percentile(latencies, 0.99), 4),
+        "step_max_ms": round(max(latencies), 4) if latencies else 0.0,
+        "prompt_ms": round(prompt_ms, 4),
+        "agent_states_ms": round(agent_states_ms, 4),
+        "current_state_ms": round(current_state_ms, 4),
+        "map_data_ms": round(map_data_ms, 4),
+        "save_story_ms": round(save_story_ms, 4),
+        "peak_rss_kb": _peak_rss_kb()
+    }
+
+
+def run_case_subprocess(agent_count: int, room_count: int, args) -> Dict:
+    command = [
+        sys.executable, os.path.abspath(__file__), "--case", str(agent_count), str(room_count),
+        "--steps", str(args.steps), "--repeat", str(args.repeat), "--mode", args.mode, "--planner", args.planner
+    ]
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    output = subprocess.run(command, capture_output=True, text=True, env=env, check=True).stdout
+    # 模拟器可能在标准输出打印日志，结果是最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """返回超过阈值的回归描述"""
+    baseline_cases = {(case["agents"], case["rooms"], case.get("mode"), case.get("planner")): case
+                      for case in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        key = (case["agents"], case["rooms"], case.get("mode"), case.get("planner"))
+        previous = baseline_cases.get(key)
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            if metric.endswith("_ms") and max(old, new) < MIN_COMPARED_MS:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(
+                    f"agents={case['agents']} rooms={case['rooms']} {metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟热路径基准（离线LLM替身）")
+    parser.add_argument("--agents", type=int, nargs="+", default=list(DEFAULT_AGENTS))
+    parser.add_argument("--rooms", type=int, nargs="+", default=list(DEFAULT_ROOMS))
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS, help="每个组合调用 simulate_step 的次数")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="提示词与序列化计时的重复次数")
+    parser.add_argument("--mode", default="single", help="计划执行模式 single/batch/scheduled")
+    parser.add_argument("--planner", default="llm", help="导演后端 llm/local/auto/lod")
+    parser.add_argument("--output", help="结果JSON的写入路径")
+    parser.add_argument("--baseline", help="用于比较的基线结果JSON")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的相对退化，如0.2表示20%%")
+    parser.add_argument("--case", type=int, nargs=2, metavar=("AGENTS", "ROOMS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        result = run_case(args.case[0], args.case[1], args.steps, args.repeat, args.mode, args.planner)
+        print(json.dumps(result))
+        return
+
+    cases = []
+    for agent_count in args.agents:
+        for room_count in args.rooms:
+            case = run_case_subprocess(agent_count, room_count, args)
+            cases.append(case)
+            print(f"agents={agent_count:5d} rooms={room_count:3d}  {case['steps_per_sec']:>9} 步/秒  "
+                  f"p50={case['step_p50_ms']:.3f}ms p95={case['step_p95_ms']:.3f}ms  "
+                  f"prompt={case['prompt_ms']:.2f}ms states={case['agent_states_ms']:.2f}ms "
+                  f"save={case['save_story_ms']:.2f}ms rss={case['peak_rss_kb']}KB", file=sys.stderr)
+
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.time(),
+        "cases": cases
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"相对基线 {baseline.get('commit')} 的性能回归（阈值 {args.threshold:.0%}）:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"未发现超过 {args.threshold:.0%} 的回归", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# benchmarks/stub_llm.py
+"""
+离线基准用的LLM替身：不发起网络请求，按提示词中列出的智能体返回确定的导演计划。
+"""
+import json
+import re
+import time
+from typing import Optional
+
+AGENT_LINE = re.compile(r"^- (.+?) \(ID: (\d+)\):$", re.MULTILINE)
+
+
+class StubLLM:
+    """与 LLMCHAT 相同的 chat() 接口；latency 秒模拟网络延迟（默认0）"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def chat(self, user: str, *, stream: Optional[bool] = None, **kwargs) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        agents = [(name, int(agent_id)) for name, agent_id in AGENT_LINE.findall(user)]
+        plan = []
+        for index, (name, agent_id) in enumerate(agents):
+            if len(agents) > 1 and index % 3 == 0:
+                target = agents[(index + 1) % len(agents)][0]
+                plan.append({
+                    "agent_id": agent_id,
+                    "action_type": "talk",
+                    "target": target,
+                    "dialogue": f"你好，{target}。",
+                    "reasoning": "基准测试"
+                })
+            else:
+                plan.append({
+                    "agent_id": agent_id,
+                    "action_type": "investigate" if index % 3 == 1 else "rest",
+                    "reasoning": "基准测试"
+                })
+        return json.dumps({"narrative_summary": f"第{self.calls}次导演计划", "action_plan": plan}, ensure_ascii=False)
+
+
+def install_stub_llm(simulator, latency: float = 0.0) -> StubLLM:
+    """让模拟器的所有LLM调用由 StubLLM 响应"""
+    stub = StubLLM(latency)
+    for owner in (simulator.story_director.llm_manager, simulator.agent_manager.llm_manager,
+                  simulator.outline_generator.llm_manager):
+        owner.llm = stub
+    return stub
@@ -0,0 +1,81 @@
+# checkpoint.py
+import os
+from typing import Dict, Optional
+import serializer
+
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+# 每完成多少个故事步写一次检查点；两次检查点之间的进度由事件日志补齐
+DEFAULT_CHECKPOINT_INTERVAL = 5
+
+
+def write_json_atomic(path: str, data, durable: bool = True):
+    """
+    原子地写入JSON：先写临时文件，再用 os.replace 替换。
+
+    durable 为 True 时在替换前后 fsync，任何时刻崩溃，磁盘上要么是旧文件，要么是完整的新文件。
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(serializer.dumps_bytes(data, default=None))
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if durable:
+        _fsync_dir(os.path.dirname(path) or ".")
+
+
+def save_checkpoint(story_path: str, checkpoint: Dict) -> str:
+    """原子且持久地写入检查点"""
+    os.makedirs(story_path, exist_ok=True)
+    path = os.path.join(story_path, CHECKPOINT_FILE)
+    write_json_atomic(path, dict(checkpoint, version=CHECKPOINT_VERSION))
+    return path
+
+
+def load_checkpoint(story_path: str) -> Optional[Dict]:
+    """读取检查点，不存在或版本不符时返回 None"""
+    path = os.path.join(story_path, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = serializer.load(f)
+    except Exception as e:
+        print(f"读取检查点失败: {e}")
+        return None
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+
+def remove_checkpoint(story_path: str):
+    path = os.path.join(story_path, CHECKPOINT_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _fsync_dir(path: str):
+    """让 rename 本身也落盘（不支持目录 fsync 的平台上忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def rng_state_to_json(state) -> list:
+    """random.Random.getstate() 的结果转换为可JSON序列化的列表"""
+    version, internal, gauss_next = state
+    return [version, list(internal), gauss_next]
+
+
+def rng_state_from_json(data: list):
+    version, internal, gauss_next = data
+    return (version, tuple(internal), gauss_next)
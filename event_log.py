@@ -0,0 +1,282 @@
+# event_log.py
+import atexit
+import os
+import queue
+import threading
+import weakref
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+import serializer
+
+MANIFEST_FILE = "manifest.json"
+SEGMENT_TEMPLATE = "segment_{:06d}.jsonl"
+DEFAULT_SEGMENT_SIZE = 1000
+DEFAULT_TAIL_SIZE = 50
+
+_open_logs = weakref.WeakSet()
+
+
+def event_tags(record: Dict) -> Tuple[List[int], List[str]]:
+    """记录中执行了动作的智能体ID与动作类型（agent_update 为单个结果或含 updates 的合并结果）"""
+    agent_update = record.get("agent_update") or {}
+    updates = agent_update.get("updates") if "updates" in agent_update else [agent_update]
+    agents, types = set(), set()
+    for update in updates or []:
+        if not isinstance(update, dict) or update.get("agent_id") is None:
+            continue
+        agents.add(update["agent_id"])
+        action_type = (update.get("action") or {}).get("action_type")
+        if action_type:
+            types.add(action_type)
+    return sorted(agents, key=str), sorted(types)
+
+
+def event_matches(record: Dict, agent_id=None, action_type: Optional[str] = None) -> bool:
+    """记录中是否有符合条件（执行者为 agent_id、动作类型为 action_type）的已执行动作"""
+    if agent_id is None and action_type is None:
+        return True
+    agent_update = record.get("agent_update") or {}
+    updates = agent_update.get("updates") if "updates" in agent_update else [agent_update]
+    for update in updates or []:
+        if not isinstance(update, dict):
+            continue
+        if agent_id is not None and update.get("agent_id") != agent_id:
+            continue
+        if action_type is not None and (update.get("action") or {}).get("action_type") != action_type:
+            continue
+        return True
+    return False
+
+
+def _atomic_write_json(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        serializer.dump(data, f, default=None)
+    os.replace(tmp_path, path)
+
+
+class EventLog:
+    """
+    按故事保存的只追加事件日志。
+
+    记录在调用线程上序列化，由后台线程写入按条数切分的JSONL段文件；内存中只保留最近的少量记录，
+    manifest 记录每段覆盖的步数范围以及出现过的智能体与动作类型，用于按步数范围与条件读取时跳过无关的段。
+    """
+
+    def __init__(self, log_dir: str, segment_size: int = DEFAULT_SEGMENT_SIZE, tail_size: int = DEFAULT_TAIL_SIZE):
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.tail = deque(maxlen=tail_size)
+        os.makedirs(log_dir, exist_ok=True)
+        self.segments: List[Dict] = self._load_manifest()
+        self.next_seq = sum(segment["count"] for segment in self.segments)
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock() # 防止读到写了一半的行
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name=f"event-log:{log_dir}", daemon=True)
+        self._thread.start()
+        _open_logs.add(self)
+
+    # --- 写入 ---
+    def append(self, record: Dict) -> int:
+        """追加一条记录（必须包含 step），返回其序号"""
+        with self._lock:
+            seq = self.next_seq
+            self.next_seq += 1
+        record["seq"] = seq
+        self.tail.append(record)
+        line = serializer.dumps(record, default=None)
+        self._queue.put((seq, record.get("step", 0), line, event_tags(record)))
+        return seq
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            # 一次取出所有已排队的记录，合并写入
+            while True:
+                try:
+                    next_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    self._queue.put(None)
+                    self._queue.task_done()
+                    break
+                batch.append(next_item)
+            try:
+                with self._io_lock:
+                    self._write_batch(batch)
+            except Exception as e:
+                print(f"写入事件日志失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        handle = None
+        current = None
+        try:
+            for seq, step, line, (agents, types) in batch:
+                segment = self.segments[-1] if self.segments else None
+                if segment is None or segment["count"] >= self.segment_size:
+                    segment = {
+                        "file": SEGMENT_TEMPLATE.format(len(self.segments)),
+                        "first_seq": seq,
+                        "first_step": step,
+                        "last_step": step,
+                        "count": 0,
+                        "agents": [],
+                        "types": []
+                    }
+                    self.segments.append(segment)
+                if segment is not current:
+                    if handle:
+                        handle.close()
+                    handle = open(os.path.join(self.log_dir, segment["file"]), 'a', encoding='utf-8')
+                    current = segment
+                handle.write(line + "\n")
+                segment["count"] += 1
+                segment["first_step"] = min(segment["first_step"], step)
+                segment["last_step"] = max(segment["last_step"], step)
+                if "agents" in segment:
+                    # 旧清单中的段没有索引，不补建（查询时不能据此跳过）
+                    segment["agents"] = _merge_sorted(segment["agents"], agents)
+                    segment["types"] = _merge_sorted(segment["types"], types)
+        finally:
+            if handle:
+                handle.close()
+        _atomic_write_json(os.path.join(self.log_dir, MANIFEST_FILE), {"segments": self.segments})
+
+    def flush(self):
+        """等待后台线程把已排队的记录全部写盘"""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        _open_logs.discard(self)
+
+    def reset(self):
+        """清空日志（重新开始一次模拟时使用）"""
+        self.flush()
+        for segment in self.segments:
+            path = os.path.join(self.log_dir, segment["file"])
+            if os.path.exists(path):
+                os.remove(path)
+        self.segments = []
+        self.next_seq = 0
+        self.tail.clear()
+        _atomic_write_json(os.path.join(self.log_dir, MANIFEST_FILE), {"segments": self.segments})
+
+    # --- 读取 ---
+    def _load_manifest(self) -> List[Dict]:
+        manifest_path = os.path.join(self.log_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return []
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                segments = serializer.load(f).get("segments", [])
+        except Exception as e:
+            print(f"读取事件日志清单失败: {e}")
+            return []
+        if segments:
+            self._recover_last_segment(segments[-1])
+        return segments
+
+    def _recover_last_segment(self, segment: Dict):
+        """清单写入前崩溃时，以段文件中完整的行为准修正最后一段"""
+        path = os.path.join(self.log_dir, segment["file"])
+        if not os.path.exists(path):
+            segment["count"] = 0
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        complete = []
+        for line in lines:
+            try:
+                complete.append(serializer.loads(line))
+            except ValueError:
+                break
+        if len(complete) != len(lines):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(lines[:len(complete)])
+        segment["count"] = len(complete)
+        if complete:
+            segment["last_step"] = max(segment["last_step"], complete[-1].get("step", 0))
+
+    def iter_range(self, from_step: int = 0, to_step: Optional[int] = None) -> Iterator[Dict]:
+        """按顺序迭代步数在 [from_step, to_step] 内的记录，只打开覆盖该范围的段"""
+        self.flush()
+        for segment in list(self.segments):
+            if segment["last_step"] < from_step or (to_step is not None and segment["first_step"] > to_step):
+                continue
+            for line in self._read_segment(segment):
+                record = serializer.loads(line)
+                step = record.get("step", 0)
+                if step < from_step or (to_step is not None and step > to_step):
+                    continue
+                yield record
+
+    def read_range(self, from_step: int = 0, to_step: Optional[int] = None) -> List[Dict]:
+        return list(self.iter_range(from_step, to_step))
+
+    def iter_from_seq(self, first_seq: int) -> Iterator[Dict]:
+        """迭代序号不小于 first_seq 的记录"""
+        self.flush()
+        for segment in list(self.segments):
+            if segment["first_seq"] + segment["count"] <= first_seq:
+                continue
+            for line in self._read_segment(segment):
+                record = serializer.loads(line)
+                if record["seq"] >= first_seq:
+                    yield record
+
+    def query(self, after_seq: int = -1, from_step: int = 0, to_step: Optional[int] = None,
+              agent_id=None, action_type: Optional[str] = None) -> Iterator[Dict]:
+        """
+        按序号顺序迭代序号大于 after_seq、步数在 [from_step, to_step] 内且符合条件的记录。
+
+        逐段读取，调用方取够即可停止；清单显示不含该智能体或动作类型的段直接跳过。
+        """
+        self.flush()
+        for segment in list(self.segments):
+            if segment["first_seq"] + segment["count"] - 1 <= after_seq:
+                continue
+            if segment["last_step"] < from_step or (to_step is not None and segment["first_step"] > to_step):
+                continue
+            if agent_id is not None and "agents" in segment and agent_id not in segment["agents"]:
+                continue
+            if action_type is not None and "types" in segment and action_type not in segment["types"]:
+                continue
+            for line in self._read_segment(segment):
+                record = serializer.loads(line)
+                step = record.get("step", 0)
+                if record["seq"] <= after_seq or step < from_step or (to_step is not None and step > to_step):
+                    continue
+                if event_matches(record, agent_id, action_type):
+                    yield record
+
+    def _read_segment(self, segment: Dict) -> List[str]:
+        with self._io_lock:
+            with open(os.path.join(self.log_dir, segment["file"]), 'r', encoding='utf-8') as f:
+                return f.readlines()
+
+
+def _merge_sorted(existing: List, new: List) -> List:
+    if all(item in existing for item in new):
+        return existing
+    return sorted(set(existing) | set(new), key=str)
+
+
+@atexit.register
+def _flush_open_logs():
+    for log in list(_open_logs):
+        try:
+            log.close()
+        except Exception as e:
+            print(f"关闭事件日志失败: {e}")
@@ -0,0 +1,41 @@
+# http_cache.py
+import gzip
+import hashlib
+
+# 小于该大小的响应不压缩（收益抵不过开销）
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+def cacheable(response, request, max_age: int = 0):
+    """
+    按响应内容设置 ETag，浏览器可缓存并用 If-None-Match 重新验证，内容未变时返回 304（不带正文）。
+
+    max_age 为0时每次使用前都重新验证；ETag 为弱校验值，压缩后的响应沿用同一个值。
+    """
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def compress_response(response, request):
+    """客户端接受 gzip 时压缩较大的文本/JSON响应；流式、已编码和没有正文的响应原样返回"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
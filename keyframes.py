@@ -0,0 +1,68 @@
+# keyframes.py
+import bisect
+import os
+import re
+from typing import Dict, List, Optional
+from checkpoint import write_json_atomic
+import serializer
+
+KEYFRAME_DIR = "keyframes"
+KEYFRAME_TEMPLATE = "keyframe_{:06d}.json"
+_KEYFRAME_PATTERN = re.compile(r"^keyframe_(\d+)\.json$")
+# 每隔多少个故事步保存一个关键帧；定位任意步的代价是最多重放 K 步的事件
+DEFAULT_KEYFRAME_INTERVAL = 10
+
+
+class KeyframeIndex:
+    """
+    按故事保存的世界状态关键帧（每 interval 步一帧），用于在长时间线上快速定位。
+
+    关键帧与检查点格式相同；某一步的状态 = 不晚于该步的最近关键帧 + 其后事件日志的重放。
+    """
+
+    def __init__(self, story_path: str, interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        self.directory = os.path.join(story_path, KEYFRAME_DIR)
+        self.interval = max(1, int(interval))
+        os.makedirs(self.directory, exist_ok=True)
+        self.steps: List[int] = sorted(
+            int(match.group(1))
+            for match in (_KEYFRAME_PATTERN.match(name) for name in os.listdir(self.directory))
+            if match
+        )
+
+    def _path(self, step: int) -> str:
+        return os.path.join(self.directory, KEYFRAME_TEMPLATE.format(step))
+
+    def should_save(self, step: int) -> bool:
+        return step % self.interval == 0
+
+    def save(self, snapshot: Dict):
+        """保存一帧（snapshot 为 Simulator.to_checkpoint() 的结果），同一步重复保存时覆盖"""
+        step = snapshot["current_step"]
+        # 关键帧可由检查点和事件日志重建，不需要 fsync
+        write_json_atomic(self._path(step), snapshot, durable=False)
+        index = bisect.bisect_left(self.steps, step)
+        if index == len(self.steps) or self.steps[index] != step:
+            self.steps.insert(index, step)
+
+    def nearest(self, step: int) -> Optional[Dict]:
+        """返回不晚于 step 的最近关键帧"""
+        index = bisect.bisect_right(self.steps, step) - 1
+        while index >= 0:
+            try:
+                with open(self._path(self.steps[index]), 'r', encoding='utf-8') as f:
+                    return serializer.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取关键帧失败: {e}")
+                index -= 1
+        return None
+
+    def truncate_after(self, step: int):
+        """删除晚于 step 的关键帧（时间线被改写后它们已失效）"""
+        while self.steps and self.steps[-1] > step:
+            path = self._path(self.steps.pop())
+            if os.path.exists(path):
+                os.remove(path)
+
+    def reset(self):
+        self.truncate_after(-1)
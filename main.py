@@ -1,18 +1,59 @@
 # main.py
-import json
+import copy
+import cProfile
 import sys
 import os
+import time
 import webbrowser
 import shutil
 from pathlib import Path
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, make_response, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from scene_generator import SceneGenerator
-from simulator import Simulator
+from simulator import Simulator, USE_ARRAY_STORE
 from LLM import LLMManager
 from scene_map_generator import SceneMapGenerator
+from replay import SimulationRecording, RECORDING_FILE
+from story_fork import load_fork_info, own_data, merge_with_parent, FORK_FILE
+from planners import PLANNERS
+from profiling import StageTimer, stage, record_story_timings, get_story_stats, save_profile
+from story_store import SQLiteStoryStore, STORE_FILE
+from checkpoint import write_json_atomic, CHECKPOINT_FILE
+from keyframes import KEYFRAME_DIR
+from persistence import WriteBehindQueue, DEFAULT_FLUSH_INTERVAL
+from story_catalog import StoryCatalog, SORT_KEYS
+from story_cache import StoryCache, DEFAULT_CACHE_MB, file_validator
+from timeline_store import TimelineStore, DEFAULT_READ_LIMIT, TIMELINE_DIR
+from step_sinks import compact_step_result
+from http_cache import cacheable, compress_response
+import serializer
+
+
+class SerializerJSONProvider(DefaultJSONProvider):
+    """jsonify 与模板 tojson 使用 serializer 选出的JSON后端，默认紧凑输出、不排序键；请求带 ?pretty=1 时缩进"""
+
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        return serializer.dumps(
+            obj, pretty=bool(kwargs.get("indent")), default=kwargs.get("default", self.default),
+            sort_keys=kwargs.get("sort_keys", self.sort_keys)
+        )
+
+    def loads(self, s, **kwargs):
+        return serializer.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = has_request_context() and request.args.get("pretty") in ("1", "true")
+        return self._app.response_class(
+            serializer.dumps_bytes(obj, pretty=pretty, default=self.default) + b"\n", mimetype=self.mimetype
+        )
+
 
 app = Flask(__name__)
+app.json = SerializerJSONProvider(app)
 
 # 创建全局实例
 scene_generator = SceneGenerator()
@@ -21,6 +62,22 @@ scene_generator = SceneGenerator()
 STORIES_DIR = "stories"
 os.makedirs(STORIES_DIR, exist_ok=True)
 
+# 故事数据的存储后端：sqlite（默认，按智能体/事件增量写入）或 json（每个故事一个 data.json）
+STORY_BACKEND = os.environ.get("STORY_BACKEND", "sqlite")
+story_store = SQLiteStoryStore(os.path.join(STORIES_DIR, STORE_FILE)) if STORY_BACKEND == "sqlite" else None
+
+# 故事列表的索引（stories/catalog.json），主页与 /api/stories 不再逐个读取故事配置
+story_catalog = StoryCatalog(STORIES_DIR)
+# 解析后的故事配置与数据的LRU缓存（容量由环境变量 STORY_CACHE_MB 配置）
+story_cache = StoryCache(int(float(os.environ.get("STORY_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024))
+
+# 主页故事库首屏显示的故事数，其余由页面按需加载
+HOME_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# 事件分页接口每页默认与最多返回的记录数
+EVENT_PAGE_SIZE = 100
+MAX_EVENT_PAGE_SIZE = 1000
+
 # 默认配置
 DEFAULT_CONFIG = {
     "scene_description": "A small mysterious town with rumors about a lost artifact near the old station.",
@@ -44,13 +101,18 @@ def get_story_folder(story_name):
     return os.path.join(STORIES_DIR, story_name)
 
 def load_story_config(story_name):
-    """加载指定故事的配置"""
-    story_path = get_story_folder(story_name)
-    config_file = os.path.join(story_path, "config.json")
-    if os.path.exists(config_file):
+    """加载指定故事的配置（解析结果缓存到配置文件被修改为止）"""
+    config_file = os.path.join(get_story_folder(story_name), "config.json")
+    validator = file_validator(config_file)
+    if validator is None:
+        story_cache.invalidate(("config", story_name))
+        return None
+    config = story_cache.get(("config", story_name), validator)
+    if config is None:
         with open(config_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+            config = serializer.load(f)
+        story_cache.put(("config", story_name), config, validator, validator[1])
+    return copy.deepcopy(config)
 
 def save_story_config(story_name, config):
     """保存故事配置到指定文件夹"""
@@ -58,79 +120,250 @@ def save_story_config(story_name, config):
     os.makedirs(story_path, exist_ok=True)
     config_file = os.path.join(story_path, "config.json")
     with open(config_file, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+        serializer.dump(config, f, pretty=True, default=None)
+    validator = file_validator(config_file)
+    story_cache.put(("config", story_name), copy.deepcopy(config), validator, validator[1])
+    story_catalog.update(story_name)
+
+def get_fork_info(story_name):
+    """读取故事的分叉信息（缓存），不是分叉时返回 None"""
+    fork_file = os.path.join(get_story_folder(story_name), FORK_FILE)
+    validator = file_validator(fork_file)
+    if validator is None:
+        return None
+    fork_info = story_cache.get(("fork", story_name), validator)
+    if fork_info is None:
+        fork_info = load_fork_info(get_story_folder(story_name))
+        if fork_info is None:
+            return None
+        story_cache.put(("fork", story_name), fork_info, validator, validator[1])
+    return fork_info
+
+def story_data_view(data):
+    """
+    故事数据的可修改副本：会随模拟变化的智能体与状态深拷贝，场景、大纲等只读部分与原对象共享。
+
+    缓存、写后队列中的数据都经由它交给调用方，模拟器原地修改智能体时不会影响它们。
+    """
+    view = dict(data)
+    for key in ("agents", "agent_states"):
+        if key in view:
+            view[key] = copy.deepcopy(view[key])
+    return view
+
+def _story_data_file(story_name):
+    return os.path.join(get_story_folder(story_name), "data.json")
 
 def save_story_data(story_name, data):
-    """保存故事数据到指定文件夹"""
+    """整体保存故事数据（分叉故事只保存自身变化的部分）"""
+    persistence.discard(story_name)
     story_path = get_story_folder(story_name)
     os.makedirs(story_path, exist_ok=True)
-    data_file = os.path.join(story_path, "data.json")
-    with open(data_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    if get_fork_info(story_name) is not None:
+        data = own_data(data)
+    if story_store is not None:
+        story_store.save_story(story_name, data)
+        story_cache.put(("data", story_name), story_data_view(data))
+    else:
+        write_json_atomic(_story_data_file(story_name), data)
+        validator = file_validator(_story_data_file(story_name))
+        story_cache.put(("data", story_name), story_data_view(data), validator, validator[1])
 
-def load_story_data(story_name):
-    """加载指定故事的数据"""
+def write_story_step(story_name, data):
+    """写后队列的写入函数：SQLite后端在一个事务中写入变化的智能体，JSON后端原子替换 data.json"""
     story_path = get_story_folder(story_name)
-    data_file = os.path.join(story_path, "data.json")
-    if os.path.exists(data_file):
+    if not os.path.isdir(story_path):
+        # 写盘前故事已被删除
+        return
+    if get_fork_info(story_name) is not None:
+        data = own_data(data)
+    if story_store is not None:
+        story_store.save_step(story_name, data)
+    else:
+        write_json_atomic(_story_data_file(story_name), data)
+        # 缓存中已是这次（或更新的）状态，只更新校验值，避免下次读取把自己的写入当作外部修改
+        story_cache.revalidate(("data", story_name), file_validator(_story_data_file(story_name)))
+
+# 模拟一步后的保存由后台线程按间隔合并写盘，不再占用请求耗时
+persistence = WriteBehindQueue(write_story_step, float(os.environ.get("PERSIST_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)))
+
+def save_story_step(story_name, data):
+    """模拟一步后保存：快照放入写后队列，同时作为缓存中的最新数据"""
+    snapshot = story_data_view(data)
+    if story_store is not None:
+        story_cache.put(("data", story_name), snapshot)
+    else:
+        story_cache.put(("data", story_name), snapshot, file_validator(_story_data_file(story_name)))
+    persistence.enqueue(story_name, snapshot)
+
+def read_story_data(story_name):
+    """
+    读取故事自身保存的数据：写后队列中尚未写盘的状态优先，其次是缓存，最后才读存储。
+
+    SQLite后端遇到尚未导入的 data.json 时先导入；JSON后端的缓存以 data.json 的修改时间与大小校验。
+    """
+    pending = persistence.pending_data(story_name)
+    if pending is not None:
+        return story_data_view(pending)
+    if story_store is not None:
+        data = story_cache.get(("data", story_name))
+        if data is None:
+            data = story_store.load_story(story_name)
+            if data is None and story_store.import_json_story(story_name, get_story_folder(story_name)):
+                data = story_store.load_story(story_name)
+            if data is None:
+                return None
+            if "timeline" in data:
+                data = _split_timeline(story_name, data)
+            else:
+                story_cache.put(("data", story_name), data)
+        return story_data_view(data)
+    data_file = _story_data_file(story_name)
+    validator = file_validator(data_file)
+    if validator is None:
+        story_cache.invalidate(("data", story_name))
+        return None
+    data = story_cache.get(("data", story_name), validator)
+    if data is None:
         with open(data_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            data = serializer.load(f)
+        if "timeline" in data:
+            data = _split_timeline(story_name, data)
+        else:
+            story_cache.put(("data", story_name), data, validator, validator[1])
+    return story_data_view(data)
+
+def _split_timeline(story_name, data):
+    """把旧格式故事数据中内嵌的时间线移入分段压缩存储，并保存去掉时间线的故事数据"""
+    data = dict(data)
+    timeline = data.pop("timeline")
+    if isinstance(timeline, list):
+        get_story_timeline(story_name).write(timeline)
+    save_story_data(story_name, data)
+    return data
+
+def load_story_data(story_name):
+    """加载指定故事的数据（分叉故事合并父故事的数据）"""
+    data = read_story_data(story_name)
+    if data is not None:
+        fork_info = get_fork_info(story_name)
+        if fork_info is not None:
+            # 分叉故事的场景、大纲等不可变数据来自父故事
+            parent_data = load_story_data(fork_info["parent"])
+            if parent_data is None:
+                return None
+            data = merge_with_parent(parent_data, data)
+        return data
     return None
 
-def list_stories():
-    """列出所有故事"""
-    stories = []
-    if os.path.exists(STORIES_DIR):
-        for folder in os.listdir(STORIES_DIR):
-            story_path = os.path.join(STORIES_DIR, folder)
-            if os.path.isdir(story_path):
-                config_file = os.path.join(story_path, "config.json")
-                if os.path.exists(config_file):
-                    with open(config_file, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                        created_time = os.path.getmtime(story_path)
-                        created_str = datetime.fromtimestamp(created_time).strftime('%Y-%m-%d %H:%M')
-                        stories.append({
-                            "name": folder,
-                            "description": config.get("scene_description", ""),
-                            "agent_count": config.get("agent_count", 0),
-                            "created": created_str,
-                            "created_timestamp": created_time
-                        })
-    return sorted(stories, key=lambda x: x["created_timestamp"], reverse=True)
+def list_story_forks(story_name):
+    """返回直接从该故事分叉出的故事名"""
+    return story_catalog.forks_of(story_name)
+
+def list_stories(offset=0, limit=None, sort="created", descending=True):
+    """从故事索引中分页列出故事，返回 (故事列表, 故事总数)"""
+    return story_catalog.list(offset, limit, sort, descending)
+
+def reset_story_runtime(story_name):
+    """
+    整体替换故事（重新生成）前清除旧故事的运行状态：内存中的模拟器、检查点、事件日志、关键帧、时间线、录制与分叉信息，
+    以及SQLite中的步与事件，避免之后从旧检查点恢复到新场景上。
+    """
+    Simulator.discard_instance(story_name)
+    persistence.discard(story_name)
+    for kind in ("data", "fork"):
+        story_cache.invalidate((kind, story_name))
+    if story_store is not None:
+        story_store.delete_story(story_name)
+    story_path = get_story_folder(story_name)
+    for folder in ("events", KEYFRAME_DIR, TIMELINE_DIR):
+        shutil.rmtree(os.path.join(story_path, folder), ignore_errors=True)
+    was_fork = os.path.exists(os.path.join(story_path, FORK_FILE))
+    for file_name in (CHECKPOINT_FILE, RECORDING_FILE, FORK_FILE):
+        path = os.path.join(story_path, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+    if was_fork:
+        story_catalog.update(story_name)
 
 def delete_story(story_name):
     """删除指定故事"""
+    Simulator.discard_instance(story_name)
+    persistence.discard(story_name)
+    for kind in ("config", "data", "fork"):
+        story_cache.invalidate((kind, story_name))
     story_path = get_story_folder(story_name)
+    if story_store is not None:
+        story_store.delete_story(story_name)
     if os.path.exists(story_path):
         shutil.rmtree(story_path)
+        story_catalog.remove(story_name)
         return True
+    story_catalog.remove(story_name)
     return False
 
-def generate_simulation_data(config, steps, use_llm=False):
-    """生成模拟数据"""
-    elements = scene_generator.extract_elements(config["scene_description"])
-    scene = scene_generator.generate_scene(elements, use_llm=use_llm)
-    agents = scene_generator.generate_agents(elements, num=config["agent_count"], use_llm=use_llm)
+def simulation_page_state(story_name, data, config=None):
+    """模拟页面首屏需要的少量状态；场景、大纲与智能体由页面通过 /api/stories/<name>/view 加载"""
+    scene = data.get("scene", {})
+    outline = data.get("outline", {})
+    return {
+        "story_name": story_name,
+        "config": config or data.get("config") or {},
+        "use_llm": data.get("use_llm", False),
+        "current_step": data.get("current_step", 0),
+        "scene_type": scene.get("type", ""),
+        "scene_description": scene.get("description", ""),
+        "theme": outline.get("theme"),
+        "main_conflict": outline.get("main_conflict"),
+        "agent_count": len(data.get("agents", []))
+    }
+
+def render_simulation_page(story_name, data, config=None):
+    return render_template('simulation.html', page=simulation_page_state(story_name, data, config),
+                           story_name=story_name)
+
+def get_story_timeline(story_name):
+    """故事的分段压缩时间线（解压后的段进入故事缓存）"""
+    return TimelineStore.for_story(get_story_folder(story_name), story_cache)
+
+def generate_simulation_data(story_name, config, steps, use_llm=False):
+    """
+    重新生成场景并一次性模拟 steps 步，返回 (故事数据, 时间线摘要)。
+
+    每步的事件部分边模拟边写入故事的分段压缩时间线，不再保存在故事数据中。
+    """
+    scene_data = scene_generator.generate_comprehensive_scene(
+        config["scene_description"], config["agent_count"], use_llm=use_llm, max_steps=steps
+    )
     
-    simulator = Simulator()
-    timeline = simulator.run_simulation(scene, agents, steps=steps, use_llm=use_llm)
+    simulator = Simulator(use_array_store=USE_ARRAY_STORE)
+    simulator.set_planner("auto" if use_llm else "local")
+    os.makedirs(get_story_folder(story_name), exist_ok=True)
+    writer = get_story_timeline(story_name).writer()
+    try:
+        for step_result in simulator.iter_simulation(copy.deepcopy(scene_data), steps):
+            writer.append(compact_step_result(step_result))
+    except Exception:
+        writer.abort()
+        raise
+    timeline = writer.commit()
     
     data = {
-        "scene": scene,
-        "agents": agents,
-        "timeline": timeline,
+        "scene": scene_data["scene"],
+        "agents": scene_data["agents"],
+        "outline": scene_data["outline"],
         "config": config,
         "use_llm": use_llm
     }
     
-    return data
+    return data, timeline
 
 @app.route('/')
 def index():
     """主页面 - 配置和查看界面"""
-    stories = list_stories()
-    return render_template('index.html', stories=stories, default_config=DEFAULT_CONFIG)
+    stories, total = list_stories(limit=HOME_PAGE_SIZE)
+    return render_template('index.html', stories=stories, story_total=total, page_size=HOME_PAGE_SIZE,
+                           default_config=DEFAULT_CONFIG)
 
 
 @app.route('/generate', methods=['POST'])
@@ -162,8 +395,14 @@ def generate():
             }
         
         story_name = get_story_name_from_description(config["scene_description"])
+        reset_story_runtime(story_name)
         save_story_config(story_name, config)
         
+        # 指定种子时场景与智能体的随机部分可复现
+        seed = data.get('seed') if request.is_json else request.form.get('seed')
+        if seed not in (None, ""):
+            scene_generator.reseed(int(seed))
+        
         # 生成完整场景数据
         scene_data = scene_generator.generate_comprehensive_scene(
             config["scene_description"], 
@@ -171,6 +410,8 @@ def generate():
             config["use_llm"],
             config["max_steps"]
         )
+        if seed not in (None, ""):
+            scene_data["seed"] = int(seed)
         
         save_story_data(story_name, scene_data)
         
@@ -182,7 +423,7 @@ def generate():
                 "redirect_url": f"/simulation/{story_name}"
             })
         else:
-            return render_template('simulation.html', data=scene_data, story_name=story_name)
+            return render_simulation_page(story_name, scene_data, config)
             
     except Exception as e:
         print(f"生成模拟时出错: {e}")
@@ -199,7 +440,7 @@ def simulation_page(story_name):
     if config:
         data = load_story_data(story_name)
         if data:
-            return render_template('simulation.html', data=data, story_name=story_name)
+            return render_simulation_page(story_name, data, config)
     return "故事不存在", 404
 
 # 保持向后兼容的路由
@@ -221,20 +462,47 @@ def load_story(story_name):
     if config:
         data = load_story_data(story_name)
         if data:
-            return render_template('simulation.html', data=data, story_name=story_name)
+            return render_simulation_page(story_name, data, config)
     return "故事不存在", 404
 
 @app.route('/delete/<story_name>', methods=['POST'])
 def delete_story_route(story_name):
     """删除故事"""
+    forks = list_story_forks(story_name)
+    if forks:
+        return jsonify({"status": "error", "message": f"请先删除分叉故事: {', '.join(forks)}"}), 409
     if delete_story(story_name):
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "删除失败"}), 400
 
 @app.route('/api/stories')
 def get_stories():
-    """API: 获取所有故事列表"""
-    return jsonify(list_stories())
+    """
+    API: 获取故事列表。
+
+    不带参数时返回全部故事（数组）；带 page/per_page 时分页返回 {stories, total, page, per_page}。
+    sort 可选 created/name/agent_count，order 可选 desc/asc。
+    """
+    sort = request.args.get("sort", "created")
+    order = request.args.get("order", "desc")
+    if sort not in SORT_KEYS or order not in ("asc", "desc"):
+        return jsonify({"status": "error", "message": f"sort 可选 {', '.join(SORT_KEYS)}，order 可选 asc/desc"}), 400
+    descending = order == "desc"
+    if "page" not in request.args and "per_page" not in request.args:
+        stories, _ = list_stories(sort=sort, descending=descending)
+        return jsonify(stories)
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", HOME_PAGE_SIZE, type=int)
+    if page is None or per_page is None or page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        return jsonify({"status": "error", "message": f"page 从1开始，per_page 在1到{MAX_PAGE_SIZE}之间"}), 400
+    stories, total = list_stories((page - 1) * per_page, per_page, sort, descending)
+    return jsonify({
+        "status": "success",
+        "stories": stories,
+        "total": total,
+        "page": page,
+        "per_page": per_page
+    })
 
 @app.before_request
 def log_request_info():
@@ -254,6 +522,11 @@ def log_response_info(response):
     print(f"响应头: {dict(response.headers)}")
     return response
 
+@app.after_request
+def compress(response):
+    """客户端接受 gzip 时压缩较大的页面与JSON响应"""
+    return compress_response(response, request)
+
 @app.route('/api/simulate', methods=['POST'])
 def api_simulate():
     """API: 重新模拟指定步数"""
@@ -268,10 +541,11 @@ def api_simulate():
     if not config:
         return jsonify({"status": "error", "message": "故事不存在"}), 404
     
-    new_data = generate_simulation_data(config, steps=steps, use_llm=config.get("use_llm", False))
+    reset_story_runtime(story_name)
+    new_data, timeline = generate_simulation_data(story_name, config, steps=steps, use_llm=config.get("use_llm", False))
     save_story_data(story_name, new_data)
     
-    return jsonify({"status": "success", "data": new_data})
+    return jsonify({"status": "success", "data": new_data, "timeline": timeline})
 
 @app.route('/story_config')
 def story_config():
@@ -311,9 +585,72 @@ def update_llm_config():
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "保存失败"}), 400
 
+def get_story_planner(story_name, story_data):
+    """故事的导演后端：配置中的 planner 优先，否则不使用LLM的故事用本地规则，其余LLM优先、本地规则兜底"""
+    config = load_story_config(story_name) or {}
+    if config.get("planner") in PLANNERS:
+        return config["planner"]
+    use_llm = config.get("use_llm", story_data.get("use_llm", False))
+    return "auto" if use_llm else "local"
+
+def open_story_storage(simulator, story_name, checkpoint_interval=None):
+    """让模拟器使用故事目录下的事件日志、检查点与关键帧"""
+    story_folder = get_story_folder(story_name)
+    if simulator.event_log is None:
+        simulator.attach_event_log(os.path.join(story_folder, "events"))
+    simulator.enable_checkpoints(story_folder, checkpoint_interval)
+    if simulator.keyframes is None:
+        simulator.attach_keyframes(story_folder)
+
+def resume_story_simulator(simulator, story_name, story_data):
+    """从检查点恢复模拟器；分叉故事同时关联父故事的模拟器"""
+    resume_info = simulator.resume(story_data)
+    if resume_info is not None and simulator.fork_origin and simulator.fork_parent is None:
+        parent_name = simulator.fork_origin["parent"]
+        parent = Simulator.get_instance(parent_name)
+        if not parent.initialized:
+            parent_data = load_story_data(parent_name)
+            if parent_data:
+                parent_data["story_name"] = parent_name
+                open_story_storage(parent, parent_name)
+                resume_story_simulator(parent, parent_name, parent_data)
+        if parent.initialized:
+            simulator.attach_fork_parent(parent, simulator.fork_origin)
+    return resume_info
+
 @app.route('/api/simulate_step', methods=['POST'])
 def simulate_step():
-    """模拟单步"""
+    """
+    模拟单步，各阶段耗时写入 Server-Timing 响应头并计入故事的滚动统计。
+
+    请求中 profile 为真（或查询参数 ?profile=1）时用 cProfile 记录本次请求，结果保存在故事目录的 profiles/ 下，路径见 X-Profile 响应头。
+    """
+    data = request.get_json(silent=True) or {}
+    story_name = data.get("story_name")
+    timer = StageTimer()
+    profiler = cProfile.Profile() if data.get("profile") or request.args.get("profile") else None
+    with timer.activate():
+        if profiler is not None:
+            profiler.enable()
+        try:
+            response = make_response(_simulate_step())
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    if story_name and response.status_code == 200 and not data.get("get_state_only"):
+        record_story_timings(story_name, timer.to_dict())
+    if profiler is not None and story_name:
+        try:
+            dump = save_profile(profiler, get_story_folder(story_name), "simulate_step")
+            response.headers["X-Profile"] = dump["prof"]
+        except Exception as e:
+            print(f"保存性能分析结果失败: {e}")
+    return response
+
+
+def _simulate_step():
     try:
         data = request.json
         if not data:
@@ -345,7 +682,8 @@ def simulate_step():
                 }), 400
 
         # 加载故事数据
-        story_data = load_story_data(story_name)
+        with stage("load"):
+            story_data = load_story_data(story_name)
         if not story_data:
             return jsonify({
                 "status": "error", 
@@ -353,27 +691,66 @@ def simulate_step():
             }), 404
         
         # 获取或创建模拟器实例
-        simulator = Simulator.get_instance(story_name)
+        with stage("instance"):
+            simulator = Simulator.get_instance(story_name)
+        try:
+            if data.get("mode"):
+                simulator.set_execution_mode(data["mode"])
+            if data.get("planner"):
+                simulator.set_planner(data["planner"])
+        except ValueError as mode_error:
+            return jsonify({
+                "status": "error", 
+                "message": str(mode_error)
+            }), 400
         
-        # 初始化模拟器（如果需要）
-        if not hasattr(simulator, 'current_step') or simulator.current_step == 0:
-            story_data["story_name"] = story_name
-            init_result = simulator.initialize_simulation(story_data)
-            if init_result.get("status") != "initialized":
-                return jsonify({
-                    "status": "error", 
-                    "message": "模拟器初始化失败"
-                }), 500
+        # 初始化模拟器（如果需要）：有检查点时从检查点+事件日志恢复，否则重新开始
+        resume_info = None
+        if not simulator.initialized:
+            with stage("init"):
+                story_data["story_name"] = story_name
+                open_story_storage(simulator, story_name, data.get("checkpoint_interval"))
+                story_config = load_story_config(story_name) or {}
+                if story_config.get("director_model") or story_config.get("director_temperature") is not None:
+                    # 分叉时为导演指定的模型或温度
+                    simulator.set_director_llm(story_config.get("director_model"), story_config.get("director_temperature"))
+                if not data.get("record") and not data.get("restart"):
+                    resume_info = resume_story_simulator(simulator, story_name, story_data)
+                if resume_info is None:
+                    if not data.get("planner"):
+                        simulator.set_planner(get_story_planner(story_name, story_data))
+                    if data.get("record"):
+                        simulator.start_recording(data.get("seed"))
+                    init_result = simulator.initialize_simulation(story_data)
+                    if init_result.get("status") != "initialized":
+                        return jsonify({
+                            "status": "error", 
+                            "message": "模拟器初始化失败"
+                        }), 500
         
+        # 观看者关注的智能体（分级细节模式下优先交给LLM导演）
+        if isinstance(data.get("focus"), list):
+            try:
+                simulator.set_focus(data["focus"])
+            except (TypeError, ValueError):
+                return jsonify({
+                    "status": "error",
+                    "message": "focus 必须是智能体ID列表"
+                }), 400
+
         # 执行模拟步骤
-        step_result = simulator.simulate_step()
+        with stage("step"):
+            step_result = simulator.simulate_step()
         
         # 保存更新后的数据
         try:
-            story_data['agent_states'] = simulator.agent_manager.get_agent_states()
-            story_data['current_step'] = simulator.current_step
-            story_data['agents'] = simulator.agents
-            save_story_data(story_name, story_data)
+            with stage("save"):
+                story_data['agent_states'] = simulator.agent_manager.get_agent_states()
+                story_data['current_step'] = simulator.current_step
+                story_data['agents'] = simulator.agents
+                save_story_step(story_name, story_data)
+                if simulator.recording is not None and simulator.recording.dirty:
+                    simulator.recording.save(get_story_folder(story_name))
         except Exception as save_error:
             print(f"保存故事数据失败: {save_error}")
             # 即使保存失败，也继续返回结果
@@ -381,15 +758,17 @@ def simulate_step():
         # 获取剧情摘要
         narrative_summary = step_result.get("narrative_summary", "导演正在构思...")
         
-        return jsonify({
-            "status": "success",
-            "data": {
-                **step_result,
-                "narrative_summary": narrative_summary
-            },
-            "current_state": simulator.get_current_state(),
-            "map_data": simulator.get_map_data()
-        })
+        with stage("serialize"):
+            return jsonify({
+                "status": "success",
+                "data": {
+                    **step_result,
+                    "narrative_summary": narrative_summary
+                },
+                "current_state": simulator.get_current_state(),
+                "map_data": simulator.get_map_data(),
+                "resumed": resume_info
+            })
         
     except Exception as e:
         # 详细的错误日志
@@ -406,6 +785,251 @@ def simulate_step():
 
 
 
+@app.route('/api/stories/<story_name>/stats', methods=['GET'])
+def story_stats(story_name):
+    """该故事最近若干次 /api/simulate_step 请求的分阶段耗时统计"""
+    stats = get_story_stats(story_name)
+    if stats is None:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 还没有计时数据"}), 404
+    return jsonify({"status": "success", "stats": stats})
+
+
+@app.route('/api/persistence', methods=['GET'])
+def persistence_stats():
+    """写后队列的状态：积压深度、最久未写盘的时间、写盘耗时与延迟"""
+    return jsonify({"status": "success", "stats": persistence.stats()})
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """故事缓存的命中率、条目数与占用"""
+    return jsonify({"status": "success", "stats": story_cache.stats()})
+
+
+@app.route('/api/stories/<story_name>/view', methods=['GET'])
+def story_view(story_name):
+    """模拟页面加载的场景、大纲与智能体；带 ETag，内容未变时返回 304"""
+    data = load_story_data(story_name)
+    if not data:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 不存在"}), 404
+    response = jsonify({
+        "status": "success",
+        "scene": data.get("scene", {}),
+        "outline": data.get("outline", {}),
+        "agents": data.get("agents", []),
+        "current_step": data.get("current_step", 0)
+    })
+    return cacheable(response, request)
+
+
+@app.route('/api/stories/<story_name>/timeline', methods=['GET'])
+def story_timeline(story_name):
+    """
+    按步数范围读取一次性模拟的时间线，只解压与范围重叠的段。
+
+    参数 from_step、to_step（含）、limit（默认500，最大5000）；结果在步的边界截断，next_from_step 为下一页的起点。
+    """
+    from_step = request.args.get("from_step", 0, type=int)
+    to_step = request.args.get("to_step", type=int)
+    limit = request.args.get("limit", DEFAULT_READ_LIMIT, type=int)
+    if from_step is None or from_step < 0 or limit is None or not 1 <= limit <= 5000:
+        return jsonify({"status": "error", "message": "from_step 不能为负，limit 在1到5000之间"}), 400
+    
+    timeline = get_story_timeline(story_name)
+    summary = timeline.summary()
+    if summary is None:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 没有时间线"}), 404
+    page = timeline.read(from_step, to_step, limit)
+    return jsonify({
+        "status": "success",
+        "timeline": summary,
+        "records": page["records"],
+        "next_from_step": page["next_from_step"]
+    })
+
+
+@app.route('/api/stories/<story_name>/events', methods=['GET'])
+def story_events(story_name):
+    """
+    分页读取故事的事件历史（逐段读取事件日志，不加载完整历史）。
+
+    参数 from_step、to_step（含）、agent（智能体ID或名字）、type（动作类型）、limit、cursor（上一页返回的 next_cursor）。
+    """
+    from_step = request.args.get("from_step", 0, type=int)
+    to_step = request.args.get("to_step", type=int)
+    limit = request.args.get("limit", EVENT_PAGE_SIZE, type=int)
+    if from_step is None or from_step < 0 or limit is None or not 1 <= limit <= MAX_EVENT_PAGE_SIZE:
+        return jsonify({"status": "error", "message": f"from_step 不能为负，limit 在1到{MAX_EVENT_PAGE_SIZE}之间"}), 400
+    
+    story_data = load_story_data(story_name)
+    if not story_data:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 不存在"}), 404
+    
+    agent_id = None
+    agent = request.args.get("agent")
+    if agent:
+        agent_id = next((a.get("id") for a in story_data.get("agents", []) if str(a.get("id")) == agent or a.get("name") == agent), None)
+        if agent_id is None:
+            return jsonify({"status": "error", "message": f"未找到智能体: {agent}"}), 400
+    
+    simulator = Simulator.get_instance(story_name)
+    story_data["story_name"] = story_name
+    if not simulator.initialized:
+        open_story_storage(simulator, story_name)
+        resume_story_simulator(simulator, story_name, story_data)
+    
+    try:
+        events, next_cursor = simulator.query_events(
+            from_step, to_step, agent_id, request.args.get("type") or None, request.args.get("cursor"), limit
+        )
+    except ValueError:
+        return jsonify({"status": "error", "message": "无效的 cursor"}), 400
+    return jsonify({"status": "success", "events": events, "next_cursor": next_cursor})
+
+
+@app.route('/api/stories/<story_name>/seek', methods=['GET'])
+def seek_story(story_name):
+    """返回任意步开始时的世界状态（最近的关键帧 + 其后少量事件的重放）"""
+    step = request.args.get("step", type=int)
+    if step is None or step < 0:
+        return jsonify({"status": "error", "message": "缺少有效的 step 参数"}), 400
+    
+    story_data = load_story_data(story_name)
+    if not story_data:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 不存在"}), 404
+    
+    simulator = Simulator.get_instance(story_name)
+    story_data["story_name"] = story_name
+    if not simulator.initialized:
+        open_story_storage(simulator, story_name)
+        resume_story_simulator(simulator, story_name, story_data)
+    
+    state = simulator.seek(step, story_data)
+    if state is None:
+        return jsonify({"status": "error", "message": "该故事还没有关键帧"}), 404
+    return jsonify({"status": "success", "state": state})
+
+
+@app.route('/api/stories/<story_name>/fork', methods=['POST'])
+def fork_story(story_name):
+    """在指定步（默认当前状态）分叉出新故事，与父故事共享场景、大纲与分叉点之前的历史"""
+    import re
+    data = request.get_json(silent=True) or {}
+    branch_name = re.sub(r'[^\w\-_\.]', '_', str(data.get("branch_name") or "").strip())
+    if not branch_name:
+        branch_name = f"{story_name}_fork{len(list_story_forks(story_name)) + 1}"
+    if os.path.exists(get_story_folder(branch_name)):
+        return jsonify({"status": "error", "message": f"故事 '{branch_name}' 已存在"}), 409
+    
+    story_data = load_story_data(story_name)
+    if not story_data:
+        return jsonify({"status": "error", "message": f"故事 '{story_name}' 不存在"}), 404
+    
+    simulator = Simulator.get_instance(story_name)
+    story_data["story_name"] = story_name
+    if not simulator.initialized:
+        open_story_storage(simulator, story_name)
+        if resume_story_simulator(simulator, story_name, story_data) is None:
+            return jsonify({"status": "error", "message": "该故事尚未开始模拟，无法分叉"}), 400
+    
+    step = data.get("step")
+    model = data.get("model") or None
+    temperature = data.get("temperature")
+    try:
+        temperature = float(temperature) if temperature is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": f"无效的温度: {temperature}"}), 400
+    try:
+        child = simulator.fork(
+            int(step) if step is not None else None,
+            story_path=get_story_folder(branch_name),
+            story_name=branch_name,
+            model=model,
+            temperature=temperature
+        )
+    except ValueError as fork_error:
+        shutil.rmtree(get_story_folder(branch_name), ignore_errors=True)
+        return jsonify({"status": "error", "message": str(fork_error)}), 400
+    try:
+        if data.get("mode"):
+            child.set_execution_mode(data["mode"])
+        if data.get("planner"):
+            child.set_planner(data["planner"])
+    except ValueError as option_error:
+        shutil.rmtree(get_story_folder(branch_name), ignore_errors=True)
+        return jsonify({"status": "error", "message": str(option_error)}), 400
+    Simulator._instances[branch_name] = child
+    
+    config = load_story_config(story_name) or {}
+    config["fork_of"] = story_name
+    config["fork_step"] = child.current_step
+    if model is not None:
+        config["director_model"] = model
+    if temperature is not None:
+        config["director_temperature"] = temperature
+    save_story_config(branch_name, config)
+    save_story_data(branch_name, {
+        "agents": child.agents,
+        "agent_states": child.agent_manager.get_agent_states(),
+        "current_step": child.current_step,
+        "story_name": branch_name
+    })
+    
+    return jsonify({
+        "status": "success",
+        "story_name": branch_name,
+        "parent": story_name,
+        "fork_step": child.current_step
+    })
+
+
+@app.route('/api/replay/<story_name>', methods=['POST'])
+def replay_story(story_name):
+    """按录制确定性地重新运行故事，LLM响应全部来自录制"""
+    recording = SimulationRecording.load(get_story_folder(story_name))
+    if recording is None or recording.scene_data is None:
+        return jsonify({"status": "error", "message": "该故事没有录制"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    steps = int(data.get("steps", recording.steps_recorded))
+    
+    simulator = Simulator(use_array_store=USE_ARRAY_STORE)
+    replayer = simulator.start_replay(recording)
+    scene_data = copy.deepcopy(recording.scene_data)
+    simulator.initialize_simulation(scene_data, recording.max_steps)
+    
+    started = time.perf_counter()
+    timeline = []
+    for _ in range(steps):
+        step_result = simulator.simulate_step()
+        if step_result.get("status") == "completed":
+            break
+        if step_result.get("status") != "running":
+            # 录制时失败的步（如导演LLM出错）在回放中同样失败，模拟继续
+            timeline.append({"step": simulator.current_step, "status": step_result.get("status"),
+                             "reason": step_result.get("reason")})
+            continue
+        timeline.append({
+            "step": step_result["step"],
+            "agent_update": step_result["agent_update"],
+            "triggered_event": step_result["triggered_event"],
+            "narrative_summary": step_result["narrative_summary"]
+        })
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    return jsonify({
+        "status": "success",
+        "seed": recording.seed,
+        "steps_replayed": len(timeline),
+        "calls_replayed": replayer.calls_replayed,
+        "llm_responses_served": replayer.served,
+        "llm_errors_replayed": replayer.errors_replayed,
+        "prompt_mismatches": replayer.prompt_mismatches,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "timeline": timeline,
+        "final_state": simulator.get_current_state()
+    })
+
 @app.route('/api/simulate_with_llm', methods=['POST'])
 def simulate_with_llm():
     """使用LLM进行模拟"""
@@ -421,24 +1045,11 @@ def simulate_with_llm():
     if not config:
         return jsonify({"status": "error", "message": "故事不存在"}), 404
     
-    elements = scene_generator.extract_elements(config["scene_description"])
-    scene = scene_generator.generate_scene(elements, use_llm=use_llm)
-    agents = scene_generator.generate_agents(elements, num=config["agent_count"], use_llm=use_llm)
-    
-    simulator = Simulator()
-    timeline = simulator.run_simulation(scene, agents, steps=steps, use_llm=use_llm)
-    
-    new_data = {
-        "scene": scene,
-        "agents": agents,
-        "timeline": timeline,
-        "config": config,
-        "use_llm": use_llm
-    }
-    
+    reset_story_runtime(story_name)
+    new_data, timeline = generate_simulation_data(story_name, config, steps=steps, use_llm=use_llm)
     save_story_data(story_name, new_data)
     
-    return jsonify({"status": "success", "data": new_data})
+    return jsonify({"status": "success", "data": new_data, "timeline": timeline})
 
 @app.route('/llm_config')
 def llm_config():
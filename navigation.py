@@ -0,0 +1,161 @@
+# navigation.py
+import hashlib
+import json
+import math
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# 按场景结构哈希缓存已构建的房间图，同一场景的多个模拟器共享
+_GRAPH_CACHE: Dict[str, "RoomGraph"] = {}
+_GRAPH_CACHE_LIMIT = 64
+
+
+def _room_center(room: Dict) -> Tuple[int, int]:
+    return (
+        room.get("x", 0) + room.get("width", 100) // 2,
+        room.get("y", 0) + room.get("height", 100) // 2
+    )
+
+
+def scene_structure_hash(scene_structure: Dict) -> str:
+    """计算场景结构中与导航相关部分的哈希"""
+    relevant = {
+        "rooms": [
+            [r.get("id"), r.get("x", 0), r.get("y", 0), r.get("width", 100), r.get("height", 100),
+             r.get("connections", [])]
+            for r in scene_structure.get("rooms", [])
+        ],
+        "room_relationships": [
+            [rel.get("from"), rel.get("to")] for rel in scene_structure.get("room_relationships", [])
+        ]
+    }
+    payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def get_room_graph(scene_structure: Dict) -> "RoomGraph":
+    """获取场景对应的房间图（带缓存）"""
+    key = scene_structure_hash(scene_structure)
+    graph = _GRAPH_CACHE.get(key)
+    if graph is None:
+        if len(_GRAPH_CACHE) >= _GRAPH_CACHE_LIMIT:
+            _GRAPH_CACHE.pop(next(iter(_GRAPH_CACHE)))
+        graph = RoomGraph(scene_structure)
+        _GRAPH_CACHE[key] = graph
+    return graph
+
+
+class RoomGraph:
+    """由房间 connections 与 room_relationships 构成的无向图，预先计算全源最短路径"""
+
+    def __init__(self, scene_structure: Dict):
+        self.rooms: Dict[str, Dict] = {
+            room["id"]: room for room in scene_structure.get("rooms", []) if room.get("id") is not None
+        }
+        self.adjacency: Dict[str, List[str]] = {room_id: [] for room_id in self.rooms}
+
+        edges = []
+        for room in self.rooms.values():
+            for connection_id in room.get("connections", []):
+                edges.append((room["id"], connection_id))
+        for relationship in scene_structure.get("room_relationships", []):
+            edges.append((relationship.get("from"), relationship.get("to")))
+        for a, b in edges:
+            if a in self.rooms and b in self.rooms and a != b:
+                if b not in self.adjacency[a]:
+                    self.adjacency[a].append(b)
+                if a not in self.adjacency[b]:
+                    self.adjacency[b].append(a)
+
+        # next_hop[(起点, 终点)] -> 下一个房间；distance[(起点, 终点)] -> 经过的房间数
+        self.next_hop: Dict[Tuple[str, str], str] = {}
+        self.distance: Dict[Tuple[str, str], int] = {}
+        self._precompute_paths()
+
+        # 房间边界的均匀网格索引：格子 -> 与之相交的房间（保持房间顺序），room_at 只检查所在格子
+        self._cell_size = self._choose_cell_size()
+        self._grid: Dict[Tuple[int, int], List[str]] = {}
+        for room_id, room in self.rooms.items():
+            rx, ry = room.get("x", 0), room.get("y", 0)
+            for cx in range(self._cell(rx), self._cell(rx + room.get("width", 100)) + 1):
+                for cy in range(self._cell(ry), self._cell(ry + room.get("height", 100)) + 1):
+                    self._grid.setdefault((cx, cy), []).append(room_id)
+
+    def _choose_cell_size(self) -> float:
+        """格子边长取房间尺寸的中位数，使每个房间只覆盖少数几个格子"""
+        sizes = sorted(max(room.get("width", 100), room.get("height", 100)) for room in self.rooms.values())
+        return max(sizes[len(sizes) // 2], 1) if sizes else 100
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self._cell_size)
+
+    def _precompute_paths(self):
+        """对每个房间做一次BFS，记录到其他房间的首跳"""
+        for source in self.rooms:
+            self.distance[(source, source)] = 0
+            queue = deque()
+            for neighbor in self.adjacency[source]:
+                if (source, neighbor) not in self.distance:
+                    self.distance[(source, neighbor)] = 1
+                    self.next_hop[(source, neighbor)] = neighbor
+                    queue.append(neighbor)
+            while queue:
+                current = queue.popleft()
+                for neighbor in self.adjacency[current]:
+                    if (source, neighbor) not in self.distance:
+                        self.distance[(source, neighbor)] = self.distance[(source, current)] + 1
+                        self.next_hop[(source, neighbor)] = self.next_hop[(source, current)]
+                        queue.append(neighbor)
+
+    def room_at(self, x: float, y: float) -> Optional[str]:
+        """返回包含该坐标的房间ID（多个房间重叠时取场景中靠前的一个）"""
+        for room_id in self._grid.get((self._cell(x), self._cell(y)), ()):
+            room = self.rooms[room_id]
+            rx, ry = room.get("x", 0), room.get("y", 0)
+            if rx <= x <= rx + room.get("width", 100) and ry <= y <= ry + room.get("height", 100):
+                return room_id
+        return None
+
+    def nearest_room(self, x: float, y: float) -> Optional[str]:
+        """返回中心离该坐标最近的房间ID"""
+        best, best_dist = None, math.inf
+        for room_id, room in self.rooms.items():
+            cx, cy = _room_center(room)
+            dist = math.hypot(cx - x, cy - y)
+            if dist < best_dist:
+                best, best_dist = room_id, dist
+        return best
+
+    def is_reachable(self, source: str, target: str) -> bool:
+        return (source, target) in self.distance
+
+    def room_path(self, source: str, target: str) -> Optional[List[str]]:
+        """返回从source到target经过的房间序列（含两端），不可达返回None"""
+        if not self.is_reachable(source, target):
+            return None
+        path = [source]
+        while path[-1] != target:
+            path.append(self.next_hop[(path[-1], target)])
+        return path
+
+    def plan_route(self, source: str, destination: Dict) -> Optional[List[Dict]]:
+        """
+        把跨房间的目标坐标转换为路点序列。
+
+        每个路点为 {"room": 房间ID, "x": .., "y": ..}：中途房间取房间中心，最后一个路点为目标坐标。
+        destination 带有 "room"（计划校验时已确定的目标房间）时直接使用，否则按坐标查找。
+        """
+        target = destination.get("room")
+        if target not in self.rooms:
+            target = self.room_at(destination["x"], destination["y"])
+        if target is None or source not in self.rooms:
+            return None
+        path = self.room_path(source, target)
+        if path is None:
+            return None
+        waypoints = []
+        for room_id in path[1:-1]:
+            cx, cy = _room_center(self.rooms[room_id])
+            waypoints.append({"room": room_id, "x": cx, "y": cy})
+        waypoints.append({"room": target, "x": destination["x"], "y": destination["y"]})
+        return waypoints
@@ -0,0 +1,155 @@
+# outline_index.py
+import re
+from typing import Dict, List, Optional, Tuple
+
+# 触发条件中的动作关键词，按顺序取第一个出现的（与原先 move/talk/interact 的判断顺序一致）
+TRIGGER_ACTION_KEYWORDS = (
+    ("move", ("move", "移动", "前往", "走到")),
+    ("talk", ("talk", "对话", "交谈", "谈话")),
+    ("interact", ("interact", "互动", "使用")),
+    ("investigate", ("investigate", "调查")),
+    ("rest", ("rest", "休息")),
+)
+
+_WORD_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_"
+
+
+def _label_pattern(label: str) -> "re.Pattern":
+    """
+    在小写文本中查找 label（小写）的正则。
+
+    label 以字母数字开头或结尾时，该侧须是词边界（"al" 不匹配 "hall"，"room_1" 不匹配 "room_10"）；中文等没有空格分词的部分按子串匹配。
+    """
+    pattern = re.escape(label)
+    if label[0] in _WORD_CHARS:
+        pattern = f"(?<![{_WORD_CHARS}])" + pattern
+    if label[-1] in _WORD_CHARS:
+        pattern += f"(?![{_WORD_CHARS}])"
+    return re.compile(pattern)
+
+
+def _as_step(value) -> Optional[int]:
+    """把大纲中的步数（LLM可能给出 "5" 或 5.0）转换为整数，无效时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value.strip())
+    return None
+
+
+class TriggerPredicate:
+    """由 next_step_trigger 文本编译出的条件：动作类型、参与者（执行者或对话对象）与所在房间，未提到的项不限制"""
+
+    def __init__(self, action_type: Optional[str] = None, participants: Optional[frozenset] = None,
+                 location: Optional[str] = None):
+        self.action_type = action_type
+        self.participants = participants
+        self.location = location
+
+    @classmethod
+    def compile(cls, condition: str, agent_names: List[str], rooms: List[Dict]) -> "TriggerPredicate":
+        text = str(condition or "").lower()
+        if not text:
+            return cls()
+        action_type = None
+        for candidate, keywords in TRIGGER_ACTION_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                action_type = candidate
+                break
+        # 长名字优先，匹配到的位置从文本中去掉，"张三" 中的 "三" 不再单独算作参与者
+        names = set()
+        remaining = text
+        for name in sorted({name.lower() for name in agent_names if name}, key=len, reverse=True):
+            pattern = _label_pattern(name)
+            if pattern.search(remaining):
+                names.add(name)
+                remaining = pattern.sub(" ", remaining)
+        # 多个房间被提到时取匹配标签最长的（"大厅" 与 "厅" 都出现时是大厅），同长时取靠前的房间
+        location, longest = None, 0
+        for room in rooms:
+            for label in (room.get("id"), room.get("name")):
+                label = str(label).lower() if label else ""
+                if len(label) > longest and _label_pattern(label).search(text):
+                    location, longest = room.get("id"), len(label)
+        return cls(action_type, frozenset(names) or None, location)
+
+    def matches(self, agent_update: Dict, agent_name: Optional[str]) -> bool:
+        action = agent_update.get("action", {})
+        if self.action_type is not None and action.get("action_type") != self.action_type:
+            return False
+        if self.participants is not None:
+            involved = {str(agent_name).lower(), str(action.get("target", "")).lower()}
+            if not involved & self.participants:
+                return False
+        if self.location is not None and agent_update.get("current_room") != self.location:
+            return False
+        return True
+
+    def to_dict(self) -> Dict:
+        return {
+            "action_type": self.action_type,
+            "participants": sorted(self.participants) if self.participants else None,
+            "location": self.location
+        }
+
+
+class OutlineIndex:
+    """
+    模拟初始化时对故事大纲的一次性编译。
+
+    按步数索引关键事件（附带编译好的触发条件）、情节节点（plot_milestones）与角色发展节点
+    （character_arcs.development_steps），每次查询只涉及该步的条目。
+    """
+
+    def __init__(self, outline: Optional[Dict], agents: List[Dict], rooms: List[Dict]):
+        outline = outline or {}
+        agent_names = [str(agent.get("name", "")) for agent in agents]
+        self.agent_names: Dict[int, str] = {agent.get("id"): str(agent.get("name", "")) for agent in agents}
+        self.events: Dict[int, List[Tuple[Dict, TriggerPredicate]]] = {}
+        # 大纲可能来自LLM：步数统一转换为整数，无效的条目跳过
+        for event in outline.get("key_events", []):
+            step = _as_step(event.get("step")) if isinstance(event, dict) else None
+            if step is None:
+                continue
+            predicate = TriggerPredicate.compile(event.get("next_step_trigger", ""), agent_names, rooms)
+            self.events.setdefault(step, []).append((event, predicate))
+        self.milestones: Dict[int, List[Dict]] = {}
+        for milestone in outline.get("plot_milestones", []):
+            step = _as_step(milestone.get("step")) if isinstance(milestone, dict) else None
+            if step is not None:
+                self.milestones.setdefault(step, []).append(milestone)
+        self.arc_developments: Dict[int, List[Dict]] = {}
+        for arc in outline.get("character_arcs", []):
+            if not isinstance(arc, dict):
+                continue
+            for step in arc.get("development_steps") or []:
+                step = _as_step(step)
+                if step is not None:
+                    self.arc_developments.setdefault(step, []).append(arc)
+
+    def events_at(self, step: int) -> List[Dict]:
+        return [event for event, _ in self.events.get(step, [])]
+
+    def event_at(self, step: int) -> Optional[Dict]:
+        """该步的第一个关键事件"""
+        entries = self.events.get(step)
+        return entries[0][0] if entries else None
+
+    def milestones_at(self, step: int) -> List[Dict]:
+        return self.milestones.get(step, [])
+
+    def arcs_at(self, step: int) -> List[Dict]:
+        """在该步有发展节点的角色弧线"""
+        return self.arc_developments.get(step, [])
+
+    def check(self, step: int, agent_update: Dict) -> Optional[Dict]:
+        """返回该步第一个被 agent_update 触发的关键事件"""
+        agent_name = self.agent_names.get(agent_update.get("agent_id"))
+        for event, predicate in self.events.get(step, []):
+            if predicate.matches(agent_update, agent_name):
+                return event
+        return None
@@ -0,0 +1,188 @@
+# persistence.py
+import atexit
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Optional
+
+# 写后队列默认每隔多少秒把积压的故事状态写盘一次
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+_open_queues = weakref.WeakSet()
+
+
+class _PendingWrite:
+    """一个故事尚未写盘的状态：最新的数据快照"""
+
+    __slots__ = ("data", "generation", "first_enqueued", "updates")
+
+    def __init__(self, data: Dict, generation: int):
+        self.data = data
+        # 放入时故事的丢弃代数；之后被 discard 过的旧状态写入失败时不再并回
+        self.generation = generation
+        self.first_enqueued = time.monotonic()
+        self.updates = 0
+
+    def merge(self, older: "_PendingWrite"):
+        """把写入失败的旧状态并回（数据以本对象的更新快照为准）"""
+        self.first_enqueued = min(self.first_enqueued, older.first_enqueued)
+        self.updates += older.updates
+
+
+class WriteBehindQueue:
+    """
+    故事状态的写后队列：请求线程只把快照放入队列，由后台线程每隔 flush_interval 秒写盘。
+
+    同一故事在两次写盘之间的多次更新合并为一次写入（数据取最新快照）；
+    writer(story_name, data) 负责原子写入。进程退出时写完剩余的状态。
+    """
+
+    def __init__(self, writer: Callable[[str, Dict], None],
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.writer = writer
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()   # 正在写盘的批次；discard 等它写完
+        self._flush_requested = False
+        self._writing = False
+        self._flushed_generation = 0
+        self._stopping = False
+        self._stats = {
+            "enqueued": 0, "coalesced": 0, "writes": 0, "failures": 0,
+            "last_write_ms": 0.0, "max_write_ms": 0.0, "last_lag_ms": 0.0, "max_lag_ms": 0.0
+        }
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        _open_queues.add(self)
+
+    # --- 请求线程 ---
+    def enqueue(self, story_name: str, data: Dict):
+        """放入一个故事的最新状态；data 之后不得再被修改（调用方传入快照）"""
+        with self._lock:
+            pending = self._pending.get(story_name)
+            if pending is None:
+                pending = self._pending[story_name] = _PendingWrite(data, self._generations.get(story_name, 0))
+            else:
+                pending.data = data
+                self._stats["coalesced"] += 1
+            pending.updates += 1
+            self._stats["enqueued"] += 1
+            if self.flush_interval == 0:
+                self._wakeup.notify_all()
+
+    def pending_data(self, story_name: str) -> Optional[Dict]:
+        """尚未写盘的最新数据（读取故事时优先使用，保证读到自己的写入）"""
+        with self._lock:
+            pending = self._pending.get(story_name)
+            return pending.data if pending is not None else None
+
+    def discard(self, story_name: str):
+        """丢弃一个故事尚未写盘的状态，并等待正在进行的写盘结束（整体覆盖或删除故事前调用）"""
+        with self._lock:
+            self._pending.pop(story_name, None)
+            # 正在写的这一批若失败，其中该故事的旧状态不再放回队列
+            self._generations[story_name] = self._generations.get(story_name, 0) + 1
+        with self._write_lock:
+            pass
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """立即写出全部积压的状态并等待完成"""
+        with self._lock:
+            if not self._pending and not self._writing:
+                return True
+            # 正在写的这一批不包含之后放入的状态，需要再等下一批
+            target = self._flushed_generation + (2 if self._writing else 1)
+            self._flush_requested = True
+            self._wakeup.notify_all()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._flushed_generation < target and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(remaining)
+        return True
+
+    def close(self):
+        """写完剩余状态后停止后台线程"""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._thread.join()
+        _open_queues.discard(self)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            oldest = min((pending.first_enqueued for pending in self._pending.values()), default=None)
+            return dict(
+                self._stats,
+                queue_depth=sum(pending.updates for pending in self._pending.values()),
+                pending_stories=len(self._pending),
+                oldest_pending_ms=round((now - oldest) * 1000, 3) if oldest is not None else 0.0,
+                flush_interval=self.flush_interval
+            )
+
+    # --- 后台线程 ---
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and not self._flush_requested:
+                    self._wakeup.wait(self.flush_interval if self.flush_interval > 0 else None)
+                stopping = self._stopping
+                self._flush_requested = False
+                batch, self._pending = self._pending, {}
+                self._writing = bool(batch)
+                # 持有写锁后才释放队列锁，discard 总能等到这一批写完
+                self._write_lock.acquire()
+            try:
+                self._write_batch(batch)
+            finally:
+                self._write_lock.release()
+            with self._lock:
+                self._writing = False
+                self._flushed_generation += 1
+                self._wakeup.notify_all()
+                if stopping:
+                    if self._pending:
+                        print(f"退出时仍有 {len(self._pending)} 个故事的状态未能写盘")
+                    return
+
+    def _write_batch(self, batch: Dict[str, _PendingWrite]):
+        for story_name, pending in batch.items():
+            started = time.monotonic()
+            try:
+                self.writer(story_name, pending.data)
+            except Exception as e:
+                print(f"写入故事 {story_name} 失败: {e}")
+                with self._lock:
+                    self._stats["failures"] += 1
+                    if pending.generation != self._generations.get(story_name, 0):
+                        # 写盘期间故事已被丢弃（删除或整体替换），旧状态作废
+                        continue
+                    newer = self._pending.get(story_name)
+                    if newer is not None:
+                        newer.merge(pending)
+                    else:
+                        self._pending[story_name] = pending
+                continue
+            finished = time.monotonic()
+            write_ms = (finished - started) * 1000
+            lag_ms = (finished - pending.first_enqueued) * 1000
+            with self._lock:
+                self._stats["writes"] += 1
+                self._stats["last_write_ms"] = round(write_ms, 3)
+                self._stats["max_write_ms"] = round(max(self._stats["max_write_ms"], write_ms), 3)
+                self._stats["last_lag_ms"] = round(lag_ms, 3)
+                self._stats["max_lag_ms"] = round(max(self._stats["max_lag_ms"], lag_ms), 3)
+
+
+@atexit.register
+def _close_open_queues():
+    for queue in list(_open_queues):
+        try:
+            queue.close()
+        except Exception as e:
+            print(f"关闭写后队列失败: {e}")
@@ -0,0 +1,182 @@
+# plan_validator.py
+from typing import Dict, List, Optional, Tuple
+from navigation import RoomGraph
+
+VALID_ACTION_TYPES = ("move", "talk", "interact", "investigate", "rest")
+
+
+class PlanValidator:
+    """
+    在执行前按当前世界状态一次性检查导演计划。
+
+    能在本地修复的问题直接修复（名字映射为ID、把目的地限制在可达房间内、为跨房间对话插入移动），
+    无法修复的动作被丢弃，并给出修复报告。
+    """
+
+    def __init__(self, agent_states: List[Dict], room_graph: RoomGraph):
+        self.room_graph = room_graph
+        self.agents_by_id: Dict[int, Dict] = {agent["id"]: agent for agent in agent_states}
+        self.agents_by_name: Dict[str, Dict] = {
+            str(agent["name"]).strip().lower(): agent for agent in agent_states
+        }
+        # 随计划推进的模拟世界：每个智能体所在房间与坐标
+        self.rooms: Dict[int, Optional[str]] = {agent["id"]: agent.get("current_room") for agent in agent_states}
+        self.positions: Dict[int, Dict] = {
+            agent["id"]: dict(agent.get("position", {"x": 0, "y": 0})) for agent in agent_states
+        }
+
+    def validate(self, plan: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """返回 (修复后的计划, 报告)"""
+        report = {"input": len(plan), "kept": 0, "inserted": 0, "fixed": [], "dropped": []}
+        validated: List[Dict] = []
+
+        for index, raw_action in enumerate(plan):
+            if not isinstance(raw_action, dict):
+                report["dropped"].append(f"#{index}: 动作不是对象")
+                continue
+            action = dict(raw_action)
+            fixes: List[str] = []
+            repaired = self._validate_action(index, action, fixes, report)
+            if repaired is None:
+                continue
+            report["fixed"].extend(fixes)
+            validated.extend(repaired)
+            report["kept"] += 1
+
+        report["survival_ratio"] = round(report["kept"] / len(plan), 3) if plan else 0.0
+        return validated, report
+
+    def _validate_action(self, index: int, action: Dict, fixes: List[str], report: Dict) -> Optional[List[Dict]]:
+        agent = self._resolve_agent(action.get("agent_id"))
+        if agent is None and action.get("agent_name") is not None:
+            agent = self._resolve_agent(action.get("agent_name"))
+        if agent is None:
+            report["dropped"].append(f"#{index}: 未知的智能体 {action.get('agent_id')!r}")
+            return None
+        if action.get("agent_id") != agent["id"]:
+            fixes.append(f"#{index}: 智能体 {action.get('agent_id')!r} 映射为ID {agent['id']}")
+            action["agent_id"] = agent["id"]
+
+        action_type = str(action.get("action_type", "")).strip().lower()
+        if action_type not in VALID_ACTION_TYPES:
+            report["dropped"].append(f"#{index}: 不支持的动作类型 {action.get('action_type')!r}")
+            return None
+        action["action_type"] = action_type
+
+        if action_type == "move":
+            return self._validate_move(index, agent, action, fixes, report)
+        if action_type == "talk":
+            return self._validate_talk(index, agent, action, fixes, report)
+        if action_type == "interact" and action.get("target") is not None:
+            target = self._resolve_agent(action.get("target"))
+            if target is not None and action["target"] != target["name"]:
+                fixes.append(f"#{index}: 互动对象 {action['target']!r} 映射为 {target['name']}")
+                action["target"] = target["name"]
+        return [action]
+
+    def _validate_move(self, index: int, agent: Dict, action: Dict, fixes: List[str], report: Dict) -> Optional[List[Dict]]:
+        destination = action.get("destination")
+        try:
+            x, y = float(destination["x"]), float(destination["y"])
+        except (TypeError, KeyError, ValueError):
+            report["dropped"].append(f"#{index}: 移动缺少有效的目的地")
+            return None
+        x, y = _as_number(x), _as_number(y)
+
+        current_room = self.rooms.get(agent["id"])
+        if current_room in self.room_graph.rooms and self._room_contains(current_room, x, y):
+            target_room = current_room
+        else:
+            target_room = self.room_graph.room_at(x, y)
+        if target_room is None or (current_room and not self.room_graph.is_reachable(current_room, target_room)):
+            # 目的地不在任何可达房间内：限制到最近的可达房间（否则为当前房间）
+            candidate = self.room_graph.nearest_room(x, y)
+            if current_room and (candidate is None or not self.room_graph.is_reachable(current_room, candidate)):
+                candidate = current_room
+            if candidate is None:
+                report["dropped"].append(f"#{index}: 场景中没有可移动的房间")
+                return None
+            clamped = self._clamp_to_room(x, y, candidate)
+            fixes.append(f"#{index}: 目的地 ({x}, {y}) 限制到房间 {candidate} 内的 ({clamped['x']}, {clamped['y']})")
+            x, y, target_room = clamped["x"], clamped["y"], candidate
+
+        action["destination"] = {"x": x, "y": y, "room": target_room}
+        self.rooms[agent["id"]] = target_room
+        self.positions[agent["id"]] = {"x": x, "y": y}
+        return [action]
+
+    def _validate_talk(self, index: int, agent: Dict, action: Dict, fixes: List[str], report: Dict) -> Optional[List[Dict]]:
+        target = self._resolve_agent(action.get("target"))
+        if target is None:
+            report["dropped"].append(f"#{index}: 未知的对话对象 {action.get('target')!r}")
+            return None
+        if target["id"] == agent["id"]:
+            report["dropped"].append(f"#{index}: 不能与自己对话")
+            return None
+        if action.get("target") != target["name"]:
+            fixes.append(f"#{index}: 对话对象 {action.get('target')!r} 映射为 {target['name']}")
+            action["target"] = target["name"]
+
+        speaker_room = self.rooms.get(agent["id"])
+        target_room = self.rooms.get(target["id"])
+        if speaker_room == target_room:
+            return [action]
+
+        # 对象在其他房间：按房间路径逐跳插入移动，每一跳都在相邻房间内，任何执行模式下都能一步完成
+        path = self.room_graph.room_path(speaker_room, target_room) if speaker_room and target_room else None
+        if path is None:
+            report["dropped"].append(f"#{index}: {target['name']} 所在房间不可达")
+            return None
+        moves = []
+        for room_id in path[1:]:
+            if room_id == target_room:
+                destination = dict(self.positions[target["id"]])
+            else:
+                destination = self._room_center(room_id)
+            destination["room"] = room_id
+            moves.append({
+                "agent_id": agent["id"],
+                "action_type": "move",
+                "destination": destination,
+                "reasoning": f"前往{room_id}与{target['name']}对话"
+            })
+        self.rooms[agent["id"]] = target_room
+        self.positions[agent["id"]] = dict(self.positions[target["id"]])
+        report["inserted"] += len(moves)
+        fixes.append(f"#{index}: 为与 {target['name']} 对话插入 {len(moves)} 个移动")
+        return moves + [action]
+
+    def _resolve_agent(self, reference) -> Optional[Dict]:
+        """把ID、数字字符串或名字（不区分大小写）解析为智能体"""
+        if reference is None or isinstance(reference, bool):
+            return None
+        if isinstance(reference, int):
+            return self.agents_by_id.get(reference)
+        text = str(reference).strip()
+        if text.isdigit() and int(text) in self.agents_by_id:
+            return self.agents_by_id[int(text)]
+        return self.agents_by_name.get(text.lower())
+
+    def _room_center(self, room_id: str) -> Dict:
+        room = self.room_graph.rooms[room_id]
+        return {
+            "x": room.get("x", 0) + room.get("width", 100) // 2,
+            "y": room.get("y", 0) + room.get("height", 100) // 2
+        }
+
+    def _room_contains(self, room_id: str, x, y) -> bool:
+        room = self.room_graph.rooms[room_id]
+        rx, ry = room.get("x", 0), room.get("y", 0)
+        return rx <= x <= rx + room.get("width", 100) and ry <= y <= ry + room.get("height", 100)
+
+    def _clamp_to_room(self, x, y, room_id: str) -> Dict:
+        room = self.room_graph.rooms[room_id]
+        rx, ry = room.get("x", 0), room.get("y", 0)
+        return {
+            "x": min(max(x, rx), rx + room.get("width", 100)),
+            "y": min(max(y, ry), ry + room.get("height", 100))
+        }
+
+
+def _as_number(value: float):
+    return int(value) if float(value).is_integer() else value
@@ -0,0 +1,473 @@
+# planners.py
+import contextvars
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from navigation import get_room_graph
+
+# 可按故事选择的导演后端：llm 只用LLM导演；local 只用本地规则；auto 优先LLM，超时或失败时改用本地规则；
+# lod 只把最重要的几个智能体交给LLM（auto），其余由本地规则推进
+PLANNERS = ("llm", "local", "auto", "lod")
+DEFAULT_PLANNER = "auto"
+
+# auto 模式下等待LLM的最长时间（秒）；失败后在 RETRY_AFTER 秒内直接使用本地规则
+LLM_PLAN_TIMEOUT = 30.0
+LLM_RETRY_AFTER = 60.0
+
+LOW_ENERGY = 30
+
+# 分级细节：每步交给LLM的焦点智能体数量与各项重要度
+DEFAULT_FOCAL_COUNT = 4
+EVENT_PARTICIPANT_SCORE = 10.0
+VIEWER_FOCUS_SCORE = 8.0
+INTERACTION_SCORE = 2.0
+FOCAL_RETENTION_SCORE = 1.0     # 上一步已是焦点的智能体略微加分，避免频繁升降级
+INTERACTION_DECAY = 0.5
+
+# 性格对各类动作的偏好（中英文特质均可）
+TRAIT_WEIGHTS = {
+    "curious": {"investigate": 2.0, "move": 1.0},
+    "好奇": {"investigate": 2.0, "move": 1.0},
+    "brave": {"move": 1.5, "interact": 1.0},
+    "勇敢": {"move": 1.5, "interact": 1.0},
+    "cautious": {"rest": 1.0, "investigate": 1.0},
+    "谨慎": {"rest": 1.0, "investigate": 1.0},
+    "greedy": {"interact": 2.0},
+    "贪婪": {"interact": 2.0},
+    "optimistic": {"talk": 1.5},
+    "乐观": {"talk": 1.5},
+    "skeptical": {"investigate": 1.5},
+    "怀疑": {"investigate": 1.5},
+    "playful": {"talk": 1.5, "move": 1.0},
+    "活泼": {"talk": 1.5, "move": 1.0},
+    "melancholic": {"rest": 1.5},
+    "忧郁": {"rest": 1.5},
+    "friendly": {"talk": 2.0},
+    "友善": {"talk": 2.0},
+    "外向": {"talk": 2.0}
+}
+# 目标中的关键词对动作的偏好
+GOAL_KEYWORDS = {
+    "talk": ("friend", "argument", "protect", "朋友", "争论", "保护", "说服"),
+    "investigate": ("find", "mystery", "solve", "lost", "寻找", "谜", "调查", "真相", "线索"),
+    "move": ("reach", "explore", "到达", "探索", "前往")
+}
+BASE_WEIGHTS = {"move": 1.0, "talk": 1.0, "interact": 0.5, "investigate": 1.0, "rest": 0.3}
+ALL_PARTICIPANTS = ("所有角色", "all", "everyone")
+
+DIALOGUE_TEMPLATES = (
+    "{target}，我正想{goal}，你有什么线索吗？",
+    "{target}，你在这里看到什么奇怪的事了吗？",
+    "嗨，{target}！要不要一起{goal}？",
+    "{target}，我总觉得这里不太对劲。"
+)
+EVENT_DIALOGUE_TEMPLATE = "{target}，{event}——你怎么看？"
+
+
+def current_key_event(context: Dict) -> Optional[Dict]:
+    """大纲中当前步的关键事件（优先使用模拟器按步编译好的索引结果）"""
+    if "current_key_event" in context:
+        return context["current_key_event"]
+    current_step = context.get("current_step", 0)
+    for event in context.get("story_outline", {}).get("key_events", []):
+        if event.get("step") == current_step:
+            return event
+    return None
+
+
+def event_participant_ids(event: Optional[Dict], agents: List[Dict]) -> List[int]:
+    """关键事件 participants 对应的智能体ID（"所有角色" 表示全部）"""
+    if not event:
+        return []
+    names = [str(name).strip().lower() for name in event.get("participants", [])]
+    if any(name in ALL_PARTICIPANTS for name in names):
+        return [agent["id"] for agent in agents]
+    return [agent["id"] for agent in agents if str(agent["name"]).lower() in names]
+
+
+class Planner(ABC):
+    """
+    导演后端接口：根据模拟器提供的上下文返回 (剧情摘要, 动作计划)。
+
+    上下文包含 scene_structure、current_step、other_agents（含性格、目标、能量、所在房间）与 story_outline；
+    返回的计划在执行前会经过 PlanValidator 校验。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def generate_step_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
+        ...
+
+
+class LocalHeuristicPlanner(Planner):
+    """
+    不调用LLM的规则导演：按性格、目标、能量、房间内的人数与大纲中当前步的关键事件为每个智能体选择一个动作。
+
+    使用模拟器的随机源，同一种子下生成的计划可复现。
+    """
+
+    name = "local"
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+
+    def generate_step_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
+        agents = context.get("other_agents", [])
+        scene_structure = context.get("scene_structure", {})
+        graph = get_room_graph(scene_structure)
+        rooms_by_id = graph.rooms
+        # 规划过程中跟踪每个智能体所在的房间，保证对话对象与说话者在同一房间
+        agent_rooms = {agent["id"]: agent.get("current_room") for agent in agents}
+        occupants: Dict[str, List[Dict]] = {}
+        for agent in agents:
+            occupants.setdefault(agent.get("current_room"), []).append(agent)
+
+        plan: List[Dict] = []
+        story_beats: List[str] = []
+        planned = set()
+
+        # 只为 planned_agent_ids 中的智能体安排动作（分级细节模式下的背景智能体），其余只作为房间里的人
+        allowed = context.get("planned_agent_ids")
+        planned_agents = agents if allowed is None else [agent for agent in agents if agent["id"] in allowed]
+
+        event = self._current_event(context)
+        if event:
+            story_beats.append(event.get("description", ""))
+            for action in self._plan_event(event, planned_agents, agent_rooms, occupants, rooms_by_id):
+                plan.append(action)
+                planned.add(action["agent_id"])
+        event_actions = len(plan)
+
+        for agent in planned_agents:
+            if agent["id"] in planned:
+                continue
+            action = self._plan_agent(agent, agent_rooms, occupants, graph)
+            if action:
+                plan.append(action)
+
+        story_beats.extend(self._describe(action, agents, rooms_by_id) for action in plan[event_actions:event_actions + 3])
+        narrative = "；".join(beat for beat in story_beats if beat) or "世界暂时平静。"
+        return narrative, plan
+
+    def _current_event(self, context: Dict) -> Optional[Dict]:
+        return current_key_event(context)
+
+    def _plan_event(self, event: Dict, agents: List[Dict], agent_rooms: Dict, occupants: Dict,
+                    rooms_by_id: Dict) -> List[Dict]:
+        """关键事件的参与者先前往事件地点，已在同一房间的参与者互相交谈"""
+        participant_ids = set(event_participant_ids(event, agents))
+        participants = [agent for agent in agents if agent["id"] in participant_ids]
+        if not participants:
+            return []
+
+        location = str(event.get("location") or "")
+        target_room = next(
+            (room_id for room_id, room in rooms_by_id.items()
+             if location and (location == room_id or location in str(room.get("name", "")))),
+            None
+        )
+        actions = []
+        for agent in participants:
+            if target_room and agent_rooms.get(agent["id"]) != target_room:
+                actions.append(self._move(agent, target_room, rooms_by_id, agent_rooms, occupants,
+                                          f"前往{rooms_by_id[target_room].get('name', target_room)}参与事件"))
+        meeting_room = target_room or agent_rooms.get(participants[0]["id"])
+        gathered = [agent for agent in participants if agent_rooms.get(agent["id"]) == meeting_room]
+        for speaker, listener in zip(gathered, gathered[1:]):
+            actions.append(self._talk(
+                speaker, listener, event.get("description", ""),
+                dialogue=EVENT_DIALOGUE_TEMPLATE.format(target=listener["name"], event=event.get("description", "这件事"))
+            ))
+        return actions
+
+    def _plan_agent(self, agent: Dict, agent_rooms: Dict, occupants: Dict, graph) -> Optional[Dict]:
+        room_id = agent_rooms.get(agent["id"])
+        room = graph.rooms.get(room_id, {})
+        others = [other for other in occupants.get(room_id, []) if other["id"] != agent["id"]]
+
+        weights = dict(BASE_WEIGHTS)
+        for trait in agent.get("personality", []):
+            for action_type, bonus in TRAIT_WEIGHTS.get(str(trait).strip().lower(), {}).items():
+                weights[action_type] += bonus
+        goal = str(agent.get("goal", "")).lower()
+        for action_type, keywords in GOAL_KEYWORDS.items():
+            if any(keyword in goal for keyword in keywords):
+                weights[action_type] += 1.5
+        if agent.get("energy", 100) < LOW_ENERGY:
+            weights["rest"] += 5.0
+        if not room.get("key_items"):
+            weights["interact"] = 0.0
+        neighbors = graph.adjacency.get(room_id, [])
+        if not neighbors:
+            weights["move"] = 0.0
+
+        action_type = self._weighted_choice(weights)
+        if action_type == "talk":
+            if others:
+                return self._talk(agent, self.rng.choice(others), agent.get("goal", ""))
+            # 房间里没人可聊：去相邻房间中人最多的地方
+            if not neighbors:
+                return {"agent_id": agent["id"], "action_type": "investigate", "reasoning": "四下无人，独自调查"}
+            target_room = max(neighbors, key=lambda neighbor: (len(occupants.get(neighbor, [])), self.rng.random()))
+            return self._move(agent, target_room, graph.rooms, agent_rooms, occupants, "寻找可以交谈的人")
+        if action_type == "move":
+            target_room = self._goal_room(goal, graph.rooms) or self.rng.choice(neighbors)
+            if target_room == room_id:
+                return {"agent_id": agent["id"], "action_type": "investigate", "reasoning": "已到达目标地点，四处查看"}
+            return self._move(agent, target_room, graph.rooms, agent_rooms, occupants, f"为了{agent.get('goal', '探索')}四处走动")
+        if action_type == "interact":
+            return {
+                "agent_id": agent["id"],
+                "action_type": "interact",
+                "target": self.rng.choice(room["key_items"]),
+                "reasoning": "被房间里的物品吸引"
+            }
+        if action_type == "rest":
+            return {"agent_id": agent["id"], "action_type": "rest", "reasoning": "感到疲惫，需要休息"}
+        return {"agent_id": agent["id"], "action_type": "investigate", "reasoning": f"调查与{agent.get('goal', '目标')}有关的线索"}
+
+    def _weighted_choice(self, weights: Dict[str, float]) -> str:
+        total = sum(weights.values())
+        pick = self.rng.random() * total
+        for action_type, weight in weights.items():
+            pick -= weight
+            if pick < 0:
+                return action_type
+        return "investigate"
+
+    def _goal_room(self, goal: str, rooms_by_id: Dict) -> Optional[str]:
+        """目标中提到的房间（如 reach the town hall）"""
+        for room_id, room in rooms_by_id.items():
+            name = str(room.get("name", "")).lower()
+            if name and name in goal:
+                return room_id
+        return None
+
+    def _move(self, agent: Dict, room_id: str, rooms_by_id: Dict, agent_rooms: Dict, occupants: Dict,
+              reasoning: str) -> Dict:
+        room = rooms_by_id[room_id]
+        width, height = room.get("width", 100), room.get("height", 100)
+        destination = {
+            "x": room.get("x", 0) + width // 2 + self.rng.randint(-width // 4, width // 4),
+            "y": room.get("y", 0) + height // 2 + self.rng.randint(-height // 4, height // 4)
+        }
+        previous = agent_rooms.get(agent["id"])
+        if agent in occupants.get(previous, []):
+            occupants[previous].remove(agent)
+        occupants.setdefault(room_id, []).append(agent)
+        agent_rooms[agent["id"]] = room_id
+        return {"agent_id": agent["id"], "action_type": "move", "destination": destination, "reasoning": reasoning}
+
+    def _talk(self, speaker: Dict, listener: Dict, topic: str, dialogue: Optional[str] = None) -> Dict:
+        if dialogue is None:
+            dialogue = self.rng.choice(DIALOGUE_TEMPLATES).format(target=listener["name"], goal=topic or "四处看看")
+        return {
+            "agent_id": speaker["id"],
+            "action_type": "talk",
+            "target": listener["name"],
+            "dialogue": dialogue,
+            "reasoning": f"{speaker['name']}想和{listener['name']}聊聊"
+        }
+
+    def _describe(self, action: Dict, agents: List[Dict], rooms_by_id: Dict) -> str:
+        name = next((agent["name"] for agent in agents if agent["id"] == action["agent_id"]), "某人")
+        action_type = action["action_type"]
+        if action_type == "move":
+            return f"{name}{action['reasoning']}"
+        if action_type == "talk":
+            return f"{name}与{action['target']}交谈"
+        if action_type == "interact":
+            return f"{name}查看{action['target']}"
+        if action_type == "rest":
+            return f"{name}停下来休息"
+        return f"{name}四处调查"
+
+
+class FallbackPlanner(Planner):
+    """
+    优先使用主导演（LLM），超时、出错或返回空计划时改用备用导演（本地规则）。
+
+    主导演失败后的 retry_after 秒内不再尝试，避免LLM不可用时每一步都等待超时。
+    走哪个分支取决于时钟，录制时经 plan_listener 记下每次计划的来源，回放时由 replay_sources 按录制的来源执行。
+    """
+
+    name = "auto"
+
+    def __init__(self, primary: Planner, fallback: Planner,
+                 timeout: Optional[float] = LLM_PLAN_TIMEOUT, retry_after: float = LLM_RETRY_AFTER):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.last_source: Optional[str] = None
+        self.stats = {"primary": 0, "fallback": 0, "timeouts": 0, "failures": 0}
+        self._unavailable_until = 0.0
+        # 录制：每次计划后以 (来源, 是否调用过主导演) 调用；回放：按顺序给出录制的 {"source", "primary_attempted"}
+        self.plan_listener: Optional[Callable[[str, bool], None]] = None
+        self.replay_sources: Optional[Iterator[Dict]] = None
+
+    def generate_step_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
+        if self.replay_sources is not None:
+            return self._replay_plan(context)
+        attempted = time.monotonic() >= self._unavailable_until
+        if attempted:
+            result = self._call_primary(context)
+            if result is not None and result[1]:
+                self.stats["primary"] += 1
+                self._set_source(self.primary.name, attempted)
+                return result
+            if result is not None:
+                self.stats["failures"] += 1
+            self._unavailable_until = time.monotonic() + self.retry_after
+
+        self.stats["fallback"] += 1
+        self._set_source(self.fallback.name, attempted)
+        return self.fallback.generate_step_plan(context)
+
+    def _set_source(self, source: str, primary_attempted: bool):
+        self.last_source = source
+        if self.plan_listener is not None:
+            self.plan_listener(source, primary_attempted)
+
+    def _replay_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
+        """按录制的来源执行：录制时调用过主导演就同样调用一次（回放的响应按调用序号对齐），但只在录制用了主导演时采用其结果"""
+        decision = next(self.replay_sources, None)
+        if decision is None:
+            raise RuntimeError("录制中没有更多的导演计划来源，回放已偏离录制")
+        if decision.get("primary_attempted"):
+            result = self._safe_primary(context)
+            if decision["source"] == self.primary.name:
+                self.stats["primary"] += 1
+                self._set_source(self.primary.name, True)
+                return result
+        self.stats["fallback"] += 1
+        self._set_source(self.fallback.name, bool(decision.get("primary_attempted")))
+        return self.fallback.generate_step_plan(context)
+
+    def _call_primary(self, context: Dict) -> Optional[Tuple[str, List[Dict]]]:
+        """在后台线程中调用主导演；超时返回 None（迟到的结果被丢弃）"""
+        if self.timeout is None:
+            return self._safe_primary(context)
+        outcome = {}
+        # 在调用线程的上下文副本中运行，阶段计时（profiling.stage）仍记到当前请求上
+        request_context = contextvars.copy_context()
+        worker = threading.Thread(
+            target=lambda: outcome.setdefault("result", request_context.run(self._safe_primary, context)),
+            name="planner-primary",
+            daemon=True
+        )
+        worker.start()
+        worker.join(self.timeout)
+        if worker.is_alive():
+            self.stats["timeouts"] += 1
+            print(f"导演LLM超过 {self.timeout} 秒未响应，改用本地规则")
+            return None
+        return outcome.get("result")
+
+    def _safe_primary(self, context: Dict) -> Tuple[str, List[Dict]]:
+        try:
+            return self.primary.generate_step_plan(context)
+        except Exception as e:
+            print(f"导演LLM生成计划失败: {e}")
+            return "", []
+
+
+class LevelOfDetailPlanner(Planner):
+    """
+    分级细节导演：每个计划前按重要度给智能体排序，只把前 focal_count 个交给主导演（LLM），其余由背景导演（本地规则）推进。
+
+    重要度来自当前关键事件的参与者、观看者关注的智能体（上下文 focus_agent_ids）与最近的互动对象；
+    排名每次重新计算，智能体随剧情动态升降级。主导演的提示词只包含焦点智能体，因此LLM调用次数与提示词长度不随总人数增长。
+    """
+
+    name = "lod"
+
+    def __init__(self, primary: Planner, background: Planner, focal_count: int = DEFAULT_FOCAL_COUNT):
+        self.primary = primary
+        self.background = background
+        self.focal_count = max(1, int(focal_count))
+        self.focal_ids: List[int] = []
+        self.last_lod: Optional[Dict] = None
+        self._interaction_heat: Dict[int, float] = {}
+
+    @property
+    def last_source(self) -> Optional[str]:
+        return getattr(self.primary, "last_source", None) or self.primary.name
+
+    def rank_agents(self, context: Dict) -> List[Tuple[float, int]]:
+        """返回按重要度降序排列的 (分数, 智能体ID)"""
+        agents = context.get("other_agents", [])
+        scores = {agent["id"]: 0.0 for agent in agents}
+        for agent_id in event_participant_ids(current_key_event(context), agents):
+            scores[agent_id] += EVENT_PARTICIPANT_SCORE
+        for agent_id in context.get("focus_agent_ids") or []:
+            if agent_id in scores:
+                scores[agent_id] += VIEWER_FOCUS_SCORE
+        for agent_id, heat in self._interaction_heat.items():
+            if agent_id in scores:
+                scores[agent_id] += INTERACTION_SCORE * heat
+        for agent_id in self.focal_ids:
+            if agent_id in scores:
+                scores[agent_id] += FOCAL_RETENTION_SCORE
+        # 同分时按ID排序，保证结果确定
+        return sorted(((score, agent_id) for agent_id, score in scores.items()), key=lambda item: (-item[0], item[1]))
+
+    def generate_step_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
+        agents = context.get("other_agents", [])
+        ranking = self.rank_agents(context)
+        focal_ids = [agent_id for _, agent_id in ranking[:self.focal_count]]
+        focal_set = set(focal_ids)
+        background_ids = {agent["id"] for agent in agents if agent["id"] not in focal_set}
+
+        focal_context = dict(context)
+        focal_context["other_agents"] = [agent for agent in agents if agent["id"] in focal_set]
+        focal_context["background_agent_count"] = len(background_ids)
+        narrative, focal_plan = self.primary.generate_step_plan(focal_context)
+        # 主导演只能指挥焦点智能体（agent_id 也可能是名字）
+        background_names = {str(agent["name"]).lower() for agent in agents if agent["id"] in background_ids}
+        focal_plan = [action for action in focal_plan if not isinstance(action, dict) or (
+            action.get("agent_id") not in background_ids and str(action.get("agent_id")).lower() not in background_names)]
+
+        background_plan: List[Dict] = []
+        if background_ids:
+            background_context = dict(context)
+            background_context["planned_agent_ids"] = background_ids
+            _, background_plan = self.background.generate_step_plan(background_context)
+
+        previous = set(self.focal_ids)
+        self.last_lod = {
+            "focal": focal_ids,
+            "promoted": [agent_id for agent_id in focal_ids if agent_id not in previous],
+            "demoted": sorted(previous - focal_set),
+            "background": len(background_ids)
+        }
+        self.focal_ids = focal_ids
+        self._update_interactions(focal_plan + background_plan, agents)
+        return narrative, focal_plan + background_plan
+
+    def to_checkpoint(self) -> Dict:
+        return {
+            "focal_ids": self.focal_ids,
+            "interaction_heat": [[agent_id, heat] for agent_id, heat in self._interaction_heat.items()]
+        }
+
+    def restore_checkpoint(self, data: Dict):
+        self.focal_ids = list(data.get("focal_ids", []))
+        self._interaction_heat = {int(agent_id): heat for agent_id, heat in data.get("interaction_heat", [])}
+
+    def _update_interactions(self, plan: List[Dict], agents: List[Dict]):
+        """最近互动过的智能体（对话双方）升温，其余逐步冷却"""
+        heat = {agent_id: value * INTERACTION_DECAY for agent_id, value in self._interaction_heat.items()
+                if value * INTERACTION_DECAY >= 0.05}
+        ids_by_name = {str(agent["name"]).lower(): agent["id"] for agent in agents}
+        for action in plan:
+            if not isinstance(action, dict) or action.get("action_type") != "talk":
+                continue
+            target_id = ids_by_name.get(str(action.get("target", "")).lower())
+            for agent_id in (action.get("agent_id"), target_id):
+                if isinstance(agent_id, int):
+                    heat[agent_id] = heat.get(agent_id, 0.0) + 1.0
+        self._interaction_heat = heat
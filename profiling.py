@@ -0,0 +1,189 @@
+# profiling.py
+import contextvars
+import cProfile
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# 每个故事保留最近多少次请求的阶段耗时
+STATS_WINDOW = 200
+PROFILE_DIR = "profiles"
+# 折叠调用栈的最大深度（防止递归调用展开过深）
+MAX_STACK_DEPTH = 64
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    一次请求内的阶段计时器：同名阶段的耗时累加，阶段可以嵌套（如 plan 包含 prompt/llm/parse）。
+
+    通过 activate() 设为当前上下文的计时器后，任何位置都可以用模块级的 stage() 计时，无需层层传参。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def activate(self):
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, float]:
+        timings = {name: round(duration, 3) for name, duration in self.stages.items()}
+        timings["total"] = round(self.total_ms, 3)
+        return timings
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头的值，如 load;dur=1.2, llm;dur=830.5, total;dur=840.1"""
+        return ", ".join(f"{name};dur={duration:.3f}" for name, duration in self.to_dict().items())
+
+
+@contextmanager
+def stage(name: str):
+    """在当前计时器上记录一个阶段；没有激活的计时器时不做任何事"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current_timer.get()
+
+
+class StageStats:
+    """一个故事最近 STATS_WINDOW 次请求的阶段耗时，按阶段汇总 count/mean/p50/p95/max"""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, float]):
+        with self._lock:
+            self.samples.append(timings)
+            self.requests += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = list(self.samples)
+            requests = self.requests
+        by_stage: Dict[str, List[float]] = {}
+        for timings in samples:
+            for name, duration in timings.items():
+                by_stage.setdefault(name, []).append(duration)
+        stages = {}
+        for name, durations in by_stage.items():
+            durations.sort()
+            stages[name] = {
+                "count": len(durations),
+                "mean_ms": round(sum(durations) / len(durations), 3),
+                "p50_ms": round(_percentile(durations, 0.50), 3),
+                "p95_ms": round(_percentile(durations, 0.95), 3),
+                "max_ms": round(durations[-1], 3)
+            }
+        return {"requests": requests, "window": len(samples), "stages": stages}
+
+
+_story_stats: Dict[str, StageStats] = {}
+_story_stats_lock = threading.Lock()
+
+
+def record_story_timings(story_name: str, timings: Dict[str, float]):
+    with _story_stats_lock:
+        stats = _story_stats.get(story_name)
+        if stats is None:
+            stats = _story_stats[story_name] = StageStats()
+    stats.record(timings)
+
+
+def get_story_stats(story_name: str) -> Optional[Dict]:
+    stats = _story_stats.get(story_name)
+    return stats.summary() if stats is not None else None
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+# --- 按请求开启的 cProfile ---
+def save_profile(profiler: cProfile.Profile, story_path: str, label: str) -> Dict[str, str]:
+    """
+    保存一次请求的 cProfile 结果：.prof（snakeviz、pstats 可读）与折叠调用栈 .folded（flamegraph.pl、speedscope 可读）。
+
+    cProfile 只记录调用边，折叠栈按每条调用边占被调函数总耗时的比例向下分摊，是近似值。
+    cProfile 只记录开启它的线程，FallbackPlanner 在后台线程中的LLM调用不在其中。
+    """
+    profile_dir = os.path.join(story_path, PROFILE_DIR)
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, f"{label}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}")
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".folded", 'w', encoding='utf-8') as f:
+        for stack, microseconds in collapsed_stacks(pstats.Stats(profiler)):
+            f.write(f"{stack} {microseconds}\n")
+    return {"prof": base + ".prof", "folded": base + ".folded"}
+
+
+def collapsed_stacks(stats: pstats.Stats) -> List:
+    """把 pstats 的调用图展开为 [("root;caller;callee", 自身耗时微秒)]"""
+    raw = stats.stats
+    children: Dict = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in raw.items() if not entry[4]]
+    totals: Dict[str, int] = {}
+
+    def walk(func, path: List[str], share: float):
+        _, _, self_time, cumulative, _ = raw[func]
+        if cumulative * share < 1e-6:
+            # 不足1微秒的分支不再展开，避免调用图路径数爆炸
+            return
+        frame = _frame_label(func)
+        path = path + [frame]
+        micros = int(self_time * share * 1e6)
+        if micros > 0:
+            key = ";".join(path)
+            totals[key] = totals.get(key, 0) + micros
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_cumulative in children.get(func, []):
+            child_cumulative = raw[child][3]
+            if child_cumulative <= 0 or _frame_label(child) in path:
+                continue
+            walk(child, path, share * min(1.0, edge_cumulative / child_cumulative))
+
+    for root in roots:
+        walk(root, [], 1.0)
+    return sorted(totals.items())
+
+
+def _frame_label(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name.replace(";", ",")
+    return f"{os.path.basename(filename)}:{name}:{line}"
@@ -0,0 +1,195 @@
+# replay.py
+import copy
+import hashlib
+import os
+import random
+import sys
+from typing import Dict, List, Optional
+import serializer
+
+RECORDING_FILE = "recording.json"
+RECORDING_VERSION = 1
+
+
+class ReplayMismatchError(RuntimeError):
+    """回放时找不到与调用点对应的录制响应"""
+
+
+class RecordedLLMError(RuntimeError):
+    """回放录制时失败的LLM调用：在同一调用点再次抛出，保持与录制相同的分支"""
+
+
+def _prompt_digest(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def _call_site(depth: int = 2) -> str:
+    """返回调用 chat() 的位置，如 story_director.generate_step_plan"""
+    frame = sys._getframe(depth)
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class SimulationRecording:
+    """一次模拟的录制：随机种子、初始场景数据以及按调用点编号的全部LLM请求/响应"""
+
+    def __init__(self, seed: Optional[int] = None, scene_data: Optional[Dict] = None,
+                 execution_mode: str = "single", max_steps: int = 100, planner: str = "llm"):
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.scene_data = copy.deepcopy(scene_data) if scene_data is not None else None
+        self.execution_mode = execution_mode
+        self.planner = planner
+        self.max_steps = max_steps
+        self.steps_recorded = 0
+        self.llm_calls: List[Dict] = []
+        # auto/lod 导演每次计划走的分支（LLM或本地规则），回放时按此执行而不看超时
+        self.plan_sources: List[Dict] = []
+        self.dirty = False
+
+    def add_call(self, key: str, index: int, prompt: str, response: Optional[str] = None,
+                 error: Optional[BaseException] = None):
+        """记录一次调用；失败的调用记录异常信息，回放时在同一位置重新抛出"""
+        call = {
+            "key": key,
+            "index": index,
+            "prompt_sha1": _prompt_digest(prompt)
+        }
+        if error is not None:
+            call["error"] = f"{type(error).__name__}: {error}"
+        else:
+            call["response"] = response
+        self.llm_calls.append(call)
+        self.dirty = True
+
+    def add_plan_source(self, source: str, primary_attempted: bool):
+        self.plan_sources.append({"source": source, "primary_attempted": primary_attempted})
+        self.dirty = True
+
+    def calls_by_key(self) -> Dict[str, Dict[int, Dict]]:
+        """调用点 -> {该调用点的调用序号: 调用}"""
+        grouped: Dict[str, Dict[int, Dict]] = {}
+        for call in self.llm_calls:
+            grouped.setdefault(call["key"], {})[call["index"]] = call
+        return grouped
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": RECORDING_VERSION,
+            "seed": self.seed,
+            "execution_mode": self.execution_mode,
+            "planner": self.planner,
+            "max_steps": self.max_steps,
+            "steps_recorded": self.steps_recorded,
+            "scene_data": self.scene_data,
+            "llm_calls": self.llm_calls,
+            "plan_sources": self.plan_sources
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SimulationRecording":
+        recording = cls(
+            seed=data.get("seed"),
+            scene_data=data.get("scene_data"),
+            execution_mode=data.get("execution_mode", "single"),
+            max_steps=data.get("max_steps", 100),
+            planner=data.get("planner", "llm")
+        )
+        recording.steps_recorded = data.get("steps_recorded", 0)
+        recording.llm_calls = data.get("llm_calls", [])
+        recording.plan_sources = data.get("plan_sources", [])
+        return recording
+
+    def save(self, story_path: str):
+        os.makedirs(story_path, exist_ok=True)
+        with open(os.path.join(story_path, RECORDING_FILE), 'w', encoding='utf-8') as f:
+            serializer.dump(self.to_dict(), f, default=None)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, story_path: str) -> Optional["SimulationRecording"]:
+        recording_file = os.path.join(story_path, RECORDING_FILE)
+        if not os.path.exists(recording_file):
+            return None
+        with open(recording_file, 'r', encoding='utf-8') as f:
+            return cls.from_dict(serializer.load(f))
+
+
+class RecordingLLM:
+    """包装真实的LLM客户端，转发请求并记录每次响应"""
+
+    def __init__(self, llm, recording: SimulationRecording):
+        self.llm = llm
+        self.recording = recording
+        self._counters: Dict[str, int] = {}
+
+    def chat(self, user: str, *, stream: Optional[bool] = None, **kwargs) -> str:
+        key = _call_site()
+        index = self._counters.get(key, 0)
+        self._counters[key] = index + 1
+        try:
+            response = self.llm.chat(user, stream=stream, **kwargs)
+        except Exception as e:
+            self.recording.add_call(key, index, user, error=e)
+            raise
+        self.recording.add_call(key, index, user, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+class ReplayLLM:
+    """按调用点与序号返回录制的响应（录制时失败的调用重新抛出 RecordedLLMError），不发起任何网络请求"""
+
+    def __init__(self, recording: SimulationRecording):
+        self._calls = recording.calls_by_key()
+        self._counters: Dict[str, int] = {}
+        self.served = 0
+        self.errors_replayed = 0
+        self.prompt_mismatches = 0
+
+    def chat(self, user: str, *, stream: Optional[bool] = None, **kwargs) -> str:
+        key = _call_site()
+        index = self._counters.get(key, 0)
+        self._counters[key] = index + 1
+        call = self._calls.get(key, {}).get(index)
+        if call is None:
+            raise ReplayMismatchError(f"录制中没有 {key} 的第 {index + 1} 次调用")
+        if call.get("prompt_sha1") != _prompt_digest(user):
+            # 提示词不同说明世界状态已偏离录制，仍返回录制响应以保持剧情一致
+            self.prompt_mismatches += 1
+        if "error" in call:
+            self.errors_replayed += 1
+            raise RecordedLLMError(call["error"])
+        self.served += 1
+        return call["response"]
+
+    @property
+    def calls_replayed(self) -> int:
+        return self.served + self.errors_replayed
+
+
+def _llm_owners(simulator) -> List:
+    return [simulator.story_director.llm_manager, simulator.agent_manager.llm_manager,
+            simulator.outline_generator.llm_manager]
+
+
+def base_llm(llm):
+    """去掉录制包装，返回实际发起请求的LLM客户端"""
+    while isinstance(llm, RecordingLLM):
+        llm = llm.llm
+    return llm
+
+
+def attach_recorder(simulator, recording: SimulationRecording):
+    """让模拟器的所有LLM调用经过录制器"""
+    for owner in _llm_owners(simulator):
+        if not isinstance(owner.llm, RecordingLLM):
+            owner.llm = RecordingLLM(owner.llm, recording)
+
+
+def attach_replayer(simulator, recording: SimulationRecording) -> ReplayLLM:
+    """让模拟器的所有LLM调用由录制响应提供"""
+    replayer = ReplayLLM(recording)
+    for owner in _llm_owners(simulator):
+        owner.llm = replayer
+    return replayer
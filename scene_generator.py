@@ -1,18 +1,23 @@
 # scene_generator.py
 import re
 import random
-import json
 from typing import Dict, List, Tuple, Optional
 from LLM import LLMManager
 from story_outline_generator import StoryOutlineGenerator
+import serializer
 
 PLACE_KEYWORDS = ["town", "city", "village", "forest", "beach", "mountain", "station", "mall", "market", "school"]
 DEFAULT_NAMES = ["Avery", "Riley", "Jordan", "Taylor", "Morgan", "Casey", "Quinn", "Emery"]
 
 class SceneGenerator:
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
         self.llm_manager = LLMManager()
         self.outline_generator = StoryOutlineGenerator()
+        self.rng = random.Random(seed) # 独立的随机源，便于用种子复现场景
+
+    def reseed(self, seed: Optional[int]):
+        """重新设置随机种子"""
+        self.rng.seed(seed)
     
     def extract_elements(self, text):
         names = re.findall(r'\b[A-Z][a-z]{1,}\b', text)
@@ -68,14 +73,14 @@ class SceneGenerator:
         }
     
     def _generate_default_scene(self, elements):
-        typ = elements["places"][0] if elements["places"] else random.choice(PLACE_KEYWORDS)
+        typ = elements["places"][0] if elements["places"] else self.rng.choice(PLACE_KEYWORDS)
         desc_templates = [
             "A quiet {typ} bathed in late afternoon light.",
             "A bustling {typ} filled with whispered rumors.",
             "A foggy {typ} where shadows seem to move on their own.",
             "An ordinary {typ} with secrets beneath its surface."
         ]
-        description = random.choice(desc_templates).format(typ=typ)
+        description = self.rng.choice(desc_templates).format(typ=typ)
         
         outline_generator = StoryOutlineGenerator()
         scene_structure = outline_generator._generate_default_scene_structure()
@@ -104,26 +109,26 @@ class SceneGenerator:
                     personality = self._random_personality()
                     goal = arc.get("initial_state", "探索未知")
             else:
-                name = random.choice(DEFAULT_NAMES) + str(i+1)
+                name = self.rng.choice(DEFAULT_NAMES) + str(i+1)
                 personality = self._random_personality()
                 goal = self._random_goal()
             
             # 为智能体分配初始位置
             if rooms:
-                initial_room = random.choice(rooms)
+                initial_room = self.rng.choice(rooms)
                 initial_x = initial_room.get("x", 100) + initial_room.get("width", 120) // 2
                 initial_y = initial_room.get("y", 100) + initial_room.get("height", 120) // 2
             else:
-                initial_x = random.randint(50, 750)
-                initial_y = random.randint(50, 450)
+                initial_x = self.rng.randint(50, 750)
+                initial_y = self.rng.randint(50, 450)
             
             agent = {
                 "id": i,
                 "name": name,
                 "personality": personality,
                 "goal": goal,
-                "energy": random.uniform(0.8, 1.0),
-                "color": "#{:06x}".format(random.randint(0x444444, 0xFFFFFF)),
+                "energy": self.rng.uniform(0.8, 1.0),
+                "color": "#{:06x}".format(self.rng.randint(0x444444, 0xFFFFFF)),
                 "llm_enabled": use_llm,
                 "character_arc": arc if i < len(character_arcs) else None,
                 "x": initial_x,  # 添加坐标
@@ -154,7 +159,7 @@ class SceneGenerator:
             response = self.llm_manager.llm.chat(prompt)
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
-                data = json.loads(json_match.group())
+                data = serializer.loads(json_match.group())
                 return data.get("personality", self._random_personality()), data.get("goal", self._random_goal())
         except Exception as e:
             print(f"LLM生成角色失败: {e}")
@@ -163,20 +168,20 @@ class SceneGenerator:
 
     def _random_personality(self):
         traits = ["curious","brave","cautious","greedy","optimistic","skeptical","playful","melancholic"]
-        return random.sample(traits, 2)
+        return self.rng.sample(traits, 2)
 
     def _random_goal(self):
         goals = [
             "find a lost item","make a new friend","solve a mystery",
             "reach the town hall","win an argument","protect someone"
         ]
-        return random.choice(goals)
+        return self.rng.choice(goals)
 
     def _generate_default_agents(self, elements, num):
-        names = elements["names"] if elements["names"] else random.sample(DEFAULT_NAMES, num)
+        names = elements["names"] if elements["names"] else self.rng.sample(DEFAULT_NAMES, num)
         agents = []
         for i in range(num):
-            name = names[i] if i < len(names) else random.choice(DEFAULT_NAMES) + str(i+1)
+            name = names[i] if i < len(names) else self.rng.choice(DEFAULT_NAMES) + str(i+1)
             personality = self._random_personality()
             goal = self._random_goal()
             agents.append({
@@ -184,8 +189,8 @@ class SceneGenerator:
                 "name": name,
                 "personality": personality,
                 "goal": goal,
-                "energy": random.uniform(0.8, 1.0),
-                "color": "#{:06x}".format(random.randint(0x444444, 0xFFFFFF)),
+                "energy": self.rng.uniform(0.8, 1.0),
+                "color": "#{:06x}".format(self.rng.randint(0x444444, 0xFFFFFF)),
                 "llm_enabled": False,
                 "character_arc": None
             })
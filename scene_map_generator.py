@@ -1,10 +1,11 @@
 # scene_map_generator.py
 import random
 import math
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 class SceneMapGenerator:
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed) # 独立的随机源，便于用种子复现地图
         self.room_templates = {
             "town": [
                 {"name": "广场", "base_color": "#8B7355"},
@@ -79,7 +80,7 @@ class SceneMapGenerator:
         rooms = []
         
         # 选择3-5个房间
-        selected_templates = random.sample(templates, min(random.randint(3, 5), len(templates)))
+        selected_templates = self.rng.sample(templates, min(self.rng.randint(3, 5), len(templates)))
         
         for i, template in enumerate(selected_templates):
             room = {
@@ -154,11 +155,11 @@ class SceneMapGenerator:
         
         if map_type == "town":
             # 添加树木
-            for _ in range(random.randint(5, 10)):
+            for _ in range(self.rng.randint(5, 10)):
                 decorations["trees"].append({
-                    "x": random.randint(50, 750),
-                    "y": random.randint(50, 550),
-                    "size": random.randint(20, 40)
+                    "x": self.rng.randint(50, 750),
+                    "y": self.rng.randint(50, 550),
+                    "size": self.rng.randint(20, 40)
                 })
             
             # 添加喷泉
@@ -171,19 +172,19 @@ class SceneMapGenerator:
         
         elif map_type == "forest":
             # 添加更多树木
-            for _ in range(random.randint(15, 25)):
+            for _ in range(self.rng.randint(15, 25)):
                 decorations["trees"].append({
-                    "x": random.randint(50, 750),
-                    "y": random.randint(50, 550),
-                    "size": random.randint(30, 60)
+                    "x": self.rng.randint(50, 750),
+                    "y": self.rng.randint(50, 550),
+                    "size": self.rng.randint(30, 60)
                 })
             
             # 添加岩石
-            for _ in range(random.randint(3, 8)):
+            for _ in range(self.rng.randint(3, 8)):
                 decorations["rocks"].append({
-                    "x": random.randint(50, 750),
-                    "y": random.randint(50, 550),
-                    "size": random.randint(15, 30)
+                    "x": self.rng.randint(50, 750),
+                    "y": self.rng.randint(50, 550),
+                    "size": self.rng.randint(15, 30)
                 })
         
         elif map_type == "dungeon":
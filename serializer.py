@@ -0,0 +1,136 @@
+# serializer.py
+import json
+import os
+from typing import IO, Callable, Dict, List, Optional
+
+# 按优先级尝试的JSON后端；环境变量 JSON_BACKEND 可指定其中之一
+BACKEND_ORDER = ("orjson", "ujson", "json")
+
+
+class JSONBackend:
+    """一个JSON实现：dumps 返回 UTF-8 字节，默认紧凑输出、不转义非ASCII字符"""
+
+    name = "json"
+
+    def dumps(self, obj, pretty: bool = False, default: Optional[Callable] = str, sort_keys: bool = False) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, default=default, sort_keys=sort_keys,
+            indent=2 if pretty else None, separators=None if pretty else (",", ":")
+        ).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class UJSONBackend(JSONBackend):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj, pretty: bool = False, default: Optional[Callable] = str, sort_keys: bool = False) -> bytes:
+        kwargs = {"default": default} if default is not None else {}
+        return self._ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False, sort_keys=sort_keys,
+            indent=2 if pretty else 0, **kwargs
+        ).encode("utf-8")
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+
+class ORJSONBackend(JSONBackend):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, pretty: bool = False, default: Optional[Callable] = str, sort_keys: bool = False) -> bytes:
+        option = self._options
+        if pretty:
+            option |= self._orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= self._orjson.OPT_SORT_KEYS
+        return self._orjson.dumps(obj, default=default, option=option)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+_BACKEND_CLASSES = {"orjson": ORJSONBackend, "ujson": UJSONBackend, "json": JSONBackend}
+_stdlib = JSONBackend()
+
+
+def load_backend(name: str) -> JSONBackend:
+    """按名字创建后端；对应的库没有安装时抛出 ImportError"""
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"未知的JSON后端: {name}，可选: {', '.join(BACKEND_ORDER)}")
+    return _BACKEND_CLASSES[name]()
+
+
+def available_backends() -> List[str]:
+    names = []
+    for name in BACKEND_ORDER:
+        try:
+            load_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def _select_backend() -> JSONBackend:
+    preferred = os.environ.get("JSON_BACKEND")
+    names = ([preferred] if preferred else []) + [name for name in BACKEND_ORDER if name != preferred]
+    for name in names:
+        try:
+            return load_backend(name)
+        except (ImportError, ValueError) as e:
+            if name == preferred:
+                print(f"JSON后端 {preferred} 不可用，自动选择: {e}")
+    return _stdlib
+
+
+backend = _select_backend()
+
+
+# --- 模块级接口：快速后端失败时（超大整数、特殊键等）退回标准库，结果与标准库一致 ---
+# default=str 把无法序列化的值转为字符串，只用于API响应与输出流；持久化写入传 default=None，遇到这类值时报错而不是悄悄存成字符串
+def dumps_bytes(obj, pretty: bool = False, default: Optional[Callable] = str, sort_keys: bool = False) -> bytes:
+    try:
+        return backend.dumps(obj, pretty, default, sort_keys)
+    except (TypeError, ValueError, OverflowError):
+        if backend is _stdlib:
+            raise
+        return _stdlib.dumps(obj, pretty, default, sort_keys)
+
+
+def dumps(obj, pretty: bool = False, default: Optional[Callable] = str, sort_keys: bool = False) -> str:
+    return dumps_bytes(obj, pretty, default, sort_keys).decode("utf-8")
+
+
+def loads(data):
+    try:
+        return backend.loads(data)
+    except ValueError:
+        if backend is _stdlib:
+            raise
+        # 快速后端拒绝但标准库接受的输入（如 NaN），解析失败时抛出标准库的 JSONDecodeError
+        return _stdlib.loads(data)
+
+
+def dump(obj, f: IO, pretty: bool = False, default: Optional[Callable] = str):
+    """写入文本或二进制文件"""
+    data = dumps_bytes(obj, pretty, default)
+    f.write(data if "b" in getattr(f, "mode", "") else data.decode("utf-8"))
+
+
+def load(f: IO):
+    return loads(f.read())
+
+
+def info() -> Dict:
+    return {"backend": backend.name, "available": available_backends()}
@@ -1,31 +1,225 @@
 # simulator.py
+import copy
+import os
 import random
+import threading
 import time
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from LLM import LLMManager
 from agent_state_manager import AgentStateManager
 from story_director import StoryDirector
 from story_outline_generator import StoryOutlineGenerator
+from plan_validator import PlanValidator
+from replay import SimulationRecording, ReplayLLM, attach_recorder, attach_replayer, base_llm
+from event_log import EventLog, event_matches
+from checkpoint import (DEFAULT_CHECKPOINT_INTERVAL, save_checkpoint, load_checkpoint,
+                        rng_state_to_json, rng_state_from_json)
+from keyframes import KeyframeIndex, KEYFRAME_DIR, DEFAULT_KEYFRAME_INTERVAL
+from story_fork import save_fork_info
+from outline_index import OutlineIndex
+from profiling import stage
+from step_sinks import StepSink, compact_step_result
+from planners import Planner, LocalHeuristicPlanner, FallbackPlanner, LevelOfDetailPlanner, PLANNERS, DEFAULT_PLANNER
+
+# 计划执行模式：single 每次调用执行一个动作（便于逐步调试）；batch 每次执行所有互不依赖的就绪动作；
+# scheduled 用离散事件调度器一次执行完整个计划
+EXECUTION_MODES = ("single", "batch", "scheduled")
+
+# 计划校验后保留的原始动作比例低于该值时，请导演重新生成（最多 MAX_REPLANS 次）
+MIN_PLAN_SURVIVAL = 0.5
+MAX_REPLANS = 1
+
+# 内存中只保留最近的事件记录，完整历史写入磁盘上的事件日志
+EVENT_TAIL_SIZE = 50
+# 状态中附带的最近事件数；更早的历史由 query_events 分页读取
+RECENT_EVENT_COUNT = 10
+
+# 无人值守运行时，导演连续多少次未能生成计划就结束
+MAX_CONSECUTIVE_ERRORS = 3
+
+# 环境变量 AGENT_ARRAY_STORE=1 时，应用创建的模拟器用 NumPy 结构数组保存智能体的数值状态（需要安装 numpy）
+USE_ARRAY_STORE = os.environ.get("AGENT_ARRAY_STORE", "").strip().lower() in ("1", "true", "yes")
 
 class Simulator:
     _instances = {}
     
-    def __init__(self):
-        self.agent_manager = AgentStateManager()
-        self.outline_generator = StoryOutlineGenerator()
-        self.story_director = StoryDirector() # 实例化导演
+    def __init__(self, use_array_store: bool = False, llm_manager: Optional[LLMManager] = None):
+        # llm_manager 可由多个模拟器共享（如分叉与定位用的副本），避免每个实例各建一套客户端
+        self.agent_manager = AgentStateManager(use_array_store=use_array_store, llm_manager=llm_manager)
+        self.outline_generator = StoryOutlineGenerator(llm_manager)
+        self.story_director = StoryDirector(llm_manager) # 实例化导演
         self.current_step = 0
         self.story_outline = None
-        self.event_history = []
+        self.outline_index: Optional[OutlineIndex] = None
+        self.event_history = deque(maxlen=EVENT_TAIL_SIZE)
+        self.event_log: Optional[EventLog] = None
         self.story_name = None
         self.current_narrative_summary = "等待导演就绪..." # 新增：存储当前剧情摘要
+        self.execution_mode = "single"
+        self.last_plan_report = None
+        # 随机种子与独立随机源：同一种子+相同的LLM响应可以确定性地复现整个故事
+        self.seed: Optional[int] = None
+        self.rng = random.Random()
+        self.agent_manager.rng = self.rng
+        # 导演后端：LLM导演、本地规则导演，或LLM不可用时自动改用本地规则
+        # 本地规则导演使用单独的随机源，每次请求计划前按 (plan_seed, 当前步) 重新播种：
+        # 计划不消耗共享随机源，恢复与定位时按日志重放计划后共享随机源仍与不中断的运行一致
+        self.plan_rng = random.Random()
+        self.plan_seed = None
+        self.local_planner = LocalHeuristicPlanner(self.plan_rng)
+        # 观看者正在关注的智能体，分级细节模式下优先交给LLM导演
+        self.focus_agent_ids: List[int] = []
+        self.planner: Planner = self._build_planner(DEFAULT_PLANNER)
+        self.recording: Optional[SimulationRecording] = None
+        self.replayer: Optional[ReplayLLM] = None
+        self.initialized = False
+        # 检查点：每 checkpoint_interval 个故事步原子地保存一次完整状态
+        self.checkpoint_dir: Optional[str] = None
+        self.checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
+        self.keyframes: Optional[KeyframeIndex] = None
+        self._seek_simulator: Optional["Simulator"] = None
+        self._seek_lock = threading.Lock()
+        # 分叉：父模拟器与分叉点 {"parent", "step", "event_seq"}
+        self.fork_parent: Optional["Simulator"] = None
+        self.fork_origin: Optional[Dict] = None
         
     @classmethod
     def get_instance(cls, story_name: str):
         if story_name not in cls._instances:
-            cls._instances[story_name] = Simulator()
+            cls._instances[story_name] = Simulator(use_array_store=USE_ARRAY_STORE)
         return cls._instances[story_name]
+
+    @classmethod
+    def discard_instance(cls, story_name: str):
+        """丢弃故事的模拟器实例（故事被删除或整体替换时），关闭其事件日志"""
+        simulator = cls._instances.pop(story_name, None)
+        if simulator is not None and simulator.event_log is not None:
+            simulator.event_log.close()
     
-    def initialize_simulation(self, scene_data: Dict, max_steps: int = 100):
+    def set_director_llm(self, model: Optional[str] = None, temperature: Optional[float] = None):
+        """让导演单独使用指定的模型或温度（其余LLM调用不变），不写回全局配置"""
+        self.story_director.llm_manager = self.agent_manager.llm_manager.derive(model=model, temperature=temperature)
+
+    def set_execution_mode(self, mode: str):
+        """切换计划执行模式"""
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"未知的执行模式: {mode}")
+        self.execution_mode = mode
+
+    def set_planner(self, planner):
+        """切换导演后端：PLANNERS 中的名字，或任何实现了 Planner 接口的对象"""
+        self.planner = self._build_planner(planner) if isinstance(planner, str) else planner
+        if self.recording is not None:
+            self._record_plan_sources()
+
+    def _build_planner(self, name: str) -> Planner:
+        if name == "llm":
+            return self.story_director
+        if name == "local":
+            return self.local_planner
+        if name == "auto":
+            return FallbackPlanner(self.story_director, self.local_planner)
+        if name == "lod":
+            return LevelOfDetailPlanner(FallbackPlanner(self.story_director, self.local_planner), self.local_planner)
+        raise ValueError(f"未知的导演后端: {name}")
+
+    def set_focus(self, agent_ids: List[int]):
+        """设置观看者关注的智能体"""
+        self.focus_agent_ids = [int(agent_id) for agent_id in agent_ids]
+
+    def attach_event_log(self, log_dir: str) -> EventLog:
+        """把事件写入磁盘上的只追加日志，需在 initialize_simulation 之前调用"""
+        if self.event_log is None or self.event_log.log_dir != log_dir:
+            if self.event_log is not None:
+                self.event_log.close()
+            self.event_log = EventLog(log_dir, tail_size=EVENT_TAIL_SIZE)
+            self.event_history = self.event_log.tail
+        return self.event_log
+
+    def enable_checkpoints(self, story_path: str, interval: Optional[int] = None):
+        """在故事目录中定期保存检查点，需在 initialize_simulation 或 resume 之前调用"""
+        self.checkpoint_dir = story_path
+        if interval is not None:
+            self.checkpoint_interval = max(1, int(interval))
+
+    def attach_keyframes(self, story_path: str, interval: int = DEFAULT_KEYFRAME_INTERVAL) -> KeyframeIndex:
+        """每 interval 个故事步保存一个关键帧，供 seek 使用，需在 initialize_simulation 之前调用"""
+        if self.keyframes is None or self.keyframes.directory != os.path.join(story_path, KEYFRAME_DIR):
+            self.keyframes = KeyframeIndex(story_path, interval)
+        return self.keyframes
+
+    def _record_event(self, event_record: Dict):
+        if self.event_log is not None:
+            self.event_log.append(event_record)
+        else:
+            self.event_history.append(event_record)
+
+    def get_events(self, from_step: int = 0, to_step: Optional[int] = None) -> List[Dict]:
+        """按步数范围读取事件记录；没有事件日志时只能返回内存中的最近记录；分叉点之前的记录来自父模拟器"""
+        inherited = []
+        if self.fork_parent is not None and from_step <= self.fork_origin["step"]:
+            fork_step, fork_seq = self.fork_origin["step"], self.fork_origin.get("event_seq")
+            parent_to = fork_step if to_step is None else min(to_step, fork_step)
+            inherited = [
+                record for record in self.fork_parent.get_events(from_step, parent_to)
+                if record["step"] < fork_step or (fork_seq is not None and record.get("seq", 0) < fork_seq)
+            ]
+        if self.event_log is not None:
+            return inherited + self.event_log.read_range(from_step, to_step)
+        return inherited + [
+            record for record in self.event_history
+            if record["step"] >= from_step and (to_step is None or record["step"] <= to_step)
+        ]
+
+    def start_recording(self, seed: Optional[int] = None) -> SimulationRecording:
+        """开启录制：记录随机种子与全部LLM请求/响应，需在 initialize_simulation 之前调用"""
+        self.recording = SimulationRecording(seed=seed, execution_mode=self.execution_mode, planner=self.planner.name)
+        attach_recorder(self, self.recording)
+        self._record_plan_sources()
+        return self.recording
+
+    def _fallback_planner(self) -> Optional[FallbackPlanner]:
+        """当前导演中按时钟在LLM与本地规则之间切换的部分（auto，或 lod 的主导演）"""
+        planner = self.planner.primary if isinstance(self.planner, LevelOfDetailPlanner) else self.planner
+        return planner if isinstance(planner, FallbackPlanner) else None
+
+    def _record_plan_sources(self):
+        self.recording.planner = self.planner.name
+        fallback = self._fallback_planner()
+        if fallback is not None:
+            fallback.plan_listener = self.recording.add_plan_source
+
+    def start_replay(self, recording: SimulationRecording) -> ReplayLLM:
+        """开启回放：LLM响应全部来自录制，需在 initialize_simulation 之前调用"""
+        self.execution_mode = recording.execution_mode
+        self.seed = recording.seed
+        if recording.planner in PLANNERS:
+            self.set_planner(recording.planner)
+            fallback = self._fallback_planner()
+            if fallback is not None:
+                # 回放时不等待超时；录制中记下了每次计划的来源时按来源执行，不再由时钟决定
+                fallback.timeout = None
+                if recording.plan_sources:
+                    fallback.replay_sources = iter(recording.plan_sources)
+        self.replayer = attach_replayer(self, recording)
+        return self.replayer
+
+    def initialize_simulation(self, scene_data: Dict, max_steps: int = 100, seed: Optional[int] = None):
+        if seed is not None:
+            self.seed = seed
+        elif self.recording is not None:
+            self.seed = self.recording.seed
+        elif self.seed is None:
+            self.seed = scene_data.get("seed")
+        if self.recording is not None:
+            self.recording.seed = self.seed
+            self.recording.scene_data = copy.deepcopy(scene_data)
+            self.recording.max_steps = max_steps
+            self.recording.planner = self.planner.name
+        self.rng.seed(self.seed)
+        self.plan_seed = self.seed if self.seed is not None else random.getrandbits(64)
+
         self.story_name = scene_data.get("story_name", "default")
         self.story_outline = scene_data.get("outline", {})
         self.scene = scene_data.get("scene", {})
@@ -33,10 +227,22 @@ class Simulator:
         self.max_steps = max_steps
         self.current_step = 0
         self.event_history.clear()
+        if self.event_log is not None:
+            self.event_log.reset()
         self.current_narrative_summary = "等待导演就绪..."
+        # 重新开始的模拟不再继承任何父模拟器的历史
+        self.fork_parent = None
+        self.fork_origin = None
         
         self._ensure_agent_positions()
+        self._compile_outline()
         self.agent_manager.initialize_agents(self.agents, self.scene.get("structure", {}))
+        self.agent_manager.set_action_plan([])
+        self.initialized = True
+        # 初始检查点与关键帧：第一个周期检查点之前崩溃也能从事件日志恢复
+        if self.keyframes is not None:
+            self.keyframes.reset()
+        self._save_snapshots(force=True)
         
         return {
             "status": "initialized",
@@ -55,14 +261,14 @@ class Simulator:
             if "x" not in agent or "y" not in agent:
                 if rooms:
                     # 随机选择一个房间
-                    initial_room = random.choice(rooms)
+                    initial_room = self.rng.choice(rooms)
                     agent["x"] = initial_room.get("x", 100) + initial_room.get("width", 120) // 2
                     agent["y"] = initial_room.get("y", 100) + initial_room.get("height", 120) // 2
                     agent["current_room"] = initial_room.get("id")
                 else:
                     # 如果没有房间，随机分配位置
-                    agent["x"] = random.randint(50, 750)
-                    agent["y"] = random.randint(50, 450)
+                    agent["x"] = self.rng.randint(50, 750)
+                    agent["y"] = self.rng.randint(50, 450)
                     agent["current_room"] = None
             
             # 确保智能体有必要的属性
@@ -74,60 +280,452 @@ class Simulator:
     def simulate_step(self) -> Dict:
         """模拟单步，现在由导演编排"""
         if self.current_step >= self.max_steps:
-            return {"status": "completed", "reason": "达到最大步数"}
+            return {"status": "completed", "step": self.current_step, "reason": "达到最大步数"}
+        if self.recording is not None:
+            self.recording.steps_recorded += 1
+            self.recording.dirty = True
 
         # 1. 检查当前动作计划是否已执行完毕
+        plan_report = None
+        new_plan = None
         if self.agent_manager.is_plan_finished():
-            # 2. 如果完毕，让导演生成新的计划
-            context = self._prepare_director_context()
-            # --- 修改：解构返回值，获取摘要和计划 ---
-            narrative, action_plan = self.story_director.generate_step_plan(context)
+            # 2. 如果完毕，让导演生成新的计划（经本地校验与修复）
+            narrative, action_plan, plan_report = self._request_plan()
             
             # 存储摘要，以便在计划的每一步都能使用
             self.current_narrative_summary = narrative
             self.agent_manager.set_action_plan(action_plan)
             
             if not action_plan:
-                return {"status": "error", "reason": "导演未能生成有效的动作计划"}
+                return {"status": "error", "step": self.current_step, "reason": "导演未能生成有效的动作计划"}
+            new_plan = {"narrative_summary": narrative, "action_plan": action_plan}
+            if isinstance(self.planner, LevelOfDetailPlanner):
+                # 焦点与互动热度随计划变化，重放日志时直接恢复
+                new_plan["planner_state"] = self.planner.to_checkpoint()
 
-        # 3. 执行计划中的下一个动作
-        agent_update = self.agent_manager.update_agents_with_plan(self._prepare_director_context())
-        
-        # 4. 更新原始智能体数据
-        if agent_update.get("status") == "executed":
-            self._update_agent_data(agent_update["agent_id"], agent_update)
-
-        # 5. 检查故事事件（如果计划执行完毕）
-        triggered_event = None
-        if self.agent_manager.is_plan_finished():
-            triggered_event = self._check_story_events(agent_update.get("agent_id"), agent_update)
+        with stage("execute"):
+            agent_update, triggered_event = self._execute_plan_step()
 
         event_record = {
             "step": self.current_step,
+            "mode": self.execution_mode,
             "agent_update": agent_update,
             "triggered_event": triggered_event,
             "timestamp": time.time()
         }
-        self.event_history.append(event_record)
+        if new_plan is not None:
+            # 新计划写入日志，恢复时无需再请求导演即可重放
+            event_record["new_plan"] = new_plan
+        with stage("log"):
+            self._record_event(event_record)
 
         # 只有当一个完整计划执行完毕后，步数才增加
         if self.agent_manager.is_plan_finished():
             self.current_step += 1
+            with stage("snapshot"):
+                self._save_snapshots()
         
+        with stage("state"):
+            all_agent_states = self.agent_manager.get_agent_states()
         return {
             "status": "running",
             "step": self.current_step,
             "agent_update": agent_update,
             "triggered_event": triggered_event,
-            "all_agent_states": self.agent_manager.get_agent_states(),
+            "all_agent_states": all_agent_states,
             "scene_data": {
                 "agents": self.agents,
                 "scene_structure": self.scene.get("structure", {})
             },
             "plan_progress": agent_update.get("plan_progress", "N/A"),
-            "narrative_summary": self.current_narrative_summary # --- 新增：返回当前剧情摘要 ---
+            "narrative_summary": self.current_narrative_summary, # --- 新增：返回当前剧情摘要 ---
+            "plan_report": plan_report
+        }
+
+    def _execute_plan_step(self) -> Tuple[Dict, Optional[Dict]]:
+        """执行当前计划的下一部分并同步智能体数据，返回 (执行结果, 触发的故事事件)"""
+        # 3. 执行计划中的下一个动作（批量模式执行所有就绪动作，调度模式一次执行完整个计划）
+        if self.execution_mode == "scheduled":
+            agent_update = self.agent_manager.run_plan_scheduled(self._prepare_director_context())
+        elif self.execution_mode == "batch":
+            agent_update = self.agent_manager.update_agents_with_plan_batch(self._prepare_director_context())
+        else:
+            agent_update = self.agent_manager.update_agents_with_plan(self._prepare_director_context())
+        executed_updates = self._executed_updates(agent_update)
+        
+        # 4. 更新原始智能体数据
+        for update in executed_updates:
+            self._update_agent_data(update["agent_id"], update)
+        for route_update in agent_update.get("route_updates", []):
+            self._update_agent_data(route_update["agent_id"], route_update)
+
+        # 5. 检查故事事件（如果计划执行完毕）
+        triggered_event = None
+        if self.agent_manager.is_plan_finished():
+            for update in executed_updates or [agent_update]:
+                triggered_event = self._check_story_events(update.get("agent_id"), update)
+                if triggered_event:
+                    break
+        return agent_update, triggered_event
+
+    # --- 检查点与恢复 ---
+    def to_checkpoint(self) -> Dict:
+        """模拟器的完整可恢复状态（场景与大纲不变，从故事数据读取）"""
+        return {
+            "story_name": self.story_name,
+            "current_step": self.current_step,
+            "max_steps": self.max_steps,
+            "execution_mode": self.execution_mode,
+            "planner": self.planner.name,
+            "planner_state": self.planner.to_checkpoint() if isinstance(self.planner, LevelOfDetailPlanner) else None,
+            "focus_agent_ids": self.focus_agent_ids,
+            "narrative_summary": self.current_narrative_summary,
+            "seed": self.seed,
+            "rng_state": rng_state_to_json(self.rng.getstate()),
+            "plan_seed": self.plan_seed,
+            "agents": self.agents,
+            "agent_manager": self.agent_manager.to_checkpoint(),
+            # 检查点之后的事件从这个序号开始
+            "event_seq": self.event_log.next_seq if self.event_log is not None else None,
+            "fork_origin": self.fork_origin,
+            "saved_at": time.time()
         }
 
+    def save_checkpoint(self, snapshot: Optional[Dict] = None) -> Optional[str]:
+        if self.checkpoint_dir is None:
+            return None
+        try:
+            return save_checkpoint(self.checkpoint_dir, snapshot or self.to_checkpoint())
+        except Exception as e:
+            print(f"保存检查点失败: {e}")
+            return None
+
+    def _save_snapshots(self, force: bool = False):
+        """故事步完成时按各自的间隔保存检查点与关键帧（两者共用同一份快照）"""
+        snapshot = None
+        if self.checkpoint_dir is not None and (force or self.current_step % self.checkpoint_interval == 0):
+            snapshot = self.to_checkpoint()
+            self.save_checkpoint(snapshot)
+        if self.keyframes is not None and (force or self.keyframes.should_save(self.current_step)):
+            try:
+                self.keyframes.save(snapshot or self.to_checkpoint())
+            except Exception as e:
+                print(f"保存关键帧失败: {e}")
+
+    def restore_checkpoint(self, checkpoint: Dict, scene_data: Dict):
+        """从检查点恢复状态，scene_data 提供不随模拟变化的场景与大纲"""
+        self.story_name = checkpoint.get("story_name") or scene_data.get("story_name", "default")
+        self.story_outline = scene_data.get("outline", {})
+        self.scene = scene_data.get("scene", {})
+        self.agents = checkpoint["agents"]
+        self._compile_outline()
+        self.max_steps = checkpoint.get("max_steps", 100)
+        self.current_step = checkpoint["current_step"]
+        self.execution_mode = checkpoint.get("execution_mode", self.execution_mode)
+        if checkpoint.get("planner") in PLANNERS:
+            self.set_planner(checkpoint["planner"])
+        if isinstance(self.planner, LevelOfDetailPlanner) and checkpoint.get("planner_state"):
+            self.planner.restore_checkpoint(checkpoint["planner_state"])
+        self.focus_agent_ids = checkpoint.get("focus_agent_ids", [])
+        self.current_narrative_summary = checkpoint.get("narrative_summary", "")
+        self.seed = checkpoint.get("seed")
+        self.rng.setstate(rng_state_from_json(checkpoint["rng_state"]))
+        self.plan_seed = checkpoint.get("plan_seed", self.seed)
+        self.agent_manager.restore_checkpoint(checkpoint["agent_manager"], self.scene.get("structure", {}))
+        # 父模拟器需由调用方通过 attach_fork_parent 重新关联
+        self.fork_origin = checkpoint.get("fork_origin")
+        self.fork_parent = None
+        self.event_history.clear()
+        self.initialized = True
+
+    def resume(self, scene_data: Dict) -> Optional[Dict]:
+        """
+        从最近的检查点恢复，并重放其后的事件日志尾部（计划取自日志，不调用LLM）。
+
+        没有检查点时返回 None，调用方应改为 initialize_simulation。
+        """
+        if self.checkpoint_dir is None:
+            return None
+        checkpoint = load_checkpoint(self.checkpoint_dir)
+        if checkpoint is None:
+            return None
+        started = time.perf_counter()
+        self.restore_checkpoint(checkpoint, scene_data)
+
+        replayed = 0
+        if self.event_log is not None and checkpoint.get("event_seq") is not None:
+            for record in self.event_log.iter_from_seq(checkpoint["event_seq"]):
+                if not self._replay_event(record):
+                    print(f"事件 {record.get('seq')} 缺少计划，恢复停在该事件之前")
+                    break
+                replayed += 1
+        if self.keyframes is not None:
+            self.keyframes.truncate_after(self.current_step)
+        if replayed:
+            self.save_checkpoint()
+        return {
+            "status": "resumed",
+            "checkpoint_step": checkpoint["current_step"],
+            "current_step": self.current_step,
+            "replayed_events": replayed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def seek(self, step: int, scene_data: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        返回第 step 步开始时的世界状态：加载最近的关键帧，再重放其后至多 K 步的事件。
+
+        在独立的模拟器副本上重放，不影响正在运行的模拟；没有关键帧时返回 None。
+        """
+        if self._before_fork(step):
+            return self.fork_parent.seek(step)
+        started = time.perf_counter()
+        # 副本在多个请求线程间共用：重建与取出状态都持有锁，返回的状态与副本不共享可变对象
+        with self._seek_lock:
+            materialized = self._materialize(step, scene_data)
+            if materialized is None:
+                return None
+            replica, keyframe_step, replayed, _ = materialized
+            state = copy.deepcopy({
+                "agent_states": replica.agent_manager.get_agent_states(),
+                "agents": replica.agents
+            })
+            return {
+                "requested_step": step,
+                "step": replica.current_step,
+                "keyframe_step": keyframe_step,
+                "replayed_events": replayed,
+                "narrative_summary": replica.current_narrative_summary,
+                "agent_states": state["agent_states"],
+                "agents": state["agents"],
+                "recent_events": list(replica.event_history)[-RECENT_EVENT_COUNT:],
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+
+    def _materialize(self, step: int, scene_data: Optional[Dict] = None) -> Optional[Tuple["Simulator", int, int, Optional[int]]]:
+        """在副本上重建第 step 步开始时的状态，返回 (副本, 关键帧步数, 重放的事件数, 下一条事件的序号)；调用方须持有 _seek_lock"""
+        if self.keyframes is None:
+            return None
+        keyframe = self.keyframes.nearest(step)
+        if keyframe is None:
+            return None
+        if scene_data is None:
+            scene_data = {"scene": self.scene, "outline": self.story_outline, "story_name": self.story_name}
+        if self._seek_simulator is None:
+            self._seek_simulator = Simulator(
+                use_array_store=self.agent_manager.use_array_store,
+                llm_manager=self.agent_manager.llm_manager
+            )
+        replica = self._seek_simulator
+        replica.restore_checkpoint(keyframe, scene_data)
+
+        replayed = 0
+        next_seq = keyframe.get("event_seq")
+        if self.event_log is not None and next_seq is not None and replica.current_step < step:
+            for record in self.event_log.iter_from_seq(next_seq):
+                if not replica._replay_event(record):
+                    break
+                replayed += 1
+                next_seq = record["seq"] + 1
+                if replica.current_step >= step:
+                    break
+        return replica, keyframe["current_step"], replayed, next_seq
+
+    # --- 分叉 ---
+    def fork(self, step: Optional[int] = None, story_path: Optional[str] = None,
+             story_name: Optional[str] = None, model: Optional[str] = None,
+             temperature: Optional[float] = None) -> "Simulator":
+        """
+        从第 step 步开始处分叉出一个新模拟器（不传 step 则从当前状态分叉）。
+
+        场景、大纲、分叉点之前的事件历史与LLM客户端与父模拟器共享，只复制智能体的可变状态；
+        指定 model 或 temperature 时分叉的导演单独使用新的客户端。
+        传入 story_path 时分叉拥有自己的事件日志、检查点与关键帧，并写入 fork.json 指向父故事。
+        """
+        if step is None or (step == self.current_step and self.agent_manager.is_plan_finished()):
+            next_seq = self.event_log.next_seq if self.event_log is not None else None
+            child = self._fork_state(self, next_seq, story_name, model, temperature)
+        elif self._before_fork(step):
+            return self.fork_parent.fork(step, story_path, story_name, model, temperature)
+        else:
+            # 定位副本与 seek 共用：从重建到复制完状态都持有锁
+            with self._seek_lock:
+                materialized = self._materialize(step)
+                if materialized is None or materialized[0].current_step != step:
+                    raise ValueError(f"无法定位到第 {step} 步，不能在此分叉")
+                source, _, _, next_seq = materialized
+                child = self._fork_state(source, next_seq, story_name, model, temperature)
+
+        if story_path is not None:
+            child.attach_event_log(os.path.join(story_path, "events")).reset()
+            child.enable_checkpoints(story_path, self.checkpoint_interval)
+            child.attach_keyframes(story_path, self.keyframes.interval if self.keyframes else DEFAULT_KEYFRAME_INTERVAL).reset()
+            save_fork_info(story_path, child.fork_origin)
+            child._save_snapshots(force=True)
+        return child
+
+    def _fork_state(self, source: "Simulator", next_seq: Optional[int], story_name: Optional[str],
+                    model: Optional[str], temperature: Optional[float]) -> "Simulator":
+        """以 source（自身或定位副本）的状态构造分叉模拟器"""
+        # 共用父模拟器的LLM客户端（去掉父模拟器的录制包装，分叉的调用不计入父故事的录制）
+        shared = self.agent_manager.llm_manager
+        child = Simulator(use_array_store=self.agent_manager.use_array_store,
+                          llm_manager=shared.derive(base_llm(shared.llm)))
+        if model is not None or temperature is not None:
+            child.set_director_llm(model, temperature)
+        child.set_planner(self.planner.name if self.planner.name in PLANNERS else self.planner)
+        child.story_name = story_name or f"{self.story_name}_fork"
+        child.scene = self.scene
+        child.story_outline = self.story_outline
+        child.outline_index = self.outline_index
+        # 智能体的原始数据会被逐步修改，按智能体浅拷贝
+        child.agents = [dict(agent) for agent in source.agents]
+        child.max_steps = source.max_steps
+        child.current_step = source.current_step
+        child.current_narrative_summary = source.current_narrative_summary
+        child.execution_mode = source.execution_mode
+        child.seed = source.seed
+        child.rng.setstate(source.rng.getstate())
+        child.plan_seed = source.plan_seed
+        child.focus_agent_ids = list(source.focus_agent_ids)
+        if isinstance(child.planner, LevelOfDetailPlanner) and isinstance(source.planner, LevelOfDetailPlanner):
+            child.planner.restore_checkpoint(source.planner.to_checkpoint())
+        child.agent_manager.fork_from(source.agent_manager, self.scene.get("structure", {}))
+        child.fork_parent = self
+        child.fork_origin = {
+            "parent": self.story_name,
+            "step": child.current_step,
+            "event_seq": next_seq,
+            "created_at": time.time()
+        }
+        child.initialized = True
+        return child
+
+    def attach_fork_parent(self, parent: "Simulator", fork_info: Dict):
+        """重启后重新关联父模拟器，使分叉点之前的历史与定位可用"""
+        self.fork_parent = parent
+        self.fork_origin = fork_info
+
+    def query_events(self, from_step: int = 0, to_step: Optional[int] = None, agent_id=None,
+                     action_type: Optional[str] = None, cursor: Optional[str] = None,
+                     limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+        """
+        分页读取事件记录，返回 (记录, 下一页的游标)，读完时游标为 None。
+
+        分叉故事先返回从祖先继承的历史，再返回自身的记录；游标 "层:序号" 中的层从最早的祖先数起。
+        逐段读取事件日志，取够 limit 条即停止，不会把完整历史读入内存。
+        """
+        levels = self._event_levels()
+        start_level, after_seq = 0, -1
+        if cursor:
+            level_text, _, seq_text = cursor.partition(":")
+            start_level, after_seq = int(level_text), int(seq_text)
+            if not 0 <= start_level < len(levels):
+                raise ValueError(f"无效的游标: {cursor}")
+        records: List[Dict] = []
+        last_level = start_level
+        for level in range(start_level, len(levels)):
+            simulator, limits = levels[level]
+            level_to = to_step
+            for fork_step, _ in limits:
+                level_to = fork_step if level_to is None else min(level_to, fork_step)
+            for record in simulator._iter_own_events(after_seq if level == start_level else -1,
+                                                     from_step, level_to, agent_id, action_type):
+                if not all(record.get("step", 0) < fork_step or (fork_seq is not None and record.get("seq", 0) < fork_seq)
+                           for fork_step, fork_seq in limits):
+                    continue
+                if len(records) == limit:
+                    return records, f"{last_level}:{records[-1]['seq']}"
+                records.append(record)
+                last_level = level
+        return records, None
+
+    def _event_levels(self) -> List[Tuple["Simulator", List[Tuple[int, Optional[int]]]]]:
+        """从最早的祖先到自身：(模拟器, 继承限制[(分叉步, 分叉时的事件序号)])；序号限制只对直接父故事的日志有效"""
+        levels = []
+        simulator, limits = self, []
+        while True:
+            levels.append((simulator, limits))
+            if simulator.fork_parent is None or not simulator.fork_origin:
+                break
+            origin = simulator.fork_origin
+            limits = [(origin["step"], origin.get("event_seq"))] + [(fork_step, None) for fork_step, _ in limits]
+            simulator = simulator.fork_parent
+        levels.reverse()
+        return levels
+
+    def _iter_own_events(self, after_seq: int, from_step: int, to_step: Optional[int],
+                         agent_id, action_type: Optional[str]) -> Iterator[Dict]:
+        if self.event_log is not None:
+            yield from self.event_log.query(after_seq, from_step, to_step, agent_id, action_type)
+            return
+        # 没有事件日志时只有内存中的最近记录，以其位置作为序号
+        for index, record in enumerate(list(self.event_history)):
+            if "seq" not in record:
+                record = dict(record, seq=index)
+            step = record.get("step", 0)
+            if record["seq"] <= after_seq:
+                continue
+            if step < from_step or (to_step is not None and step > to_step):
+                continue
+            if event_matches(record, agent_id, action_type):
+                yield record
+
+    def _before_fork(self, step: int) -> bool:
+        return self.fork_parent is not None and step < self.fork_origin["step"]
+
+    def _replay_event(self, record: Dict) -> bool:
+        """按日志记录重新执行一次 simulate_step，不请求导演"""
+        if "new_plan" in record:
+            self.current_narrative_summary = record["new_plan"]["narrative_summary"]
+            self.agent_manager.set_action_plan(record["new_plan"]["action_plan"])
+            if isinstance(self.planner, LevelOfDetailPlanner) and record["new_plan"].get("planner_state"):
+                self.planner.restore_checkpoint(record["new_plan"]["planner_state"])
+        elif self.agent_manager.is_plan_finished():
+            return False
+        self.execution_mode = record.get("mode", self.execution_mode)
+        self._execute_plan_step()
+        self.event_history.append(record)
+        if self.agent_manager.is_plan_finished():
+            self.current_step += 1
+        return True
+
+    def _request_plan(self) -> Tuple[str, List[Dict], Dict]:
+        """向导演请求计划并在本地校验修复；存活的动作太少时才再次请求LLM"""
+        context = self._prepare_director_context()
+        self.plan_rng.seed(f"{self.plan_seed}:{self.current_step}")
+        # 分级细节导演每次出计划都会更新排名与互动热度：重新请求前恢复到本次计划之前，同一次计划只计入一次
+        planner_state = self.planner.to_checkpoint() if isinstance(self.planner, LevelOfDetailPlanner) else None
+        for attempt in range(MAX_REPLANS + 1):
+            if attempt and planner_state is not None:
+                self.planner.restore_checkpoint(planner_state)
+            with stage("plan"):
+                narrative, raw_plan = self.planner.generate_step_plan(context)
+            with stage("validate"):
+                validator = PlanValidator(
+                    self.agent_manager.get_agent_states(),
+                    self.agent_manager.get_room_graph(context)
+                )
+                action_plan, report = validator.validate(raw_plan or [])
+            report["attempt"] = attempt + 1
+            report["planner"] = getattr(self.planner, "last_source", None) or self.planner.name
+            if isinstance(self.planner, LevelOfDetailPlanner):
+                report["lod"] = self.planner.last_lod
+            if not raw_plan or report["survival_ratio"] >= MIN_PLAN_SURVIVAL:
+                break
+            # 把被丢弃的原因反馈给导演
+            context["plan_feedback"] = report["dropped"]
+        self.last_plan_report = report
+        return narrative, action_plan, report
+
+    def _executed_updates(self, agent_update: Dict) -> List[Dict]:
+        """把单个或合并的执行结果统一展开为已执行动作的列表"""
+        if "updates" in agent_update:
+            return agent_update["updates"]
+        if agent_update.get("status") == "executed":
+            return [agent_update]
+        return []
+
     def _prepare_director_context(self) -> Dict:
         """为导演准备所需的全局上下文"""
         return {
@@ -135,7 +733,11 @@ class Simulator:
             "scene_structure": self.scene.get("structure", {}),
             "current_step": self.current_step,
             "other_agents": self.agent_manager.get_agent_states(), # 提供所有agent的详细状态
-            "story_outline": self.story_outline
+            "story_outline": self.story_outline,
+            "current_key_event": self.outline_index.event_at(self.current_step) if self.outline_index else None,
+            "plot_milestones": self.outline_index.milestones_at(self.current_step) if self.outline_index else [],
+            "arc_developments": self.outline_index.arcs_at(self.current_step) if self.outline_index else [],
+            "focus_agent_ids": self.focus_agent_ids
         }
     
     def _update_agent_data(self, agent_id: int, agent_update: Dict):
@@ -160,39 +762,22 @@ class Simulator:
             if "inventory" in agent_update:
                 agent["inventory"] = agent_update["inventory"]
     
+    def _compile_outline(self):
+        """编译故事大纲：按步索引关键事件、情节节点与角色发展节点，触发条件只解析一次"""
+        self.outline_index = OutlineIndex(self.story_outline, self.agents, self.scene.get("structure", {}).get("rooms", []))
+
     def _check_story_events(self, agent_id: int, agent_update: Dict) -> Optional[Dict]:
-        """检查是否触发了故事事件"""
-        if not self.story_outline:
+        """检查是否触发了故事事件（只检查当前步的事件）"""
+        if not self.story_outline or self.outline_index is None:
             return None
-        
-        key_events = self.story_outline.get("key_events", [])
-        
-        for event in key_events:
-            if event.get("step") == self.current_step:
-                trigger_condition = event.get("next_step_trigger", "")
-                if self._evaluate_trigger_condition(trigger_condition, agent_update):
-                    return {
-                        "event": event,
-                        "triggered": True,
-                        "impact": event.get("impact", "")
-                    }
-        
-        return None
-    
-    def _evaluate_trigger_condition(self, condition: str, agent_update: Dict) -> bool:
-        """评估触发条件"""
-        if not condition:
-            return True
-        
-        # 简单的条件评估逻辑
-        if "move" in condition.lower():
-            return agent_update.get("action", {}).get("action_type") == "move"
-        elif "talk" in condition.lower():
-            return agent_update.get("action", {}).get("action_type") == "talk"
-        elif "interact" in condition.lower():
-            return agent_update.get("action", {}).get("action_type") == "interact"
-        
-        return True
+        event = self.outline_index.check(self.current_step, agent_update)
+        if event is None:
+            return None
+        return {
+            "event": event,
+            "triggered": True,
+            "impact": event.get("impact", "")
+        }
     
     def _get_available_items(self) -> List[str]:
         """获取可用物品列表"""
@@ -206,15 +791,15 @@ class Simulator:
         
         return items
     
-    def get_current_state(self) -> Dict:
-        """获取当前模拟状态"""
+    def get_current_state(self, recent_events: int = RECENT_EVENT_COUNT) -> Dict:
+        """获取当前模拟状态；event_history 只含最近 recent_events 条事件"""
         try:
             return {
                 "current_step": getattr(self, 'current_step', 0),
                 "max_steps": getattr(self, 'max_steps', 100),
                 "story_outline": getattr(self, 'story_outline', {}),
                 "agent_states": self.agent_manager.get_agent_states() if hasattr(self, 'agent_manager') else [],
-                "event_history": getattr(self, 'event_history', [])[-10:],
+                "event_history": list(getattr(self, 'event_history', []))[-recent_events:] if recent_events > 0 else [],
                 "progress_percentage": (getattr(self, 'current_step', 0) / getattr(self, 'max_steps', 100)) * 100,
                 "scene_data": {
                     "agents": getattr(self, 'agents', []),
@@ -297,19 +882,41 @@ class Simulator:
         
         return paths
     
-    def run_full_simulation(self, scene_data: Dict, max_steps: int = 100) -> List[Dict]:
-        """运行完整模拟"""
+    def iter_simulation(self, scene_data: Dict, max_steps: int = 100,
+                        sinks: Sequence[StepSink] = ()) -> Iterator[Dict]:
+        """
+        初始化并逐步产出单步结果，每步先写入 sinks（文件、socket、事件日志等）再交给调用方。
+
+        不保留任何已产出的结果，调用方不收集时内存占用与运行步数无关；生成器结束或被关闭时关闭 sinks。
+        """
         self.initialize_simulation(scene_data, max_steps)
-        
-        timeline = []
-        while self.current_step < self.max_steps:
-            step_result = self.simulate_step()
-            timeline.append(step_result)
-            
-            if step_result.get("status") == "completed":
-                break
-        
-        return timeline
+        errors = 0
+        try:
+            while self.current_step < self.max_steps:
+                step_result = self.simulate_step()
+                for sink in sinks:
+                    sink.write(step_result)
+                yield step_result
+                if step_result.get("status") == "completed":
+                    break
+                # 导演连续多次给不出计划时停止，避免无人值守的运行空转
+                errors = errors + 1 if step_result.get("status") == "error" else 0
+                if errors >= MAX_CONSECUTIVE_ERRORS:
+                    print(f"导演连续 {errors} 次未能生成计划，模拟提前结束")
+                    break
+        finally:
+            for sink in sinks:
+                try:
+                    sink.close()
+                except Exception as e:
+                    print(f"关闭模拟输出失败: {e}")
+
+    def run_full_simulation(self, scene_data: Dict, max_steps: int = 100,
+                            sinks: Sequence[StepSink] = (), compact: bool = False) -> List[Dict]:
+        """运行完整模拟并收集全部单步结果；compact 时每步只保留事件部分，不含全量智能体状态"""
+        if compact:
+            return [compact_step_result(result) for result in self.iter_simulation(scene_data, max_steps, sinks)]
+        return list(self.iter_simulation(scene_data, max_steps, sinks))
 
 # 保持向后兼容的函数
 def run_simulation(scene, agents, steps=12):
@@ -0,0 +1,86 @@
+# step_sinks.py
+import socket
+from abc import ABC, abstractmethod
+from typing import Dict, IO, Optional, Tuple
+import serializer
+
+# 精简的单步记录只保留这些字段（不含 all_agent_states 与 scene_data）
+COMPACT_FIELDS = ("status", "step", "agent_update", "triggered_event", "plan_progress", "narrative_summary", "plan_report")
+
+
+def compact_step_result(step_result: Dict) -> Dict:
+    """去掉单步结果中随智能体数与场景大小增长的全量状态"""
+    return {key: step_result[key] for key in COMPACT_FIELDS if key in step_result}
+
+
+class StepSink(ABC):
+    """Simulator.iter_simulation 的流式输出目标：每产出一步调用一次 write，结束时调用 close"""
+
+    @abstractmethod
+    def write(self, step_result: Dict):
+        ...
+
+    def close(self):
+        pass
+
+
+class StreamSink(StepSink):
+    """把每步写成一行JSON到任意文本流（文件、sys.stdout、socket.makefile('w') 等）"""
+
+    def __init__(self, stream: IO, compact: bool = False, flush_every: int = 1):
+        self.stream = stream
+        self.compact = compact
+        self.flush_every = max(1, flush_every)
+        self.written = 0
+
+    def write(self, step_result: Dict):
+        record = compact_step_result(step_result) if self.compact else step_result
+        self.stream.write(serializer.dumps(record) + "\n")
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class JsonlFileSink(StreamSink):
+    """写入JSONL文件"""
+
+    def __init__(self, path: str, compact: bool = False, append: bool = False, flush_every: int = 50):
+        super().__init__(open(path, 'a' if append else 'w', encoding='utf-8'), compact, flush_every)
+        self.path = path
+
+    def close(self):
+        if not self.stream.closed:
+            self.stream.close()
+
+
+class SocketSink(StreamSink):
+    """按行把JSON发送到TCP地址 (host, port)"""
+
+    def __init__(self, address: Tuple[str, int], compact: bool = True, timeout: Optional[float] = 10.0):
+        self.socket = socket.create_connection(address, timeout=timeout)
+        super().__init__(self.socket.makefile('w', encoding='utf-8'), compact)
+
+    def close(self):
+        try:
+            super().close()
+            self.stream.close()
+        finally:
+            self.socket.close()
+
+
+class EventLogSink(StepSink):
+    """把精简的单步记录追加到 EventLog（按步数分段，可按步数范围读取）"""
+
+    def __init__(self, event_log):
+        self.event_log = event_log
+
+    def write(self, step_result: Dict):
+        record = compact_step_result(step_result)
+        record.setdefault("step", 0)
+        self.event_log.append(record)
+
+    def close(self):
+        self.event_log.flush()
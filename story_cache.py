@@ -0,0 +1,112 @@
+# story_cache.py
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import serializer
+
+# 缓存解析后故事数据的默认容量（按JSON大小估算）
+DEFAULT_CACHE_MB = 256
+
+
+def file_validator(path: str) -> Optional[Tuple[int, int]]:
+    """文件的 (修改时间ns, 大小)；文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def estimate_size(value) -> int:
+    """按序列化后的JSON长度估算占用"""
+    return len(serializer.dumps_bytes(value))
+
+
+class StoryCache:
+    """
+    按大小限制的LRU缓存，保存解析后的故事配置与数据。
+
+    每项可带一个校验值（如 file_validator 的结果）：读取时传入当前的校验值，不一致说明文件被外部修改，该项作废。
+    缓存的对象由所有读取方共享，调用方不得原地修改（需要修改的部分先复制）。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024, max_entries: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()   # key -> [value, validator, size]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def get(self, key: Hashable, validator: Any = None) -> Optional[Any]:
+        """命中时返回缓存的对象；不在缓存中或校验值不一致时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if validator is not None and entry[1] != validator:
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, validator: Any = None, size: Optional[int] = None):
+        """
+        放入（替换）一项；size 为空时沿用同一键原有的大小，没有则按JSON长度估算。
+
+        超过 max_bytes 的单项不缓存。
+        """
+        with self._lock:
+            if size is None:
+                entry = self._entries.get(key)
+                size = entry[2] if entry is not None else None
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = [value, validator, size]
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def revalidate(self, key: Hashable, validator: Any):
+        """自己写完文件后更新校验值，缓存的内容保持不变（缓存总不旧于刚写入的文件）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = validator
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                max_entries=self.max_entries
+            )
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
@@ -0,0 +1,162 @@
+# story_catalog.py
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from checkpoint import write_json_atomic
+from story_fork import load_fork_info
+import serializer
+
+CATALOG_FILE = "catalog.json"
+CATALOG_VERSION = 1
+CONFIG_FILE = "config.json"
+# 可排序的字段：created（文件夹修改时间）、name、agent_count
+SORT_KEYS = {
+    "created": lambda entry: entry["created_timestamp"],
+    "name": lambda entry: entry["name"],
+    "agent_count": lambda entry: entry["agent_count"]
+}
+
+
+class StoryCatalog:
+    """
+    故事目录的索引：每个故事一条 {name, description, agent_count, created, created_timestamp, parent}，
+    保存在 stories/catalog.json，列出故事时不再逐个读取 config.json。
+
+    保存配置与删除故事时调用 update/remove 维护索引；stories 目录的修改时间变化（外部增删了故事文件夹）时
+    重新扫描，只重新读取修改时间变化了的故事文件夹。
+    """
+
+    def __init__(self, stories_dir: str, path: Optional[str] = None):
+        self.stories_dir = stories_dir
+        self.path = path or os.path.join(stories_dir, CATALOG_FILE)
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = {}
+        self._folder_mtimes: Dict[str, int] = {}
+        self._dir_mtime: Optional[int] = None
+        # (sort, descending) -> 排好序的条目，索引变化时清空
+        self._sorted: Dict[Tuple[str, bool], List[Dict]] = {}
+        self._load()
+
+    # --- 维护 ---
+    def update(self, name: str):
+        """重新索引一个故事（保存配置后调用）"""
+        with self._lock:
+            self._index_folder(name)
+            self._save()
+
+    def remove(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+            self._folder_mtimes.pop(name, None)
+            self._save()
+
+    def refresh(self) -> bool:
+        """stories 目录的修改时间变化时重新扫描；返回是否扫描过"""
+        with self._lock:
+            if self._dir_mtime is not None and self._stat_dir() == self._dir_mtime:
+                return False
+            folders = set()
+            if os.path.isdir(self.stories_dir):
+                for folder in os.listdir(self.stories_dir):
+                    story_path = os.path.join(self.stories_dir, folder)
+                    if not os.path.isdir(story_path):
+                        continue
+                    folders.add(folder)
+                    if self._folder_mtimes.get(folder) != _mtime_ns(story_path):
+                        self._index_folder(folder)
+            for name in set(self._entries) - folders:
+                self._entries.pop(name, None)
+            for name in set(self._folder_mtimes) - folders:
+                self._folder_mtimes.pop(name, None)
+            self._save()
+            return True
+
+    # --- 查询 ---
+    def list(self, offset: int = 0, limit: Optional[int] = None, sort: str = "created",
+             descending: bool = True) -> Tuple[List[Dict], int]:
+        """按 sort 排序后返回 [offset, offset + limit) 的故事与故事总数"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"不支持的排序字段: {sort}，可选: {', '.join(SORT_KEYS)}")
+        self.refresh()
+        with self._lock:
+            entries = self._sorted.get((sort, descending))
+            if entries is None:
+                entries = self._sorted[(sort, descending)] = sorted(
+                    self._entries.values(), key=SORT_KEYS[sort], reverse=descending
+                )
+        offset = max(0, offset)
+        page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+        return [dict(entry) for entry in page], len(entries)
+
+    def forks_of(self, parent: str) -> List[str]:
+        """直接从 parent 分叉出的故事名"""
+        self.refresh()
+        with self._lock:
+            return sorted(name for name, entry in self._entries.items() if entry.get("parent") == parent)
+
+    # --- 内部 ---
+    def _index_folder(self, name: str):
+        story_path = os.path.join(self.stories_dir, name)
+        if not os.path.isdir(story_path):
+            self._entries.pop(name, None)
+            self._folder_mtimes.pop(name, None)
+            return
+        self._folder_mtimes[name] = _mtime_ns(story_path)
+        config_file = os.path.join(story_path, CONFIG_FILE)
+        if not os.path.exists(config_file):
+            self._entries.pop(name, None)
+            return
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = serializer.load(f)
+            fork_info = load_fork_info(story_path)
+        except (OSError, ValueError) as e:
+            print(f"读取故事 {name} 的配置失败: {e}")
+            self._entries.pop(name, None)
+            return
+        created_time = os.path.getmtime(story_path)
+        self._entries[name] = {
+            "name": name,
+            "description": config.get("scene_description", ""),
+            "agent_count": config.get("agent_count", 0),
+            "created": datetime.fromtimestamp(created_time).strftime('%Y-%m-%d %H:%M'),
+            "created_timestamp": created_time,
+            "parent": fork_info.get("parent") if fork_info else None
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                catalog = serializer.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取故事索引失败，将重新扫描: {e}")
+            return
+        if catalog.get("version") != CATALOG_VERSION:
+            return
+        self._entries = {entry["name"]: entry for entry in catalog.get("stories", [])}
+        self._folder_mtimes = catalog.get("folder_mtimes", {})
+
+    def _save(self):
+        self._sorted.clear()
+        os.makedirs(self.stories_dir, exist_ok=True)
+        try:
+            # 索引可以随时由故事文件夹重建，不需要 fsync
+            write_json_atomic(self.path, {
+                "version": CATALOG_VERSION,
+                "stories": list(self._entries.values()),
+                "folder_mtimes": self._folder_mtimes
+            }, durable=False)
+        except OSError as e:
+            print(f"保存故事索引失败: {e}")
+        # 写索引文件本身也会改变 stories 目录的修改时间，写完后再记录
+        self._dir_mtime = self._stat_dir()
+
+    def _stat_dir(self) -> Optional[int]:
+        return _mtime_ns(self.stories_dir) if os.path.isdir(self.stories_dir) else None
+
+
+def _mtime_ns(path: str) -> int:
+    return os.stat(path).st_mtime_ns
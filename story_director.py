@@ -1,12 +1,18 @@
 # story_director.py
-import json
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from LLM import LLMManager
+from planners import Planner, current_key_event
+from profiling import stage
+import serializer
 
-class StoryDirector:
-    def __init__(self):
-        self.llm_manager = LLMManager()
+class StoryDirector(Planner):
+    """LLM导演后端"""
+
+    name = "llm"
+
+    def __init__(self, llm_manager: Optional[LLMManager] = None):
+        self.llm_manager = llm_manager or LLMManager()
 
     def generate_step_plan(self, context: Dict) -> Tuple[str, List[Dict]]:
         """
@@ -15,13 +21,16 @@ class StoryDirector:
         返回:
             Tuple[str, List[Dict]]: (剧情摘要, 动作计划列表)
         """
-        prompt = self._build_director_prompt(context)
+        with stage("prompt"):
+            prompt = self._build_director_prompt(context)
 
         try:
-            response = self.llm_manager.llm.chat(prompt)
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                plan_data = json.loads(json_match.group())
+            with stage("llm"):
+                response = self.llm_manager.llm.chat(prompt)
+            with stage("parse"):
+                json_match = re.search(r'\{.*\}', response, re.DOTALL)
+                plan_data = serializer.loads(json_match.group()) if json_match else None
+            if plan_data is not None:
                 narrative = plan_data.get("narrative_summary", "导演正在构思...")
                 action_plan = plan_data.get("action_plan", [])
                 return narrative, action_plan
@@ -38,7 +47,6 @@ class StoryDirector:
         agents = context.get("other_agents", [])
         scene_structure = context.get("scene_structure", {})
         rooms = scene_structure.get("rooms", [])
-        key_events = context.get("story_outline", {}).get("key_events", [])
 
         # 格式化Agent信息
         agent_info_list = []
@@ -64,14 +72,31 @@ class StoryDirector:
             )
             room_info_list.append(room_info)
 
-        # 查找当前步骤的关键事件
-        current_key_event = next((ev for ev in key_events if ev.get("step") == current_step), None)
+        # 当前步骤的关键事件、情节节点与角色发展节点
+        event = current_key_event(context)
         key_event_str = ""
-        if current_key_event:
+        if event:
             key_event_str = (
-                f"当前步骤的关键事件是: '{current_key_event.get('description', '')}'。"
+                f"当前步骤的关键事件是: '{event.get('description', '')}'。"
                 f"请确保你的计划能推动此事件的发生。"
             )
+        for milestone in context.get("plot_milestones", []):
+            key_event_str += f"\n当前步骤的情节节点: '{milestone.get('milestone', '')}'，后果: {milestone.get('consequences', '')}。"
+        for arc in context.get("arc_developments", []):
+            key_event_str += (
+                f"\n{arc.get('character', '')} 在这一步迎来角色发展："
+                f"从 '{arc.get('initial_state', '')}' 向 '{arc.get('final_state', '')}' 转变。"
+            )
+
+        # 上一次计划中被校验丢弃的动作，提示导演避免重复
+        plan_feedback = context.get("plan_feedback", [])
+        feedback_str = ""
+        if plan_feedback:
+            feedback_str = "上一次的计划中以下动作无效，请修正：\n" + "\n".join(f"- {item}" for item in plan_feedback)
+
+        # 分级细节模式下只列出焦点智能体，其余由系统推进
+        background_count = context.get("background_agent_count", 0)
+        background_str = f"\n另有 {background_count} 个背景角色由系统自动控制，不要为他们安排动作。" if background_count else ""
 
         prompt = f"""
 你是一个智能体小镇的“故事导演”。你的任务是根据当前世界的全局状态，为接下来的一小段时间（一个模拟步）编排一个连贯、有趣的剧情。
@@ -84,10 +109,10 @@ class StoryDirector:
 {chr(10).join(room_info_list)}
 
 **智能体状态:**
-{chr(10).join(agent_info_list)}
+{chr(10).join(agent_info_list)}{background_str}
 
 **可用操作类型:**
-- `move`: 移动到指定坐标
+- `move`: 移动到指定坐标（目标在其他房间时会沿房间连接自动寻路，分多步到达）
 - `talk`: 与另一个智能体对话
 - `interact`: 与物品或环境互动
 - `investigate`: 调查当前房间
@@ -95,6 +120,8 @@ class StoryDirector:
 
 {key_event_str}
 
+{feedback_str}
+
 **你的任务:**
 请为这个模拟步生成一个包含多个动作的执行计划。计划应该像一个微型剧本，有逻辑地展开。例如，一个智能体移动到另一个房间，然后与那里的智能体对话。
 
@@ -0,0 +1,35 @@
+# story_fork.py
+import os
+from typing import Dict, Optional
+from checkpoint import write_json_atomic
+import serializer
+
+FORK_FILE = "fork.json"
+# 分叉故事的 data.json 只保存这些会随模拟变化的键，其余（场景、大纲等）从父故事读取
+MUTABLE_DATA_KEYS = ("agents", "agent_states", "current_step", "story_name")
+
+
+def load_fork_info(story_path: str) -> Optional[Dict]:
+    """读取分叉信息 {"parent", "step", "event_seq", "created_at"}，不是分叉时返回 None"""
+    path = os.path.join(story_path, FORK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return serializer.load(f)
+
+
+def save_fork_info(story_path: str, fork_info: Dict):
+    os.makedirs(story_path, exist_ok=True)
+    write_json_atomic(os.path.join(story_path, FORK_FILE), fork_info)
+
+
+def own_data(data: Dict) -> Dict:
+    """分叉故事自身需要保存的数据"""
+    return {key: data[key] for key in MUTABLE_DATA_KEYS if key in data}
+
+
+def merge_with_parent(parent_data: Dict, data: Dict) -> Dict:
+    """父故事的不可变数据 + 分叉自身的数据"""
+    merged = dict(parent_data)
+    merged.update(data)
+    return merged
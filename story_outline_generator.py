@@ -1,12 +1,12 @@
 # story_outline_generator.py
-import json
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional
 from LLM import LLMManager
+import serializer
 
 class StoryOutlineGenerator:
-    def __init__(self):
-        self.llm_manager = LLMManager()
+    def __init__(self, llm_manager: Optional[LLMManager] = None):
+        self.llm_manager = llm_manager or LLMManager()
     
     def generate_comprehensive_outline(self, scene_description: str, agent_count: int, max_steps: int = 100) -> Dict:
         """生成完整的故事大纲，包括100步内的事件"""
@@ -88,7 +88,7 @@ class StoryOutlineGenerator:
             response = self.llm_manager.llm.chat(prompt)
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
-                outline = json.loads(json_match.group())
+                outline = serializer.loads(json_match.group())
                 return self._validate_and_fix_outline(outline, scene_description, agent_count, max_steps)
         except Exception as e:
             print(f"LLM生成大纲失败: {e}")
@@ -0,0 +1,236 @@
+# story_store.py
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+import serializer
+
+STORE_FILE = "stories.db"
+DATA_FILE = "data.json"
+# 单独成表的键；故事数据中的其余键作为整体保存在 stories.extra 中
+AGENT_KEYS = ("agents", "agent_states")
+DOCUMENT_KEYS = ("scene", "outline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    name TEXT PRIMARY KEY,
+    scene TEXT,
+    outline TEXT,
+    extra TEXT NOT NULL DEFAULT '{}',  -- 其余键（含 current_step）的JSON
+    current_step INTEGER NOT NULL DEFAULT 0,
+    agent_count INTEGER NOT NULL DEFAULT 0,
+    has_agent_states INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS agents (
+    story TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    data TEXT,
+    state TEXT,
+    PRIMARY KEY (story, idx)
+);
+-- 早期版本在这两张表中重复保存了事件日志中已有的内容，没有读取方
+DROP TABLE IF EXISTS steps;
+DROP TABLE IF EXISTS events;
+"""
+
+
+def _dumps(value) -> str:
+    return serializer.dumps(value, default=None)
+
+
+class SQLiteStoryStore:
+    """
+    以SQLite（WAL模式）保存故事数据：故事元数据与每个智能体各占一张表（事件由 EventLog 保存）。
+
+    save_story 整体写入一个故事；save_step 只写入内容有变化的智能体，每次写入都在一个事务中完成。
+    load_story 返回与原 data.json 相同结构的字典。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        # 每个故事最近一次写入的智能体与其余数据的JSON，用于判断哪些部分发生了变化
+        self._written: Dict[str, Dict[int, tuple]] = {}
+        self._written_extra: Dict[str, str] = {}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 写入 ---
+    def save_story(self, name: str, data: Dict):
+        """整体写入（替换）一个故事"""
+        with self._lock:
+            rows, extra = self._rows(name, data), _dumps(self._extra(data))
+            with self._transaction():
+                self._replace_story(name, data, rows, extra)
+            self._remember(name, rows, extra)
+
+    def save_step(self, name: str, data: Dict) -> int:
+        """
+        增量写入若干步之后的故事：当前步数与内容有变化的智能体。
+
+        故事还不在库中（或智能体数量变化）时整体写入；无论哪种情况都只用一个事务。返回写入的智能体行数。
+        """
+        agents = data.get("agents") or []
+        states = data.get("agent_states")
+        with self._lock:
+            rows, extra = self._rows(name, data), _dumps(self._extra(data))
+            written = self._written.get(name)
+            full = written is None or len(written) != len(agents)
+            changed = [] if full else [
+                (row[2], row[3], name, row[1]) for row in rows if written.get(row[1]) != (row[2], row[3])
+            ]
+            with self._transaction():
+                if full:
+                    self._replace_story(name, data, rows, extra)
+                else:
+                    self._conn.execute(
+                        "UPDATE stories SET current_step = ?, has_agent_states = ?, updated_at = ? WHERE name = ?",
+                        (data.get("current_step", 0), int(states is not None), time.time(), name)
+                    )
+                    if extra != self._written_extra.get(name):
+                        self._conn.execute("UPDATE stories SET extra = ? WHERE name = ?", (extra, name))
+                    if changed:
+                        self._conn.executemany("UPDATE agents SET data = ?, state = ? WHERE story = ? AND idx = ?", changed)
+            # 事务提交后才更新差异缓存：写入失败时下一次重试仍与库中的内容比较
+            self._remember(name, rows, extra)
+        return len(rows) if full else len(changed)
+
+    def _rows(self, name: str, data: Dict) -> List[tuple]:
+        agents = data.get("agents") or []
+        states = data.get("agent_states")
+        return [(name, idx, _dumps(agent), _dumps(states[idx]) if states and idx < len(states) else None)
+                for idx, agent in enumerate(agents)]
+
+    def _replace_story(self, name: str, data: Dict, rows: List[tuple], extra: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO stories (name, scene, outline, extra, current_step, agent_count, has_agent_states, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, self._document(data, "scene"), self._document(data, "outline"), extra,
+             data.get("current_step", 0), len(rows), int(data.get("agent_states") is not None), time.time())
+        )
+        self._conn.execute("DELETE FROM agents WHERE story = ?", (name,))
+        self._conn.executemany("INSERT INTO agents (story, idx, data, state) VALUES (?, ?, ?, ?)", rows)
+
+    def _remember(self, name: str, rows: List[tuple], extra: str):
+        self._written[name] = {row[1]: (row[2], row[3]) for row in rows}
+        self._written_extra[name] = extra
+
+    def delete_story(self, name: str):
+        with self._lock, self._transaction():
+            for table, column in (("stories", "name"), ("agents", "story")):
+                self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+            self._written.pop(name, None)
+            self._written_extra.pop(name, None)
+
+    # --- 读取 ---
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM stories WHERE name = ?", (name,)).fetchone() is not None
+
+    def list_stories(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM stories ORDER BY name")]
+
+    def load_story(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT scene, outline, extra, current_step, has_agent_states FROM stories WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            agent_rows = self._conn.execute(
+                "SELECT idx, data, state FROM agents WHERE story = ? ORDER BY idx", (name,)
+            ).fetchall()
+        scene, outline, extra, _, has_agent_states = row
+        data = serializer.loads(extra)
+        if scene is not None:
+            data["scene"] = serializer.loads(scene)
+        if outline is not None:
+            data["outline"] = serializer.loads(outline)
+        data["agents"] = [serializer.loads(agent) for _, agent, _ in agent_rows]
+        if has_agent_states:
+            data["agent_states"] = [serializer.loads(state) if state is not None else {} for _, _, state in agent_rows]
+        self._written[name] = {idx: (agent, state) for idx, agent, state in agent_rows}
+        self._written_extra[name] = extra
+        return data
+
+    # --- 导入 ---
+    def import_json_story(self, name: str, story_path: str) -> bool:
+        """导入 story_path/data.json；故事已在库中时跳过"""
+        data_file = os.path.join(story_path, DATA_FILE)
+        if self.exists(name) or not os.path.exists(data_file):
+            return False
+        with open(data_file, 'r', encoding='utf-8') as f:
+            self.save_story(name, serializer.load(f))
+        return True
+
+    def import_json_stories(self, stories_dir: str) -> List[str]:
+        """导入 stories_dir 下所有故事目录中的 data.json，返回导入的故事名"""
+        imported = []
+        if not os.path.isdir(stories_dir):
+            return imported
+        for folder in sorted(os.listdir(stories_dir)):
+            story_path = os.path.join(stories_dir, folder)
+            if not os.path.isdir(story_path):
+                continue
+            try:
+                if self.import_json_story(folder, story_path):
+                    imported.append(folder)
+            except Exception as e:
+                print(f"导入故事 {folder} 失败: {e}")
+        return imported
+
+    # --- 内部 ---
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    @staticmethod
+    def _document(data: Dict, key: str) -> Optional[str]:
+        return _dumps(data[key]) if key in data else None
+
+    @staticmethod
+    def _extra(data: Dict) -> Dict:
+        return {key: value for key, value in data.items() if key not in AGENT_KEYS and key not in DOCUMENT_KEYS}
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT，异常时回滚"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.conn.execute("ROLLBACK")
+            return False
+        try:
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            # COMMIT 失败（如数据库被锁）时事务仍处于打开状态，回滚后再抛出
+            self.conn.execute("ROLLBACK")
+            raise
+        return False
+
+
+if __name__ == "__main__":
+    # 用法: python story_store.py [stories目录]，把已有的 data.json 导入 stories/stories.db
+    stories_dir = sys.argv[1] if len(sys.argv) > 1 else "stories"
+    store = SQLiteStoryStore(os.path.join(stories_dir, STORE_FILE))
+    names = store.import_json_stories(stories_dir)
+    print(f"导入了 {len(names)} 个故事: {', '.join(names)}")
@@ -0,0 +1,242 @@
+# timeline_store.py
+import gzip
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+from checkpoint import write_json_atomic
+from story_cache import file_validator
+import serializer
+
+TIMELINE_DIR = "timeline"
+MANIFEST_FILE = "manifest.json"
+# 每段包含多少个故事步的记录
+DEFAULT_SEGMENT_STEPS = 100
+# 一次请求最多返回的记录数
+DEFAULT_READ_LIMIT = 500
+
+# 提交（替换目录）与打开时的恢复互斥，恢复不会抢在提交的两次替换之间
+_commit_lock = threading.Lock()
+
+
+def _zstd_codec():
+    import zstandard
+    return zstandard.ZstdCompressor(level=6).compress, zstandard.ZstdDecompressor().decompress
+
+
+def _gzip_codec():
+    return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+
+
+# 压缩格式 -> (段文件扩展名, 创建 (compress, decompress) 的函数)；按顺序选择第一个可用的
+CODECS = {"zstd": ("zst", _zstd_codec), "gzip": ("gz", _gzip_codec)}
+
+
+def _load_codec(name: str):
+    if name not in CODECS:
+        raise ValueError(f"未知的压缩格式: {name}，可选: {', '.join(CODECS)}")
+    return CODECS[name][1]()
+
+
+def default_codec() -> str:
+    for name in CODECS:
+        try:
+            _load_codec(name)
+            return name
+        except ImportError:
+            continue
+    return "gzip"
+
+
+class TimelineStore:
+    """
+    一次性模拟（/api/simulate）时间线的分段压缩存储：每 segment_steps 个故事步一段，
+    段文件为压缩的JSON数组，manifest.json 记录每段的步数范围、记录数与大小。
+
+    read(from_step, to_step) 只解压与范围重叠的段；传入 cache（StoryCache）时解压后的段按文件修改时间缓存。
+    打开时从提交中途崩溃留下的 .old/.tmp 目录恢复。
+    """
+
+    def __init__(self, path: str, cache=None):
+        self.path = path
+        self.cache = cache
+        self._recover()
+
+    def _recover(self):
+        """
+        提交依次把旧时间线改名为 .old、把 .tmp 改名为正式目录。崩溃在两次改名之间时正式目录不存在：
+        .tmp 已写完 manifest 则用它（提交已完成写入），否则退回 .old；正式目录存在时只清理 .old。
+        """
+        old_path, tmp_path = self.path + ".old", self.path + ".tmp"
+        if not os.path.exists(old_path):
+            return
+        with _commit_lock:
+            if not os.path.exists(old_path):
+                return
+            try:
+                if not os.path.exists(self.path):
+                    if os.path.exists(os.path.join(tmp_path, MANIFEST_FILE)):
+                        os.replace(tmp_path, self.path)
+                    else:
+                        os.replace(old_path, self.path)
+                shutil.rmtree(old_path, ignore_errors=True)
+            except OSError as e:
+                print(f"恢复时间线失败: {e}")
+
+    @classmethod
+    def for_story(cls, story_path: str, cache=None) -> "TimelineStore":
+        return cls(os.path.join(story_path, TIMELINE_DIR), cache)
+
+    # --- 写入 ---
+    def writer(self, segment_steps: int = DEFAULT_SEGMENT_STEPS, codec: Optional[str] = None) -> "TimelineWriter":
+        """逐条写入新的时间线；commit 时整体替换旧的时间线"""
+        return TimelineWriter(self.path, segment_steps, codec or default_codec())
+
+    def write(self, records: Iterable[Dict], segment_steps: int = DEFAULT_SEGMENT_STEPS,
+              codec: Optional[str] = None) -> Dict:
+        writer = self.writer(segment_steps, codec)
+        try:
+            for record in records:
+                writer.append(record)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # --- 读取 ---
+    def manifest(self) -> Optional[Dict]:
+        path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return serializer.load(f)
+
+    def summary(self) -> Optional[Dict]:
+        """步数范围、记录数、段数与压缩前后的大小（不含每段的明细）"""
+        manifest = self.manifest()
+        return _summary(manifest) if manifest is not None else None
+
+    def read(self, from_step: int = 0, to_step: Optional[int] = None,
+             limit: Optional[int] = DEFAULT_READ_LIMIT) -> Dict:
+        """
+        返回 {"records", "next_from_step"}：步数在 [from_step, to_step] 内的记录，按步数顺序。
+
+        超过 limit 条时在步的边界截断（同一步的记录总是一起返回），next_from_step 为下一次请求的起点，读完时为 None。
+        """
+        manifest = self.manifest()
+        records: List[Dict] = []
+        if manifest is None:
+            return {"records": records, "next_from_step": None}
+        for segment in manifest["segments"]:
+            if segment["last_step"] < from_step or (to_step is not None and segment["first_step"] > to_step):
+                continue
+            for record in self._load_segment(segment, manifest["codec"]):
+                step = record.get("step", 0)
+                if step < from_step or (to_step is not None and step > to_step):
+                    continue
+                if limit is not None and len(records) >= limit and step != records[-1].get("step", 0):
+                    return {"records": records, "next_from_step": step}
+                records.append(record)
+        return {"records": records, "next_from_step": None}
+
+    def _load_segment(self, segment: Dict, codec: str) -> List[Dict]:
+        path = os.path.join(self.path, segment["file"])
+        validator = file_validator(path) if self.cache is not None else None
+        if validator is not None:
+            records = self.cache.get(("timeline", path), validator)
+            if records is not None:
+                return records
+        with open(path, 'rb') as f:
+            _, decompress = _load_codec(codec)
+            records = serializer.loads(decompress(f.read()))
+        if validator is not None:
+            self.cache.put(("timeline", path), records, validator, segment.get("raw_bytes"))
+        return records
+
+
+class TimelineWriter:
+    """
+    按步数顺序追加记录，每满 segment_steps 个步压缩写出一段；写入临时目录，commit 时替换旧时间线。
+
+    没有步数或步数比上一条小的记录（如出错的单步结果）归入上一条记录的步，段的步数范围保持递增。
+    """
+
+    def __init__(self, path: str, segment_steps: int, codec: str):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.segment_steps = max(1, segment_steps)
+        self.codec = codec
+        self._compress, _ = _load_codec(codec)
+        self._segments: List[Dict] = []
+        self._buffer: List[Dict] = []
+        self._buffer_index: Optional[int] = None
+        self._last_step = 0
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+
+    def append(self, record: Dict):
+        step = record.get("step")
+        if not isinstance(step, int) or step < self._last_step:
+            record = dict(record, step=self._last_step)
+        self._last_step = record["step"]
+        index = self._last_step // self.segment_steps
+        if self._buffer and index != self._buffer_index:
+            self._flush_segment()
+        self._buffer_index = index
+        self._buffer.append(record)
+
+    def commit(self) -> Dict:
+        if self._buffer:
+            self._flush_segment()
+        manifest = {
+            "codec": self.codec,
+            "segment_steps": self.segment_steps,
+            "segments": self._segments
+        }
+        write_json_atomic(os.path.join(self.tmp_path, MANIFEST_FILE), manifest)
+        old_path = self.path + ".old"
+        with _commit_lock:
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.replace(self.path, old_path)
+            # 在这里崩溃时只剩 .old 与已写完的 .tmp，下次打开时由 TimelineStore 恢复
+            os.replace(self.tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        return _summary(manifest)
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def _flush_segment(self):
+        raw = serializer.dumps_bytes(self._buffer, default=None)
+        compressed = self._compress(raw)
+        name = f"segment_{len(self._segments):06d}.json.{CODECS[self.codec][0]}"
+        with open(os.path.join(self.tmp_path, name), 'wb') as f:
+            f.write(compressed)
+        steps = [record.get("step", 0) for record in self._buffer]
+        self._segments.append({
+            "file": name,
+            "first_step": min(steps),
+            "last_step": max(steps),
+            "records": len(self._buffer),
+            "bytes": len(compressed),
+            "raw_bytes": len(raw)
+        })
+        self._buffer = []
+
+
+def _summary(manifest: Dict) -> Dict:
+    segments = manifest.get("segments", [])
+    return {
+        "codec": manifest.get("codec"),
+        "segment_steps": manifest.get("segment_steps"),
+        "segments": len(segments),
+        "records": sum(segment["records"] for segment in segments),
+        "first_step": segments[0]["first_step"] if segments else None,
+        "last_step": max(segment["last_step"] for segment in segments) if segments else None,
+        "bytes": sum(segment["bytes"] for segment in segments),
+        "raw_bytes": sum(segment["raw_bytes"] for segment in segments)
+    }